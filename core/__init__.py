@@ -1,28 +1,72 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+from typing import List, Optional
 
-from core.settings import LOG_DIRECTORY, DATESTAMP
+from core.settings import LOG_DIRECTORY, LOG_BACKUP_COUNT, LOG_MAX_BYTES, DATESTAMP, ensure_directories
 
 log_format = "%(asctime)s - %(name)s - %(funcName)s - %(levelname)s - %(message)s"
 formatter = logging.Formatter(log_format)
-_logger = logging.getLogger()
-_logger.setLevel(logging.DEBUG)
-
-# console logging
-console_logging = True
-if console_logging:
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(formatter)
-    _logger.addHandler(console_handler)
-
-# file logging
-file_logging = True
-debug_log_file_path = os.path.join(LOG_DIRECTORY, "debug_{0}.log".format(DATESTAMP))
-if file_logging:
-    debug_log_handler = logging.FileHandler(debug_log_file_path)
-    debug_log_handler.setLevel(logging.DEBUG)
-    debug_log_handler.setFormatter(formatter)
-    _logger.addHandler(debug_log_handler)
-
-_logger.info(f"Reports from this run under DATESTAMP: {DATESTAMP}")
+
+_configured = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(console_logging: bool = True, file_logging: bool = True):
+    """Sets up console and debug file logging on the root logger. Importing core has no side effects, so entry points
+    call this once on startup. Later calls do nothing.
+
+    Loggers only put records on a queue; the console and file handlers run on a listener thread, so a render loop
+    never waits for a terminal or a disk. The debug log rotates by size, see LOG_MAX_BYTES.
+
+    Args:
+        console_logging (bool): Log INFO and above to the console. Defaults to True.
+        file_logging (bool): Log DEBUG and above to debug.log in LOG_DIRECTORY. Defaults to True.
+    """
+
+    global _configured, _listener
+    if _configured:
+        return
+    _configured = True
+
+    handlers: List[logging.Handler] = []
+
+    # console logging
+    if console_logging:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    # file logging
+    if file_logging:
+        ensure_directories()
+        debug_log_file_path = os.path.join(LOG_DIRECTORY, "debug.log")
+        debug_log_handler = logging.handlers.RotatingFileHandler(
+            debug_log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True
+        )
+        debug_log_handler.setLevel(logging.DEBUG)
+        debug_log_handler.setFormatter(formatter)
+        handlers.append(debug_log_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    _logger = logging.getLogger()
+    _logger.setLevel(logging.DEBUG)
+    _logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _logger.info(f"Reports from this run under DATESTAMP: {DATESTAMP}")
+
+
+def stop_logging():
+    """Writes out every queued record and stops the listener thread. Registered to run at exit."""
+
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,5 @@
+"""The audio modules capture audio from any source into a shared ring buffer that analysis stages read from.
+
+Sources (see core.audio.sources) push fixed-size blocks of float32 PCM into an AudioRingBuffer (see
+core.audio.ring_buffer), and consumers read views of it without copying.
+"""
@@ -0,0 +1,238 @@
+"""Streaming audio features for driving lights from music.
+
+FeatureExtractor runs a hop-based STFT over an AudioReader: every hop, only the newest hop of samples is new, and the
+analysis window is a zero-copy view of the ring buffer (see core.audio.ring_buffer) ending at it. From each spectrum
+it derives a compact FeatureFrame: band energies, spectral flux, onset strength, RMS, and a running tempo and beat
+phase tracked from the onset envelope.
+
+Every intermediate array is preallocated and written through out= arguments, so steady-state operation does not
+allocate arrays. The FFT itself writes into a preallocated output where NumPy supports it (NumPy 2.0 and later), older
+versions allocate the spectrum on every hop.
+"""
+import inspect
+import math
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+import numpy as np
+
+from core.audio.ring_buffer import AudioReader
+
+_RFFT_SUPPORTS_OUT = 'out' in inspect.signature(np.fft.rfft).parameters
+
+
+@dataclass(slots=True)
+class FeatureFrame:
+    """Features of a single hop. The extractor updates a single instance in place, see FeatureExtractor.process."""
+
+    position: int = 0           # Absolute frame number of the end of the analysis window
+    rms: float = 0.0            # Root mean square of the newest hop of samples
+    flux: float = 0.0           # Half-wave rectified change of the log magnitude spectrum
+    onset: float = 0.0          # Flux above its recent average, 0.0 when nothing new started
+    tempo: float = 0.0          # Beats per minute, 0.0 until enough onsets were seen
+    beat_phase: float = 0.0     # [0.0, 1.0), 0.0 being on the beat
+    beat: bool = False          # True on the hop the beat phase wrapped around
+    bands: np.ndarray = field(default_factory=lambda: np.zeros(0))  # Mean power per band, low to high
+
+
+class FeatureExtractor:
+    """Incremental STFT and feature extraction over an AudioReader."""
+
+    def __init__(
+        self,
+        reader: AudioReader,
+        sample_rate: int,
+        fft_size: int = 2048,
+        hop_size: int = 512,
+        band_count: int = 8,
+        min_frequency: float = 40.0,
+        max_frequency: Optional[float] = None,
+        onset_window: float = 0.5,
+        tempo_window: float = 6.0,
+        min_tempo: float = 60.0,
+        max_tempo: float = 180.0,
+        tempo_interval: float = 0.5,
+        beat_gain: float = 0.1
+    ):
+        """Constructor.
+
+        Args:
+            reader (AudioReader): Reader of the ring buffer to analyze
+            sample_rate (int): Sample rate of the audio
+            fft_size (int): Window length of the STFT, at most the ring buffer capacity. Defaults to 2048.
+            hop_size (int): Frames between consecutive windows, i.e. one FeatureFrame per hop. Defaults to 512.
+            band_count (int): Number of logarithmically spaced bands. Defaults to 8.
+            min_frequency (float): Lower edge of the lowest band in Hz. Defaults to 40.
+            max_frequency (Optional[float]): Upper edge of the highest band in Hz. Defaults to the Nyquist frequency.
+            onset_window (float): Seconds of flux averaged into the onset threshold. Defaults to 0.5.
+            tempo_window (float): Seconds of onset envelope the tempo is estimated from. Defaults to 6.
+            min_tempo (float): Slowest tempo considered in BPM. Defaults to 60.
+            max_tempo (float): Fastest tempo considered in BPM. Defaults to 180.
+            tempo_interval (float): Seconds between tempo estimates. Defaults to 0.5.
+            beat_gain (float): How strongly an onset pulls the beat phase towards it, in [0.0, 1.0]. Defaults to 0.1.
+        """
+
+        if hop_size > fft_size:
+            raise ValueError(f'hop_size ({hop_size}) must not be larger than fft_size ({fft_size})')
+
+        self.reader = reader
+        self.sample_rate = sample_rate
+        self.fft_size = fft_size
+        self.hop_size = hop_size
+        self.hop_rate = sample_rate / hop_size
+        self.beat_gain = beat_gain
+
+        bins = fft_size // 2 + 1
+        self._window = np.hanning(fft_size)
+        self._mono = np.zeros(fft_size)
+        self._windowed = np.zeros(fft_size)
+        self._spectrum = np.zeros(bins, dtype=np.complex128)
+        self._magnitude = np.zeros(bins)
+        self._log_magnitude = np.zeros(bins)
+        self._previous_log_magnitude = np.zeros(bins)
+        self._power = np.zeros(bins)
+
+        # Band energies are one matrix product, every row averages the power of the bins in its band
+        max_frequency = max_frequency or sample_rate / 2.0
+        self.band_edges = np.geomspace(min_frequency, max_frequency, band_count + 1)
+        frequencies = np.fft.rfftfreq(fft_size, 1.0 / sample_rate)
+        self._band_matrix = np.zeros((band_count, bins))
+        for band in range(band_count):
+            in_band = (frequencies >= self.band_edges[band]) & (frequencies < self.band_edges[band + 1])
+            if not in_band.any():  # Narrower than a bin, use the closest one
+                in_band[np.argmin(np.abs(frequencies - self.band_edges[band]))] = True
+            self._band_matrix[band, in_band] = 1.0 / in_band.sum()
+
+        # Recent flux, summed incrementally for the onset threshold
+        self._flux_history = np.zeros(max(1, int(onset_window * self.hop_rate)))
+        self._flux_index = 0
+        self._flux_sum = 0.0
+
+        # Onset envelope, mirrored like AudioRingBuffer so the last tempo_window seconds are one contiguous view
+        self._envelope_length = max(2, int(tempo_window * self.hop_rate))
+        self._envelope = np.zeros(2 * self._envelope_length)
+        self._envelope_index = 0
+        self._centered = np.zeros(self._envelope_length)
+
+        min_lag = max(1, int(round(60.0 / max_tempo * self.hop_rate)))
+        max_lag = min(self._envelope_length - 1, int(round(60.0 / min_tempo * self.hop_rate)))
+        self._lags = np.arange(min_lag, max_lag + 1)
+        self._autocorrelation = np.zeros(len(self._lags))
+        # Log-gaussian prior around 120 BPM, which keeps the estimate from jumping between octaves of the tempo
+        lag_tempos = 60.0 * self.hop_rate / self._lags
+        self._tempo_prior = np.exp(-0.5 * np.log2(lag_tempos / 120.0) ** 2)
+        self._tempo_interval_hops = max(1, int(tempo_interval * self.hop_rate))
+        self._hops_until_tempo = self._tempo_interval_hops
+        self._beat_period = 0.0  # In hops
+
+        self.frame = FeatureFrame(bands=np.zeros(band_count))
+        self.hops = 0
+
+    def process(self) -> Optional[FeatureFrame]:
+        """Analyzes the next hop if the reader has one available.
+
+        Returns:
+            Optional[FeatureFrame]: The features of the hop, or None if fewer than hop_size frames are available. The
+                same instance is updated by every call, copy it to keep the values of a hop.
+        """
+
+        window = self.reader.read_window(self.fft_size, self.hop_size)
+        if window is None:
+            return None
+
+        frame = self.frame
+        frame.position = self.reader.position
+
+        # Mix down to mono
+        if window.shape[1] == 1:
+            np.copyto(self._mono, window[:, 0])
+        else:
+            np.mean(window, axis=1, out=self._mono)
+
+        newest = self._mono[-self.hop_size:]
+        frame.rms = math.sqrt(float(np.dot(newest, newest)) / self.hop_size)
+
+        np.multiply(self._mono, self._window, out=self._windowed)
+        if _RFFT_SUPPORTS_OUT:
+            np.fft.rfft(self._windowed, out=self._spectrum)
+        else:
+            self._spectrum[:] = np.fft.rfft(self._windowed)
+        np.abs(self._spectrum, out=self._magnitude)
+
+        np.square(self._magnitude, out=self._power)
+        np.dot(self._band_matrix, self._power, out=frame.bands)
+
+        # Spectral flux on the log magnitude, only increases count
+        np.log1p(self._magnitude, out=self._log_magnitude)
+        np.subtract(self._log_magnitude, self._previous_log_magnitude, out=self._previous_log_magnitude)
+        np.maximum(self._previous_log_magnitude, 0.0, out=self._previous_log_magnitude)
+        frame.flux = float(self._previous_log_magnitude.sum())
+        self._previous_log_magnitude, self._log_magnitude = self._log_magnitude, self._previous_log_magnitude
+
+        # Onset strength is the flux above its recent average
+        self._flux_sum += frame.flux - self._flux_history[self._flux_index]
+        self._flux_history[self._flux_index] = frame.flux
+        self._flux_index = (self._flux_index + 1) % len(self._flux_history)
+        frame.onset = max(0.0, frame.flux - self._flux_sum / len(self._flux_history))
+
+        self._envelope[self._envelope_index] = frame.onset
+        self._envelope[self._envelope_index + self._envelope_length] = frame.onset
+        self._envelope_index = (self._envelope_index + 1) % self._envelope_length
+
+        self.hops += 1
+        self._hops_until_tempo -= 1
+        if self._hops_until_tempo <= 0:
+            self._hops_until_tempo = self._tempo_interval_hops
+            self._estimate_tempo()
+
+        self._track_beat(frame)
+        return frame
+
+    def frames(self) -> Iterator[FeatureFrame]:
+        """Yields a FeatureFrame for every hop currently available, see process."""
+
+        while True:
+            frame = self.process()
+            if frame is None:
+                return
+            yield frame
+
+    def _estimate_tempo(self):
+        """Picks the beat period as the lag with the strongest autocorrelation of the onset envelope."""
+
+        if self.hops < self._envelope_length // 2 or len(self._lags) == 0:
+            return
+
+        envelope = self._envelope[self._envelope_index:self._envelope_index + self._envelope_length]
+        np.subtract(envelope, envelope.mean(), out=self._centered)
+        centered = self._centered
+        for idx, lag in enumerate(self._lags):
+            self._autocorrelation[idx] = np.dot(centered[:-lag], centered[lag:])
+
+        np.multiply(self._autocorrelation, self._tempo_prior, out=self._autocorrelation)
+        best = int(np.argmax(self._autocorrelation))
+        if self._autocorrelation[best] <= 0.0:
+            return
+
+        self._beat_period = float(self._lags[best])
+        self.frame.tempo = 60.0 * self.hop_rate / self._beat_period
+
+    def _track_beat(self, frame: FeatureFrame):
+        """Advances the beat phase by one hop, and pulls it towards strong onsets."""
+
+        frame.beat = False
+        if self._beat_period <= 0.0:
+            return
+
+        phase = frame.beat_phase + 1.0 / self._beat_period
+        if phase >= 1.0:
+            phase -= 1.0
+            frame.beat = True
+
+        threshold = 2.0 * self._flux_sum / len(self._flux_history)
+        if frame.onset > 0.0 and frame.flux > threshold:
+            error = phase if phase < 0.5 else phase - 1.0
+            phase -= self.beat_gain * error
+            phase %= 1.0
+
+        frame.beat_phase = phase
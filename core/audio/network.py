@@ -0,0 +1,524 @@
+"""Audio from a microphone connected through the network, received as sequenced PCM packets over UDP.
+
+Packets can arrive late, out of order, twice or not at all. NetworkAudioSource puts them into an adaptive JitterBuffer
+and plays them out into its ring buffer at the sample rate, like a local sound card would, so consumers cannot tell it
+apart from a MicrophoneAudioSource.
+
+The jitter buffer holds only as many packets as the measured network jitter requires. Jitter is estimated like RTP
+interarrival jitter (RFC 3550, section 6.4.1), which only compares differences of transit times and therefore works
+without synchronized clocks on sender and receiver. Lost packets are concealed by repeating the last packet with a
+fade out.
+
+Packet layout, network byte order:
+    4s  magic b'ALSP'
+    B   version, 1
+    B   channels
+    H   frames per packet
+    I   sequence number, wraps at 2**32
+    I   sample rate
+    Q   sender timestamp in microseconds, any monotonic clock
+    ... frames * channels interleaved little endian int16 samples
+"""
+import heapq
+import logging
+import math
+import random
+import socket
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.audio.sources import AudioSource
+from core.metrics import LatencyHistogram
+from core.render_loop import RENDER_BUCKETS_MS
+from core.throttled_logging import RateLimitedLogger
+
+_logger = logging.getLogger(__name__)
+_rate_limited_logger = RateLimitedLogger(_logger)
+
+DEFAULT_PORT = 5005
+
+_MAGIC = b'ALSP'
+_VERSION = 1
+_HEADER = struct.Struct('!4sBBHIIQ')
+_SAMPLE = np.dtype('<i2')
+
+
+def packet_size(frames: int, channels: int) -> int:
+    return _HEADER.size + frames * channels * _SAMPLE.itemsize
+
+
+class PcmPacketEncoder:
+    """Encodes blocks of float32 samples into packets, reusing a single preallocated buffer."""
+
+    def __init__(self, sample_rate: int, channels: int, frames: int):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = frames
+        self.buffer = bytearray(packet_size(frames, channels))
+        self._samples = np.frombuffer(self.buffer, dtype=_SAMPLE, offset=_HEADER.size).reshape(frames, channels)
+        self._scaled = np.zeros((frames, channels), dtype=np.float32)
+
+    def encode(self, sequence: int, block: np.ndarray, timestamp_us: Optional[int] = None) -> bytearray:
+        """Writes a block into the packet buffer.
+
+        Args:
+            sequence (int): Sequence number of the packet
+            block (np.ndarray): float32 samples in [-1.0, 1.0] of shape (frames, channels)
+            timestamp_us (Optional[int]): Sender timestamp, defaults to the monotonic clock
+
+        Returns:
+            bytearray: the packet buffer, which is reused by the next call to encode
+        """
+
+        if timestamp_us is None:
+            timestamp_us = time.monotonic_ns() // 1000
+
+        _HEADER.pack_into(
+            self.buffer, 0, _MAGIC, _VERSION, self.channels, self.frames, sequence & 0xFFFFFFFF, self.sample_rate,
+            timestamp_us
+        )
+        np.multiply(block, 32767.0, out=self._scaled)
+        np.clip(self._scaled, -32768.0, 32767.0, out=self._scaled)
+        self._samples[:] = self._scaled
+        return self.buffer
+
+
+def decode_header(data: bytes) -> Tuple[int, int, int, int, int]:
+    """Returns (channels, frames, sequence, sample rate, timestamp in microseconds) of a packet.
+
+    Raises:
+        ValueError: If data is not a packet of this protocol
+    """
+
+    if len(data) < _HEADER.size:
+        raise ValueError('Packet is shorter than its header')
+
+    magic, version, channels, frames, sequence, sample_rate, timestamp_us = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError('Not a PCM packet')
+    if len(data) < packet_size(frames, channels):
+        raise ValueError('Packet is shorter than its samples')
+
+    return channels, frames, sequence, sample_rate, timestamp_us
+
+
+class JitterBuffer:
+    """Reorders packets by sequence number and decides what to play out on every tick.
+
+    The target depth, in packets, follows the measured jitter: target = ceil(jitter_factor * jitter / packet duration),
+    within [min_depth, max_depth]. The buffer grows back to the target after an underrun, and drops a packet whenever
+    it holds more than the target plus one, so latency shrinks again once the network calms down.
+
+    Playout resumes from the oldest buffered packet after an underrun, and skips missing packets rather than concealing
+    them when the buffer is over its target or the stream jumped far ahead, e.g. after a Wi-Fi outage. Otherwise the
+    buffer would conceal one tick per packet missed during the outage before reaching the packets that arrived.
+
+    Samples live in a preallocated pool of packet slots, received packets are converted straight into a free slot.
+    """
+
+    # Playout decisions returned by pop
+    PLAY = 'play'
+    CONCEAL = 'conceal'
+    WAIT = 'wait'
+
+    def __init__(
+        self,
+        frames: int,
+        channels: int,
+        sample_rate: int,
+        min_depth: int = 2,
+        max_depth: int = 32,
+        jitter_factor: float = 4.0
+    ):
+        """Constructor.
+
+        Args:
+            frames (int): Frames per packet
+            channels (int): Channels per frame
+            sample_rate (int): Sample rate of the stream
+            min_depth (int): Fewest packets buffered before playing. Defaults to 2.
+            max_depth (int): Most packets buffered, e.g. after a burst. Defaults to 32.
+            jitter_factor (float): Multiple of the measured jitter covered by the buffer. Defaults to 4.
+        """
+
+        self.frames = frames
+        self.channels = channels
+        self.packet_duration = frames / sample_rate
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.jitter_factor = jitter_factor
+
+        self._slots = np.zeros((max_depth + 1, frames, channels), dtype=np.float32)
+        self._free: List[int] = list(range(max_depth + 1))
+        self._by_sequence: Dict[int, Tuple[int, float]] = {}  # sequence -> (slot, arrival time)
+        self._restart_distance = 4 * max_depth
+
+        self.next_sequence: Optional[int] = None
+        self.playing = False
+        self.jitter = 0.0  # Seconds
+        self._last_transit: Optional[float] = None
+
+        self.packets_received = 0
+        self.packets_late = 0
+        self.packets_duplicate = 0
+        self.packets_overflow = 0
+        self.packets_dropped = 0
+        self.packets_concealed = 0
+        self.packets_skipped = 0
+        self.underruns = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._by_sequence)
+
+    def reset(self):
+        """Forgets every buffered packet and waits for the stream to fill the buffer again."""
+
+        self._free = list(range(len(self._slots)))
+        self._by_sequence.clear()
+        self.next_sequence = None
+        self.playing = False
+        self._last_transit = None
+
+    @property
+    def target_depth(self) -> int:
+        depth = math.ceil(self.jitter_factor * self.jitter / self.packet_duration) if self.jitter > 0.0 else 0
+        return min(self.max_depth, max(self.min_depth, depth))
+
+    def _update_jitter(self, timestamp_us: int, arrival: float):
+        transit = arrival - timestamp_us / 1e6
+        if self._last_transit is not None:
+            self.jitter += (abs(transit - self._last_transit) - self.jitter) / 16.0
+        self._last_transit = transit
+
+    def push(self, sequence: int, timestamp_us: int, samples: np.ndarray, arrival: float):
+        """Adds a received packet.
+
+        Args:
+            sequence (int): Sequence number of the packet
+            timestamp_us (int): Sender timestamp of the packet
+            samples (np.ndarray): int16 samples of shape (frames, channels), converted into a slot
+            arrival (float): Monotonic time the packet was received at
+        """
+
+        self.packets_received += 1
+        self._update_jitter(timestamp_us, arrival)
+
+        if self.next_sequence is not None and _sequence_before(sequence, self.next_sequence):
+            if (self.next_sequence - sequence) & 0xFFFFFFFF <= self._restart_distance:
+                self.packets_late += 1
+                return
+
+            # Far behind everything played so far, the sender restarted its stream
+            _logger.info(f'Sequence jumped back from {self.next_sequence} to {sequence}, restarting the stream')
+            self.reset()
+
+        if sequence in self._by_sequence:
+            self.packets_duplicate += 1
+            return
+        if not self._free:
+            self.packets_overflow += 1
+            return
+
+        slot = self._free.pop()
+        np.multiply(samples, 1.0 / 32768.0, out=self._slots[slot], casting='unsafe')
+        self._by_sequence[sequence] = (slot, arrival)
+        if self.next_sequence is None or (not self.playing and _sequence_before(sequence, self.next_sequence)):
+            self.next_sequence = sequence
+
+    def _oldest_sequence(self, after: int) -> int:
+        """Returns the buffered sequence number closest after a sequence number, taking wrap around into account."""
+
+        return min(self._by_sequence, key=lambda sequence: (sequence - after) & 0xFFFFFFFF)
+
+    def _release(self, sequence: int):
+        slot, _ = self._by_sequence.pop(sequence)
+        self._free.append(slot)
+
+    def pop(self) -> Tuple[str, Optional[np.ndarray], Optional[float]]:
+        """Decides what to play out on this tick.
+
+        Returns:
+            Tuple[str, Optional[np.ndarray], Optional[float]]: (PLAY, samples, arrival time) of the next packet,
+                (CONCEAL, None, None) if the next packet is missing but later ones arrived, or (WAIT, None, None) if
+                the buffer is (re)filling. Samples are a view of a slot, valid until the next push.
+        """
+
+        sequence = self.next_sequence
+        if sequence is None:
+            return self.WAIT, None, None  # Nothing received yet
+
+        if not self.playing:
+            if self.depth < self.target_depth:
+                return self.WAIT, None, None
+            self.playing = True
+            # Resume with what arrived, not with the packets missed during the underrun
+            sequence = self._oldest_sequence(sequence)
+
+        if not self._by_sequence:
+            self.next_sequence = sequence
+            self.underruns += 1
+            self.playing = False
+            return self.WAIT, None, None
+
+        over_target = self.depth > self.target_depth + 1
+        if sequence not in self._by_sequence:
+            oldest = self._oldest_sequence(sequence)
+            if over_target or (oldest - sequence) & 0xFFFFFFFF > self._restart_distance:
+                # Concealing would add the gap to the latency, skip to the oldest packet that arrived instead
+                self.packets_skipped += (oldest - sequence) & 0xFFFFFFFF
+                sequence = oldest
+        elif over_target:
+            # More buffered than the jitter requires, drop the oldest packet to bring latency back down
+            self._release(sequence)
+            self.packets_dropped += 1
+            sequence = (sequence + 1) & 0xFFFFFFFF
+
+        self.next_sequence = (sequence + 1) & 0xFFFFFFFF
+        entry = self._by_sequence.get(sequence)
+        if entry is None:
+            self.packets_concealed += 1
+            return self.CONCEAL, None, None
+
+        slot, arrival = entry
+        self._release(sequence)
+        return self.PLAY, self._slots[slot], arrival
+
+    def stats(self) -> dict:
+        """Returns a JSON-style dict of the buffer's state and counters."""
+
+        lost = self.packets_concealed + self.packets_skipped
+        expected = self.packets_received - self.packets_duplicate + lost
+        return {
+            'depth': self.depth,
+            'target_depth': self.target_depth,
+            'jitter_ms': round(self.jitter * 1000.0, 3),
+            'packets_received': self.packets_received,
+            'packets_late': self.packets_late,
+            'packets_duplicate': self.packets_duplicate,
+            'packets_overflow': self.packets_overflow,
+            'packets_dropped': self.packets_dropped,
+            'packets_concealed': self.packets_concealed,
+            'packets_skipped': self.packets_skipped,
+            'loss_ratio': lost / expected if expected else 0.0,
+            'underruns': self.underruns,
+        }
+
+
+def _sequence_before(a: int, b: int) -> bool:
+    """True if sequence number a comes before b, taking wrap around into account."""
+
+    return a != b and ((b - a) & 0xFFFFFFFF) < 0x80000000
+
+
+class NetworkAudioSource(AudioSource):
+    """Receives PCM packets over UDP and plays them out into the ring buffer through a JitterBuffer."""
+
+    def __init__(
+        self,
+        port: int = DEFAULT_PORT,
+        host: str = '0.0.0.0',
+        sample_rate: int = 44100,
+        channels: int = 1,
+        block_size: int = 256,
+        buffer_seconds: float = 2.0,
+        min_depth: int = 2,
+        max_depth: int = 32,
+        jitter_factor: float = 4.0
+    ):
+        """Constructor.
+
+        Args:
+            port (int): UDP port to listen on. Defaults to DEFAULT_PORT.
+            host (str): Address to listen on. Defaults to every interface.
+            sample_rate (int): Sample rate of the stream, packets with another rate are rejected. Defaults to 44100.
+            channels (int): Channels of the stream, packets with other channels are rejected. Defaults to 1.
+            block_size (int): Frames per packet, packets with other sizes are rejected. Defaults to 256.
+            buffer_seconds (float): Length of the ring buffer. Defaults to 2 seconds.
+            min_depth (int): See JitterBuffer. Defaults to 2.
+            max_depth (int): See JitterBuffer. Defaults to 32.
+            jitter_factor (float): See JitterBuffer. Defaults to 4.
+        """
+
+        super().__init__(sample_rate, channels, block_size, buffer_seconds=buffer_seconds)
+
+        self.jitter_buffer = JitterBuffer(
+            block_size, channels, sample_rate, min_depth=min_depth, max_depth=max_depth, jitter_factor=jitter_factor
+        )
+        self._lock = threading.Lock()
+        self._concealment = np.zeros((block_size, channels), dtype=np.float32)
+        self._concealment_gain = 0.5  # Applied per consecutive concealed packet
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.2)
+        self._packet = bytearray(packet_size(block_size, channels))
+
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        self.packets_invalid = 0
+        self.latency = LatencyHistogram(RENDER_BUCKETS_MS)  # Arrival to playout
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._socket.getsockname()
+
+    def start(self):
+        self._stop_event.clear()
+        self._threads = [
+            threading.Thread(target=self._receive, name='NetworkAudioSource.receive', daemon=True),
+            threading.Thread(target=self._play_out, name='NetworkAudioSource.play_out', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._socket.close()
+
+    def _receive(self):
+        samples = np.frombuffer(self._packet, dtype=_SAMPLE, offset=_HEADER.size).reshape(
+            self.block_size, self.channels
+        )
+        while not self._stop_event.is_set():
+            try:
+                size = self._socket.recv_into(self._packet)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            arrival = time.monotonic()
+            try:
+                channels, frames, sequence, sample_rate, timestamp_us = decode_header(memoryview(self._packet)[:size])
+            except ValueError:
+                self.packets_invalid += 1
+                continue
+            if (channels, frames, sample_rate) != (self.channels, self.block_size, self.sample_rate):
+                self.packets_invalid += 1
+                continue
+
+            with self._lock:
+                self.jitter_buffer.push(sequence, timestamp_us, samples, arrival)
+
+    def _play_out(self):
+        period = self.jitter_buffer.packet_duration
+        next_deadline = time.monotonic()
+        concealed_in_a_row = 0
+
+        while not self._stop_event.is_set():
+            delay = next_deadline - time.monotonic()
+            if delay > 0.0:
+                self._stop_event.wait(delay)
+
+            with self._lock:
+                decision, samples, arrival = self.jitter_buffer.pop()
+                if decision == JitterBuffer.PLAY:
+                    self.latency.record((time.monotonic() - arrival) * 1000.0)
+                    np.copyto(self._concealment, samples)
+                    self.buffer.write(samples)
+                    concealed_in_a_row = 0
+                elif decision == JitterBuffer.CONCEAL:
+                    # Repeat the last packet, fading out over consecutive losses
+                    concealed_in_a_row += 1
+                    self._concealment *= self._concealment_gain
+                    self.buffer.write(self._concealment)
+
+            if decision != JitterBuffer.WAIT:
+                self.blocks_written += 1
+
+            next_deadline += period
+            if time.monotonic() - next_deadline > period:
+                next_deadline = time.monotonic()  # Fell behind, e.g. while waiting for the stream to start
+
+    def stats(self) -> dict:
+        """Returns a JSON-style dict of latency, loss and buffer depth metrics."""
+
+        with self._lock:
+            stats = self.jitter_buffer.stats()
+        stats['packets_invalid'] = self.packets_invalid
+        stats['latency'] = self.latency.summary()
+        return stats
+
+
+class NetworkAudioSender:
+    """Sends blocks of float32 samples as PCM packets, optionally simulating a bad network for testing."""
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        sample_rate: int,
+        channels: int,
+        block_size: int,
+        loss: float = 0.0,
+        jitter: float = 0.0
+    ):
+        """Constructor.
+
+        Args:
+            address (Tuple[str, int]): Receiver's (host, port)
+            sample_rate (int): Sample rate of the blocks
+            channels (int): Channels of the blocks
+            block_size (int): Frames per block
+            loss (float): Probability of dropping a packet, for testing. Defaults to 0.
+            jitter (float): Maximum random delay added to each packet in seconds, which also reorders packets, for
+                testing. Defaults to 0.
+        """
+
+        self.encoder = PcmPacketEncoder(sample_rate, channels, block_size)
+        self.loss = loss
+        self.jitter = jitter
+        self.sequence = 0
+        self.packets_sent = 0
+        self.packets_lost = 0
+        self.send_errors = 0
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.connect(address)
+        self._delayed: List[Tuple[float, int, bytes]] = []
+
+    def send(self, block: np.ndarray):
+        """Sends a block as the next packet."""
+
+        data = self.encoder.encode(self.sequence, block)
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+
+        if self.loss and random.random() < self.loss:
+            self.packets_lost += 1
+        elif self.jitter:
+            send_time = time.monotonic() + random.uniform(0.0, self.jitter)
+            heapq.heappush(self._delayed, (send_time, self.sequence, bytes(data)))
+        else:
+            self._send(data)
+
+        self.flush()
+
+    def _send(self, data: bytes):
+        try:
+            self._socket.send(data)
+        except OSError:
+            # e.g. connection refused while the receiver is not running yet, the stream goes on regardless
+            self.send_errors += 1
+            _rate_limited_logger.debug('Failed to send audio packet', exc_info=True)
+            return
+
+        self.packets_sent += 1
+
+    def flush(self):
+        """Sends the delayed packets whose time has come."""
+
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, data = heapq.heappop(self._delayed)
+            self._send(data)
+
+    def close(self):
+        self._socket.close()
@@ -0,0 +1,160 @@
+"""Single-producer ring buffer of PCM frames that consumers read without copying.
+
+The buffer is mirrored: every frame is stored twice, once at its position and once capacity frames later. Any window
+of up to capacity frames is therefore contiguous in memory and can be handed out as a NumPy view, no matter where it
+wraps around.
+
+There is a single writer (the audio source) and any number of readers. The writer publishes a block by storing the
+new total frame count after the samples are in place, a single attribute assignment that is atomic under the GIL, so
+neither side takes a lock. Views stay valid until the writer laps them, readers that fall more than capacity frames
+behind skip ahead and count an overrun.
+"""
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+
+class AudioRingBuffer:
+    """Mirrored ring buffer of frames of shape (channels,)."""
+
+    def __init__(self, capacity: int, channels: int = 1, dtype: npt.DTypeLike = np.float32):
+        """Constructor.
+
+        Args:
+            capacity (int): Number of frames held, e.g. a few seconds worth of samples
+            channels (int): Number of channels per frame. Defaults to 1.
+            dtype (np.dtype): Sample type. Defaults to float32.
+        """
+
+        if capacity <= 0:
+            raise ValueError(f'capacity must be positive, got {capacity}')
+
+        self.capacity = capacity
+        self.channels = channels
+        self._data = np.zeros((2 * capacity, channels), dtype=dtype)
+
+        # Total number of frames ever written, only assigned by the writer after the frames are in place
+        self.frames_written = 0
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._data.dtype
+
+    def write(self, block: np.ndarray):
+        """Copies a block of frames into the buffer. Only ever called from the producer thread.
+
+        Args:
+            block (np.ndarray): Array of shape (frames, channels) or (frames,) for mono, at most capacity frames
+        """
+
+        frames = block.shape[0]
+        if frames > self.capacity:
+            raise ValueError(f'Block of {frames} frames does not fit into a buffer of {self.capacity} frames')
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+
+        start = self.frames_written % self.capacity
+        first = min(frames, self.capacity - start)
+
+        # Both copies of every frame, the second half of the block wraps around to the start of the ring
+        self._data[start:start + first] = block[:first]
+        self._data[start + self.capacity:start + self.capacity + first] = block[:first]
+        if first < frames:
+            self._data[:frames - first] = block[first:]
+            self._data[self.capacity:self.capacity + frames - first] = block[first:]
+
+        self.frames_written += frames
+
+    def window(self, end: int, frames: int) -> np.ndarray:
+        """Returns a read-only view of the frames [end - frames, end), in absolute frame numbers.
+
+        Args:
+            end (int): Absolute frame number one past the last frame, at most frames_written
+            frames (int): Number of frames, at most capacity
+
+        Returns:
+            np.ndarray: View of shape (frames, channels), valid until the writer overwrites it
+        """
+
+        if frames > self.capacity:
+            raise ValueError(f'Window of {frames} frames is larger than the buffer of {self.capacity} frames')
+
+        start = (end - frames) % self.capacity
+        view = self._data[start:start + frames]
+        view.flags.writeable = False
+        return view
+
+    def latest(self, frames: int) -> np.ndarray:
+        """Returns a read-only view of the most recent frames, zero padded at the start until enough were written."""
+
+        return self.window(self.frames_written, frames)
+
+    def reader(self, from_start: bool = False) -> 'AudioReader':
+        """Returns a new reader.
+
+        Args:
+            from_start (bool): If True, starts at the oldest frame still buffered instead of the next frame written.
+                Defaults to False.
+        """
+
+        return AudioReader(self, from_start=from_start)
+
+
+class AudioReader:
+    """A consumer's position in an AudioRingBuffer."""
+
+    def __init__(self, buffer: AudioRingBuffer, from_start: bool = False):
+        self.buffer = buffer
+        self.position = max(0, buffer.frames_written - buffer.capacity) if from_start else buffer.frames_written
+        self.overruns = 0
+        self.frames_skipped = 0
+
+    def available(self) -> int:
+        """Number of frames written since the reader's position."""
+
+        return self.buffer.frames_written - self.position
+
+    def _skip_overrun(self):
+        oldest = self.buffer.frames_written - self.buffer.capacity
+        if self.position < oldest:
+            self.overruns += 1
+            self.frames_skipped += oldest - self.position
+            self.position = oldest
+
+    def read(self, frames: int) -> Optional[np.ndarray]:
+        """Returns a view of the next frames and advances past them.
+
+        Args:
+            frames (int): Number of frames to read
+
+        Returns:
+            Optional[np.ndarray]: View of shape (frames, channels), or None if fewer frames are available
+        """
+
+        self._skip_overrun()
+        if self.available() < frames:
+            return None
+
+        self.position += frames
+        return self.buffer.window(self.position, frames)
+
+    def read_window(self, frames: int, hop: int) -> Optional[np.ndarray]:
+        """Returns a view of the frames frames ending hop frames after the reader's position, and advances by hop.
+
+        This is the sliding window of an STFT: consecutive windows overlap by frames - hop frames.
+
+        Args:
+            frames (int): Window length, at most the buffer capacity
+            hop (int): Frames to advance by
+
+        Returns:
+            Optional[np.ndarray]: View of shape (frames, channels), or None if fewer than hop frames are available
+        """
+
+        self._skip_overrun()
+        if self.available() < hop:
+            return None
+
+        self.position += hop
+        return self.buffer.window(self.position, frames)
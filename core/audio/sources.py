@@ -0,0 +1,313 @@
+"""Audio sources which push fixed-size blocks of float32 PCM into an AudioRingBuffer.
+
+Every source converts its samples into a block preallocated at construction, and the ring buffer copies that block
+into its own storage, so steady-state capture does not allocate or go through Python lists.
+"""
+import logging
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from core.audio.ring_buffer import AudioRingBuffer
+from core.exceptions import MissingDependencyException
+from core.throttled_logging import RateLimitedLogger
+
+_logger = logging.getLogger(__name__)
+_rate_limited_logger = RateLimitedLogger(_logger)
+
+# (format tag, bits per sample) -> sample dtype of a WAV file, format 1 is integer PCM and 3 is IEEE float
+_WAV_SAMPLE_FORMATS: Dict[Tuple[int, int], np.dtype] = {
+    (1, 8): np.dtype('u1'),
+    (1, 16): np.dtype('<i2'),
+    (1, 32): np.dtype('<i4'),
+    (3, 32): np.dtype('<f4'),
+}
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class AudioSource(ABC):
+    """Base class of all audio sources.
+
+    A source produces blocks of block_size frames of float32 samples in [-1.0, 1.0] and writes them into its ring
+    buffer, typically from its own thread between start() and stop().
+    """
+
+    def __init__(self, sample_rate: int, channels: int, block_size: int, buffer_seconds: float = 2.0):
+        """Constructor.
+
+        Args:
+            sample_rate (int): Frames per second
+            channels (int): Channels per frame
+            block_size (int): Frames per block pushed into the ring buffer
+            buffer_seconds (float): Length of the ring buffer. Defaults to 2 seconds.
+        """
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_size = block_size
+        self.buffer = AudioRingBuffer(max(block_size, int(sample_rate * buffer_seconds)), channels=channels)
+
+        self.blocks_written = 0
+
+    @abstractmethod
+    def start(self):
+        pass
+
+    @abstractmethod
+    def stop(self):
+        pass
+
+    def __enter__(self) -> 'AudioSource':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _ThreadedAudioSource(AudioSource):
+    """A source which produces blocks from a thread of its own, paced by _read_block."""
+
+    def __init__(self, sample_rate: int, channels: int, block_size: int, buffer_seconds: float = 2.0):
+        super().__init__(sample_rate, channels, block_size, buffer_seconds=buffer_seconds)
+
+        self._block = np.zeros((block_size, channels), dtype=np.float32)
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.finished = threading.Event()
+
+    @abstractmethod
+    def _read_block(self, out: np.ndarray) -> int:
+        """Fills out with the next frames.
+
+        Returns:
+            int: Number of frames written into out, 0 once the source is exhausted
+        """
+
+        pass
+
+    def _wait_for_block(self, deadline: float):
+        """Called before every block, real-time sources sleep until the deadline here."""
+
+        pass
+
+    def _run(self):
+        next_deadline = time.monotonic()
+        while not self._stop_event.is_set():
+            self._wait_for_block(next_deadline)
+            frames = self._read_block(self._block)
+            if frames == 0:
+                break
+
+            self.buffer.write(self._block[:frames])
+            self.blocks_written += 1
+            next_deadline += frames / self.sample_rate
+
+        self.finished.set()
+
+    def start(self):
+        self._stop_event.clear()
+        self.finished.clear()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the source is exhausted. Returns False on timeout."""
+
+        return self.finished.wait(timeout)
+
+
+def _wav_layout(path: str) -> Tuple[np.dtype, int, int, int, int]:
+    """Parses the RIFF chunks of a WAV file.
+
+    Returns:
+        Tuple[np.dtype, int, int, int, int]: sample dtype, channels, sample rate, data offset and data size in bytes
+    """
+
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f'{path} is not a WAV file')
+
+        sample_format: Optional[np.dtype] = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f'{path} has no data chunk')
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack_from('<HHIIHH', fmt)
+                if format_tag == _WAVE_FORMAT_EXTENSIBLE:
+                    format_tag = struct.unpack_from('<H', fmt, 24)[0]  # First 2 bytes of the sub format GUID
+                sample_format = _WAV_SAMPLE_FORMATS.get((format_tag, bits))
+                if sample_format is None:
+                    raise ValueError(f'{path} uses unsupported sample format {format_tag} with {bits} bits')
+            elif chunk_id == b'data':
+                if sample_format is None:
+                    raise ValueError(f'{path} has no fmt chunk before its data chunk')
+                return sample_format, channels, sample_rate, f.tell(), chunk_size
+            else:
+                f.seek(chunk_size, 1)
+
+            if chunk_size % 2:
+                f.seek(1, 1)  # Chunks are padded to an even size
+
+
+class FileAudioSource(_ThreadedAudioSource):
+    """Replays a WAV or raw PCM file, at real-time speed or as fast as possible.
+
+    The file is memory mapped and every block is converted straight from the mapping into the preallocated block, so
+    replaying long files neither loads them into memory nor allocates per block. Used to run the pipeline headless.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        block_size: int = 1024,
+        realtime: bool = True,
+        loop: bool = False,
+        buffer_seconds: float = 2.0,
+        sample_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+        sample_format: str = '<i2'
+    ):
+        """Constructor.
+
+        Args:
+            path (str): Path to a .wav file, or any other file of raw interleaved PCM
+            block_size (int): Frames per block. Defaults to 1024.
+            realtime (bool): If True, blocks are pushed at the file's sample rate, otherwise as fast as possible,
+                so readers slower than the file overrun the ring buffer. Defaults to True.
+            loop (bool): If True, restarts at the beginning of the file once it ends. Defaults to False.
+            buffer_seconds (float): Length of the ring buffer. Defaults to 2 seconds.
+            sample_rate (Optional[int]): Sample rate of a raw file, ignored for WAV files
+            channels (Optional[int]): Channels of a raw file, ignored for WAV files
+            sample_format (str): NumPy dtype of the samples of a raw file, ignored for WAV files. Defaults to 16-bit
+                little endian.
+        """
+
+        if path.lower().endswith('.wav'):
+            dtype, channels, sample_rate, offset, size = _wav_layout(path)
+        else:
+            if sample_rate is None or channels is None:
+                raise ValueError('sample_rate and channels are required for raw PCM files')
+            dtype, offset, size = np.dtype(sample_format), 0, None
+
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+
+        samples: np.ndarray = np.memmap(path, dtype=dtype, mode='r', offset=offset)
+        if size is not None:
+            samples = samples[:size // dtype.itemsize]
+        frame_count = samples.shape[0] // channels
+        self._samples = samples[:frame_count * channels].reshape(frame_count, channels)
+        self._position = 0
+
+        # Integer samples are scaled into [-1.0, 1.0], unsigned 8-bit samples are centered on 128 first
+        if dtype.kind == 'f':
+            self._scale, self._bias = 1.0, 0.0
+        elif dtype.kind == 'u':
+            self._scale, self._bias = 1.0 / (1 << (8 * dtype.itemsize - 1)), -1.0
+        else:
+            self._scale, self._bias = 1.0 / (1 << (8 * dtype.itemsize - 1)), 0.0
+
+        super().__init__(sample_rate, channels, block_size, buffer_seconds=buffer_seconds)
+
+    @property
+    def frame_count(self) -> int:
+        return self._samples.shape[0]
+
+    @property
+    def duration(self) -> float:
+        return self.frame_count / self.sample_rate
+
+    def _wait_for_block(self, deadline: float):
+        if self.realtime:
+            delay = deadline - time.monotonic()
+            if delay > 0.0:
+                self._stop_event.wait(delay)
+
+    def _read_block(self, out: np.ndarray) -> int:
+        if self._position >= self.frame_count:
+            if not self.loop or self.frame_count == 0:
+                return 0
+            self._position = 0
+
+        frames = min(self.block_size, self.frame_count - self._position)
+        block = out[:frames]
+        np.multiply(self._samples[self._position:self._position + frames], self._scale, out=block, casting='unsafe')
+        if self._bias:
+            block += self._bias
+
+        self._position += frames
+        return frames
+
+
+class MicrophoneAudioSource(AudioSource):
+    """Captures an input device through PortAudio, using the optional sounddevice package.
+
+    PortAudio calls back from its own thread with every block, which is written into the ring buffer as it is.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 44100,
+        channels: int = 1,
+        block_size: int = 1024,
+        device: Optional[str] = None,
+        buffer_seconds: float = 2.0
+    ):
+        """Constructor.
+
+        Args:
+            sample_rate (int): Frames per second. Defaults to 44100.
+            channels (int): Channels to capture. Defaults to 1.
+            block_size (int): Frames per block. Defaults to 1024.
+            device (Optional[str]): Name or index of the input device, None for the default input. Defaults to None.
+            buffer_seconds (float): Length of the ring buffer. Defaults to 2 seconds.
+        """
+
+        try:
+            import sounddevice
+        except ImportError:
+            raise MissingDependencyException('sounddevice', 'Microphone capture')
+
+        super().__init__(sample_rate, channels, block_size, buffer_seconds=buffer_seconds)
+
+        self.status_errors = 0
+        self._stream = sounddevice.InputStream(
+            samplerate=sample_rate,
+            channels=channels,
+            blocksize=block_size,
+            device=device,
+            dtype='float32',
+            callback=self._callback
+        )
+
+    def _callback(self, indata: np.ndarray, frames: int, time_info, status):
+        if status:
+            self.status_errors += 1
+            _rate_limited_logger.debug('Input stream status: %s', status)
+
+        self.buffer.write(indata)
+        self.blocks_written += 1
+
+    def start(self):
+        self._stream.start()
+
+    def stop(self):
+        self._stream.stop()
+        self._stream.close()
@@ -0,0 +1,4 @@
+"""Micro benchmarks for the hot paths of this library, run through `python manage.py benchmark <name>`.
+
+Every benchmark module exposes add_arguments(parser) and run(args).
+"""
@@ -0,0 +1,54 @@
+"""Benchmarks converting a frame of RGB colors into gamut-clamped xy + brightness for every light."""
+import argparse
+import logging
+import time
+from typing import Callable, List, cast
+
+import numpy as np
+
+from core.lighting.hue.client import decode_resources
+from core.lighting.hue.color import LightColorConverter, clamp_to_gamut, gamut_triangle, rgb_to_xy_brightness
+from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.objects.light import Light
+from core.lighting.hue.synthetic import synthetic_topology
+
+_logger = logging.getLogger(__name__)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--lights', type=int, default=200, help='Number of synthetic lights per frame')
+    parser.add_argument('--frames', type=int, default=500, help='Number of frames to convert')
+
+
+def _per_frame_ms(frames: int, function: Callable[[int], object]) -> float:
+    start = time.perf_counter()
+    for idx in range(frames):
+        function(idx)
+    return (time.perf_counter() - start) * 1000.0 / frames
+
+
+def run(args: argparse.Namespace):
+    topology = synthetic_topology(args.lights)
+    lights = cast(List[Light], decode_resources(topology[ResourceType.LIGHT])[ResourceType.LIGHT])
+    converter = LightColorConverter(lights)
+
+    rng = np.random.default_rng(0)
+    frames = rng.random((args.frames, args.lights, 3))
+    frames_uint8 = (frames * 255.0).astype(np.uint8)
+    triangles = [np.array(gamut_triangle(light.color)) for light in lights]
+
+    def per_light(idx: int):
+        # One light at a time, the way a Python loop over lights would use this module
+        for rgb, triangle in zip(frames[idx], triangles):
+            xyb = rgb_to_xy_brightness(rgb)
+            clamp_to_gamut(xyb[:2], triangle)
+
+    converter.convert_uint8(frames_uint8[0])  # Build the lookup tables outside of the timed runs
+
+    _logger.info(f'Converting {args.frames} frames of {args.lights} lights, budget at 50 Hz is 20.00 ms per frame')
+    for name, function in (
+        ('per light NumPy calls', per_light),
+        ('LightColorConverter.convert', lambda idx: converter.convert(frames[idx])),
+        ('LightColorConverter.convert_uint8 (LUT)', lambda idx: converter.convert_uint8(frames_uint8[idx])),
+    ):
+        _logger.info(f'{name:<42} {_per_frame_ms(args.frames, function):9.4f} ms per frame')
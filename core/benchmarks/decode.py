@@ -0,0 +1,78 @@
+"""Benchmarks decoding a synthetic bridge listing through dataclasses_json and through the compiled decoders."""
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+from typing import Callable, List
+
+from dataclasses_json.core import _decode_dataclass
+
+from core.lighting.hue.client import RESOURCE_CLASSES, decode_resources
+from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.synthetic import synthetic_topology
+
+_logger = logging.getLogger(__name__)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--lights', type=int, default=2000, help='Number of synthetic lights to decode')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the fastest is reported')
+
+
+def _best_of(repeat: int, function: Callable[[], object]) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _allocated_bytes(function: Callable[[], object]) -> int:
+    """Returns the bytes still allocated by the result of function."""
+
+    tracemalloc.start()
+    try:
+        result = function()  # noqa: F841, keeps the result alive while measuring
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current
+
+
+def run(args: argparse.Namespace):
+    topology = synthetic_topology(args.lights)
+    items: List[dict] = [
+        item for resource_type, resources in topology.items() if resource_type in RESOURCE_CLASSES for item in resources
+    ]
+    _logger.info(f'Decoding {len(items)} resources ({args.lights} lights), best of {args.repeat}')
+
+    def dataclasses_json_round_trip():
+        # The original HueClient.list path: serialize every item back to JSON and parse it with from_json
+        return [_decode_dataclass(RESOURCE_CLASSES[ResourceType(item['type'])], json.loads(json.dumps(item)), False)
+                for item in items]
+
+    def dataclasses_json_from_dict():
+        return [_decode_dataclass(RESOURCE_CLASSES[ResourceType(item['type'])], item, False) for item in items]
+
+    def compiled():
+        return decode_resources(items)
+
+    compiled()  # Generate the decoders outside of the timed runs
+
+    baseline = None
+    for name, function in (
+        ('dataclasses_json from_json(json.dumps())', dataclasses_json_round_trip),
+        ('dataclasses_json from_dict', dataclasses_json_from_dict),
+        ('compiled decode_resources', compiled),
+    ):
+        elapsed = _best_of(args.repeat, function)
+        baseline = baseline or elapsed
+        _logger.info(
+            f'{name:<42} {elapsed * 1000.0:9.2f} ms  {len(items) / elapsed:11.0f} resources/s  '
+            f'{baseline / elapsed:6.2f}x'
+        )
+
+    allocated = _allocated_bytes(compiled)
+    _logger.info(f'Decoded objects hold {allocated / 1024.0:.0f} KiB, {allocated / len(items):.0f} bytes per resource')
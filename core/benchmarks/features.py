@@ -0,0 +1,70 @@
+"""Benchmarks the streaming feature extractor on a synthetic click track for a few hop sizes."""
+import argparse
+import logging
+import time
+import tracemalloc
+
+import numpy as np
+
+from core.audio.features import FeatureExtractor
+from core.audio.ring_buffer import AudioRingBuffer
+
+_logger = logging.getLogger(__name__)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--seconds', type=float, default=20.0, help='Seconds of synthetic audio to analyze')
+    parser.add_argument('--sample-rate', type=int, default=44100, help='Sample rate of the synthetic audio')
+    parser.add_argument('--fft-size', type=int, default=2048, help='STFT window length')
+    parser.add_argument('--hop-sizes', type=int, nargs='+', default=[256, 512, 1024], help='Hop sizes to compare')
+    parser.add_argument('--tempo', type=float, default=120.0, help='Tempo of the synthetic click track in BPM')
+
+
+def _click_track(sample_rate: int, seconds: float, tempo: float) -> np.ndarray:
+    """A quiet tone with a decaying noise burst on every beat."""
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    signal = 0.05 * np.sin(2.0 * np.pi * 220.0 * t)
+
+    click_length = int(0.03 * sample_rate)
+    click = rng.standard_normal(click_length) * np.exp(-np.arange(click_length) / (0.005 * sample_rate))
+    for start in np.arange(0.0, seconds, 60.0 / tempo):
+        idx = int(start * sample_rate)
+        end = min(idx + click_length, len(signal))
+        signal[idx:end] += 0.5 * click[:end - idx]
+
+    return signal.astype(np.float32)
+
+
+def run(args: argparse.Namespace):
+    signal = _click_track(args.sample_rate, args.seconds, args.tempo)
+    _logger.info(f'Analyzing {args.seconds:.0f}s of a {args.tempo:.0f} BPM click track at {args.sample_rate} Hz, '
+                 f'fft size {args.fft_size}')
+
+    for hop_size in args.hop_sizes:
+        # The whole signal is buffered up front, so only the analysis is timed
+        buffer = AudioRingBuffer(len(signal))
+        reader = buffer.reader()
+        buffer.write(signal)
+        extractor = FeatureExtractor(reader, args.sample_rate, fft_size=args.fft_size, hop_size=hop_size)
+
+        # Skip the first hops, they allocate the lazily created views and caches of NumPy
+        for _ in range(10):
+            extractor.process()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        frames = 0
+        for frame in extractor.frames():
+            frames += 1
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        real_time_rate = args.sample_rate / hop_size
+        _logger.info(
+            f'hop {hop_size:>5}: {frames / elapsed:9.0f} features/s ({frames / elapsed / real_time_rate:6.1f}x real '
+            f'time), {elapsed / frames * 1e6:7.1f} us per hop, peak {peak / 1024.0:6.1f} KiB allocated, '
+            f'tempo {frame.tempo:5.1f} BPM'
+        )
@@ -0,0 +1,76 @@
+"""Benchmarks import time of the CLI and the core modules, each in a fresh interpreter with -X importtime.
+
+With --max-ms it doubles as a regression check: the run fails if importing manage, or printing its --help, takes
+longer than the given budget.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+_logger = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--modules', nargs='+', default=['manage', 'core', 'core.lighting.hue.client', 'core.audio.features'],
+        help='Modules to import'
+    )
+    parser.add_argument('--repeat', type=int, default=5, help='Imports per module, the fastest is reported')
+    parser.add_argument('--top', type=int, default=5, help='Slowest imported modules to list per module')
+    parser.add_argument('--max-ms', type=float, default=None, help='Fail if manage or its --help takes longer')
+
+
+def _import_times(module: str) -> Dict[str, Tuple[int, int]]:
+    """Imports module in a fresh interpreter. Returns (self us, cumulative us) of every module imported on the way."""
+
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=_ROOT, capture_output=True, text=True, check=True
+    )
+
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def _help_ms() -> float:
+    """Returns the wall clock time of python manage.py --help, interpreter startup included."""
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'manage.py', '--help'], cwd=_ROOT, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000.0
+
+
+def run(args: argparse.Namespace):
+    failures: List[str] = []
+
+    for module in args.modules:
+        runs = [_import_times(module) for _ in range(args.repeat)]
+        times = min(runs, key=lambda run_times: run_times[module][1])
+        total_ms = times[module][1] / 1000.0
+
+        slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        _logger.info(f'import {module}: {total_ms:8.1f} ms, {len(times)} modules')
+        for name, (self_us, cumulative_us) in slowest:
+            _logger.info(f'    {name:<40} self {self_us / 1000.0:7.1f} ms  cumulative {cumulative_us / 1000.0:7.1f} ms')
+
+        if module == 'manage' and args.max_ms is not None and total_ms > args.max_ms:
+            failures.append(f'import manage took {total_ms:.1f} ms')
+
+    help_ms = min(_help_ms() for _ in range(args.repeat))
+    _logger.info(f'manage.py --help: {help_ms:8.1f} ms wall clock, interpreter startup included')
+    if args.max_ms is not None and help_ms > args.max_ms:
+        failures.append(f'manage.py --help took {help_ms:.1f} ms')
+
+    if failures:
+        raise RuntimeError(f'Import time over the budget of {args.max_ms:.1f} ms: {", ".join(failures)}')
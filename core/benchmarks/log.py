@@ -0,0 +1,98 @@
+"""Benchmarks the per call cost of logging a light update, the way HueClient.put_light does, through each handler setup.
+
+Compares a FileHandler writing on the calling thread with the QueueHandler of configure_logging, and with the sampled
+and rate limited loggers of core.throttled_logging on top of it.
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+from typing import Callable, Tuple
+
+import numpy as np
+
+from core import formatter
+from core.throttled_logging import RateLimitedLogger, SampledLogger
+
+_logger = logging.getLogger(__name__)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--calls', type=int, default=20000, help='Log calls per setup')
+    parser.add_argument('--sample-every', type=int, default=100, help='Records per logged record of SampledLogger')
+
+
+def _bench_logger(name: str, handler: logging.Handler, level: int = logging.DEBUG) -> logging.Logger:
+    logger = logging.getLogger(f'{__name__}.{name}')
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def _per_call_us(calls: int, function: Callable[[int], None]) -> Tuple[float, float, float]:
+    """Returns the mean, 99th percentile and maximum time of a call in us. Disk stalls show up in the tail."""
+
+    times = np.empty(calls)
+    for idx in range(calls):
+        start = time.perf_counter()
+        function(idx)
+        times[idx] = time.perf_counter() - start
+    times *= 1e6
+    return float(times.mean()), float(np.percentile(times, 99)), float(times.max())
+
+
+def _drain(log_queue: queue.SimpleQueue):
+    """Waits for the listener to catch up, so one setup's backlog does not slow down the next."""
+
+    while not log_queue.empty():
+        time.sleep(0.01)
+
+
+def run(args: argparse.Namespace):
+    body = {'on': {'on': True}, 'dimming': {'brightness': 57.5}, 'color': {'xy': {'x': 0.4573, 'y': 0.41}}}
+    light_id = '3f9d7bd1-0d7e-4bd2-8a2c-2d4c1c7b1b6e'
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_handler = logging.FileHandler(os.path.join(directory, 'sync.log'))
+        file_handler.setFormatter(formatter)
+        sync_logger = _bench_logger('sync', file_handler)
+
+        rotating_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(directory, 'queued.log'), maxBytes=1024 * 1024, backupCount=1
+        )
+        rotating_handler.setFormatter(formatter)
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, rotating_handler)
+        queued_logger = _bench_logger('queued', logging.handlers.QueueHandler(log_queue))
+        quiet_logger = _bench_logger('quiet', logging.handlers.QueueHandler(log_queue), level=logging.INFO)
+        sampled_logger = SampledLogger(queued_logger, sample_every=args.sample_every)
+        rate_limited_logger = RateLimitedLogger(queued_logger, interval=1.0)
+
+        listener.start()
+        try:
+            setups = (
+                ('FileHandler, f-string at INFO (before)', lambda idx: sync_logger.info(f'{body}')),
+                ('QueueHandler', lambda idx: queued_logger.debug('PUT light/%s %s', light_id, body)),
+                ('QueueHandler, level disabled', lambda idx: quiet_logger.debug('PUT light/%s %s', light_id, body)),
+                (
+                    f'SampledLogger, 1 in {args.sample_every}',
+                    lambda idx: sampled_logger.debug('PUT light/%s %s', light_id, body)
+                ),
+                (
+                    'RateLimitedLogger, 1 per s',
+                    lambda idx: rate_limited_logger.debug('PUT light/%s %s', light_id, body)
+                ),
+            )
+            _logger.info(f'Logging {args.calls} light updates per setup')
+            for name, function in setups:
+                _drain(log_queue)
+                mean_us, p99_us, max_us = _per_call_us(args.calls, function)
+                _logger.info(f'  {name:<40} mean {mean_us:7.2f} us  p99 {p99_us:7.2f} us  max {max_us:9.1f} us')
+        finally:
+            listener.stop()
+            file_handler.close()
+            rotating_handler.close()
@@ -0,0 +1,60 @@
+"""Benchmarks streaming frames to a loopback network LED receiver with DDP and E1.31, reporting throughput and loss."""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from core.lighting.network_led.drivers import DdpDriver, E131Driver, NetworkStripDriver
+from core.lighting.network_led.receiver import LoopbackLedReceiver
+from core.lighting.strip.enums import PixelOrder
+from core.lighting.strip.strip import LedStrip
+
+_logger = logging.getLogger(__name__)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--pixels', type=int, nargs='+', default=[300, 1000, 4000], help='Strip lengths to compare')
+    parser.add_argument('--frames', type=int, default=1000, help='Frames sent per strip')
+    parser.add_argument('--rate', type=float, default=0.0, help='Frames per second, 0 sends as fast as possible')
+    parser.add_argument('--synchronized', action='store_true', help='Latch frames with sync packets')
+
+
+def run(args: argparse.Namespace):
+    rng = np.random.default_rng(0)
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+
+    for protocol in ('ddp', 'e131'):
+        for pixel_count in args.pixels:
+            frames = rng.integers(0, 256, (16, pixel_count, 3), dtype=np.uint8)
+
+            with LoopbackLedReceiver(protocol) as receiver:
+                host, port = receiver.address
+                driver: NetworkStripDriver
+                if protocol == 'ddp':
+                    driver = DdpDriver(host, port, synchronized=args.synchronized)
+                else:
+                    driver = E131Driver(host, port, synchronized=args.synchronized)
+                strip = LedStrip(pixel_count, driver, pixel_order=PixelOrder.RGB)
+
+                start = time.perf_counter()
+                for idx in range(args.frames):
+                    strip.set_frame(frames[idx % len(frames)])
+                    strip.show()
+                    if args.synchronized:
+                        driver.sync()
+                    if interval:
+                        time.sleep(max(0.0, start + (idx + 1) * interval - time.perf_counter()))
+                elapsed = time.perf_counter() - start
+
+                time.sleep(0.2)  # Let the receiver drain its socket
+                strip.close()
+
+            sent = driver.stats()
+            received = receiver.stats()
+            _logger.info(
+                f'{protocol:<4} {pixel_count:>5} pixels  {sent["packets_sent"] / args.frames:4.0f} packets/frame  '
+                f'{args.frames / elapsed:8.0f} frames/s sent  {sent["bytes_sent"] / elapsed / 1e6:7.1f} MB/s  '
+                f'{elapsed * 1e6 / args.frames:7.1f} us/frame  received {received["frames_received"]:>5} frames, '
+                f'loss {received["loss_ratio"]:.2%}, send errors {sent["send_errors"]}'
+            )
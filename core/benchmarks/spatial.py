@@ -0,0 +1,61 @@
+"""Benchmarks mapping features onto lights by position, per light in Python against one matrix multiply."""
+import argparse
+import logging
+import math
+import time
+
+import numpy as np
+
+from core.audio.features import FeatureFrame
+from core.lighting.hue.spatial import SpatialMapper
+
+_logger = logging.getLogger(__name__)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--lights', type=int, nargs='+', default=[10, 20, 200, 2000], help='Light counts to compare')
+    parser.add_argument('--bands', type=int, default=8, help='Frequency bands per feature frame')
+    parser.add_argument('--frames', type=int, default=2000, help='Frames mapped per light count')
+
+
+def _map_per_light(mapper: SpatialMapper, features: np.ndarray) -> list:
+    """The same mapping written light by light, as a baseline."""
+
+    colors = []
+    for weights in mapper.weights.tolist():
+        rgb = [0.0, 0.0, 0.0]
+        for weight, value, color in zip(weights, features.tolist(), mapper.feature_colors.tolist()):
+            for component in range(3):
+                rgb[component] += weight * value * color[component]
+        colors.append([min(max(component, 0.0), 1.0) for component in rgb])
+    return colors
+
+
+def run(args: argparse.Namespace):
+    rng = np.random.default_rng(0)
+    frames = [
+        FeatureFrame(rms=float(rng.random()), onset=float(rng.random()), bands=rng.random(args.bands))
+        for _ in range(64)
+    ]
+
+    for light_count in args.lights:
+        angles = np.linspace(0.0, 2.0 * math.pi, light_count, endpoint=False)
+        positions = np.column_stack((np.cos(angles), np.sin(angles), rng.uniform(-1.0, 1.0, light_count)))
+        mapper = SpatialMapper(positions, args.bands)
+
+        features = rng.random(mapper.weights.shape[1])
+        baseline_frames = max(1, min(args.frames, 200_000 // light_count))
+        start = time.perf_counter()
+        for _ in range(baseline_frames):
+            _map_per_light(mapper, features)
+        per_light_us = (time.perf_counter() - start) * 1e6 / baseline_frames
+
+        start = time.perf_counter()
+        for idx in range(args.frames):
+            mapper.map(frames[idx % len(frames)])
+        matrix_us = (time.perf_counter() - start) * 1e6 / args.frames
+
+        _logger.info(
+            f'{light_count:>5} lights, {mapper.weights.shape[1]} features: per light {per_light_us:10.1f} us  '
+            f'matrix {matrix_us:8.1f} us  {per_light_us / matrix_us:7.1f}x'
+        )
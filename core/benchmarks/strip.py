@@ -0,0 +1,47 @@
+"""Benchmarks rendering and showing frames on simulated LED strips of a few lengths."""
+import argparse
+import logging
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from core.lighting.strip.drivers import SimulatedStripDriver
+from core.lighting.strip.enums import PixelOrder
+from core.lighting.strip.strip import LedStrip
+
+_logger = logging.getLogger(__name__)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--pixels', type=int, nargs='+', default=[60, 300, 1000], help='Strip lengths to compare')
+    parser.add_argument('--frames', type=int, default=2000, help='Frames rendered per strip')
+
+
+def run(args: argparse.Namespace):
+    rng = np.random.default_rng(0)
+
+    for pixel_order in (PixelOrder.GRB, PixelOrder.GRBW):
+        for pixel_count in args.pixels:
+            frames = rng.random((16, pixel_count, 3)).astype(np.float32)
+            frames_uint8 = (frames * 255.0).astype(np.uint8)
+
+            sources: List[Tuple[str, np.ndarray]] = [('float32', frames), ('uint8', frames_uint8)]
+            for name, source in sources:
+                driver = SimulatedStripDriver()
+                strip = LedStrip(pixel_count, driver, pixel_order=pixel_order, brightness=0.8)
+
+                start = time.perf_counter()
+                for idx in range(args.frames):
+                    strip.set_frame(source[idx % len(source)])
+                render_us = (time.perf_counter() - start) * 1e6 / args.frames
+
+                start = time.perf_counter()
+                for _ in range(args.frames):
+                    strip.show()
+                show_us = (time.perf_counter() - start) * 1e6 / args.frames
+
+                _logger.info(
+                    f'{pixel_order.value:<5} {pixel_count:>5} pixels {name:<8} render {render_us:8.1f} us  '
+                    f'show (simulated, records the frame) {show_us:8.1f} us'
+                )
@@ -38,3 +38,18 @@ class ConnectionException(LibraryException):
         self.client_name = client_name
         
         super().__init__(message)
+
+
+class MissingDependencyException(LibraryException):
+    """Raised when a feature needs an optional package that is not installed."""
+
+    def __init__(self, package_name: str, feature: str):
+        """Constructor.
+
+        Args:
+            package_name (str): Name of the missing package as it would be passed to pip
+            feature (str): Short description of the feature that needs the package
+        """
+
+        self.package_name = package_name
+        super().__init__(f'{feature} requires the optional package "{package_name}" (pip install {package_name})')
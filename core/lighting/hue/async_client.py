@@ -0,0 +1,212 @@
+"""asyncio-native client for the Hue API.
+
+HueClient blocks on every request, so updating N lights costs N serial round trips. AsyncHueClient exposes the same
+surface on top of aiohttp, and put_lights dispatches all updates concurrently so a whole room is updated in roughly one
+round trip. It also lets the audio loop share an event loop with network I/O.
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Type
+
+import aiohttp
+from dataclasses_json import DataClassJsonMixin
+
+from core.exceptions import ConnectionException
+from core.lighting.hue.client import (HueApplicationCredential, HueClient, ResourceT, decode_listing, decode_resources,
+                                      light_put, load_cached_application_key, raise_for_hue_error, resource_name,
+                                      unwrap_hue_api_json)
+from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.objects.light import Light
+
+_logger = logging.getLogger(__name__)
+
+
+class AsyncHueClient:
+
+    def __init__(
+        self,
+        bridge_ip_address: str,
+        application_key: Optional[HueApplicationCredential] = None,
+        api_version: Optional[str] = 'v2',
+        max_concurrency: int = 4,
+        timeout: float = 5.0,
+        scheme: str = 'https'
+    ):
+        """Constructor.
+
+        Args:
+            bridge_ip_address (str): The IP address of the Hue bridge we're trying to connect too
+            application_key (Optional[HueApplicationCredential]): Credential used to authenticate against the bridge.
+                If not provided, the key cached by HueClient is used. Defaults to None.
+            api_version (Optional[str]): The version of the Hue API to use. Defaults to v2.
+            max_concurrency (int): Maximum number of requests in flight at once, which is also the size of the
+                connection pool. Defaults to 4.
+            timeout (float): Total timeout of a single request in seconds. Defaults to 5.0.
+            scheme (str): URL scheme used to reach the bridge. Only local stand-ins for the bridge should use http.
+                Defaults to https.
+        """
+
+        self.bridge_ip_address = bridge_ip_address
+        self.api_version = api_version
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.scheme = scheme
+
+        if application_key is None:
+            application_key = load_cached_application_key(HueClient._HUE_APPLICATION_KEY)
+            if application_key is None:
+                raise ConnectionException(
+                    f'No cached application key found at {HueClient._HUE_APPLICATION_KEY}, '
+                    'pair with the bridge through HueClient first',
+                    self.__class__.__name__
+                )
+        self._hue_application_key = application_key
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def resource_endpoint(self) -> str:
+        """Construct the resource endpoint for the Hue API to hit."""
+
+        return f'{self.scheme}://{self.bridge_ip_address}/clip/{self.api_version}/resource'
+
+    async def open(self):
+        """Opens the pooled HTTP session. Called automatically when used as an async context manager."""
+
+        if self._session is not None:
+            return
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                ssl=False  # Frustratingly, my version of the Hue bridge does not support SSL
+            ),
+            headers={
+                'hue-application-key': self._hue_application_key.username
+            },
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self):
+        """Closes the pooled HTTP session."""
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> 'AsyncHueClient':
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _request(self, method: str, resource_name: Optional[str], body: Optional[object] = None) -> dict:
+        if self._session is None:
+            await self.open()
+        assert self._session is not None and self._semaphore is not None, 'open() creates both'
+
+        endpoint = self.resource_endpoint if resource_name is None else self.resource_endpoint + '/' + resource_name
+
+        async with self._semaphore:
+            try:
+                async with self._session.request(method, endpoint, json=body) as response:
+                    response_json = unwrap_hue_api_json(await response.json(content_type=None))
+                    raise_for_hue_error(response_json)
+                    response.raise_for_status()
+            except aiohttp.ClientConnectionError as e:
+                raise ConnectionException(str(e), self.__class__.__name__)
+
+        return response_json
+
+    async def get_resource(self, resource_name: Optional[str] = None) -> dict:
+        """ Construct and send an HTTP GET request for specified resource
+
+        Args:
+            resource_name (Optional[str]): The name of the resource requested. If None, every resource of the
+                bridge is requested at once. Defaults to None.
+
+        Returns:
+            dict: JSON-style python dict of the response
+        """
+
+        return await self._request('GET', resource_name)
+
+    async def put_resource(self, resource_name: str, body: object) -> dict:
+        """ Construct and send an HTTP PUT request for specified resource
+
+        Args:
+            resource_name (str): The name of the resource requested
+            body (object): JSON-style object to send as the body of the PUT request
+
+        Returns:
+            dict: JSON-style python dict of the response
+        """
+
+        return await self._request('PUT', resource_name, body)
+
+    async def list(self, resource_class: Type[ResourceT]) -> List[ResourceT]:
+        """Retrieves all resources of specified dataclass type.
+
+        Args:
+            resource_class (DataClassJsonMixin): the Dataclass for the specified resource to retrieve.
+        """
+
+        return decode_listing(resource_class, await self.get_resource(resource_name(resource_class)))
+
+    async def load_all(self, resource_types: Optional[Iterable[ResourceType]] = None
+                       ) -> Dict[ResourceType, List[DataClassJsonMixin]]:
+        """Retrieves every resource of the bridge with a single request and decodes the requested types.
+
+        Args:
+            resource_types (Optional[Iterable[ResourceType]]): Types to decode. Defaults to every type in
+                RESOURCE_CLASSES.
+
+        Returns:
+            Dict[ResourceType, List[DataClassJsonMixin]]: Decoded resources by type
+        """
+
+        return decode_resources((await self.get_resource())['data'], resource_types)
+
+    async def put_light(self, light: Light) -> Optional[dict]:
+        """Puts the state of the Light dataclass that changed since it was loaded or last put to the bridge.
+        No request is sent if nothing changed.
+
+        NOTE: https://developers.meethue.com/develop/hue-api-v2/api-reference/#resource_light__id__put
+
+        Returns:
+            Optional[dict]: JSON-style response of the bridge, or None if nothing changed
+        """
+
+        name, body, state = light_put(light)
+        if not body:
+            return None
+
+        response = await self.put_resource(name, body)
+        light.mark_clean(state)
+        return response
+
+    async def put_lights(self, lights: Sequence[Light]) -> List[Optional[dict]]:
+        """Puts every changed light concurrently, with at most max_concurrency requests in flight.
+
+        Every update is attempted even if some of them fail. Failures are logged and the first one is raised once all
+        updates have finished.
+
+        Args:
+            lights (Sequence[Light]): Lights to update
+
+        Returns:
+            List[Optional[dict]]: JSON-style responses in the same order as lights, None for unchanged lights
+        """
+
+        results = await asyncio.gather(*(self.put_light(light) for light in lights), return_exceptions=True)
+
+        errors = [(light, result) for light, result in zip(lights, results) if isinstance(result, BaseException)]
+        for light, error in errors:
+            _logger.info(f'Failed to update light {light.id}: {error}')
+        if errors:
+            raise errors[0][1]
+
+        return results
@@ -3,20 +3,48 @@ import json
 import logging
 import os
 import pprint
-from typing import Dict, List, Optional
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Type, TypeVar, Union
 
 import requests
 from dataclasses_json import DataClassJsonMixin
 
 from core.exceptions import HueError
-from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.enums import EntertainmentAction, ResourceType
+from core.lighting.hue.objects.base import TrackedHueObject
 from core.lighting.hue.objects.resource import Resource
 from core.lighting.hue.objects.device import Device
 from core.lighting.hue.objects.light import Light
 from core.lighting.hue.objects.entertainment_configuration import EntertainmentConfiguration
+from core.lighting.hue.objects.room import Room
+from core.lighting.hue.registry import ResourceRegistry
+from core.lighting.hue.topology_cache import TopologyCache, diff_resources, filter_resources
+from core.lighting.hue.transport import HueTransport
+from core.metrics import REGISTRY
 from core.settings import APP_NAME, CACHE_DIRECTORY
+from core.throttled_logging import SampledLogger
 
 _logger = logging.getLogger(__name__)
+_sampled_logger = SampledLogger(_logger)
+
+_API_ERRORS = REGISTRY.counter(
+    'hue_api_errors_total', 'Errors returned by the bridge, by Hue error type or HTTP status', ('type',)
+)
+
+# Any resource dataclass, e.g. Light
+ResourceT = TypeVar('ResourceT', bound=DataClassJsonMixin)
+
+# Dataclass of every resource type this library decodes
+RESOURCE_CLASSES: Dict[ResourceType, Type[DataClassJsonMixin]] = {
+    ResourceType.LIGHT: Light,
+    ResourceType.DEVICE: Device,
+    ResourceType.ENTERTAINMENT_CONFIGURATION: EntertainmentConfiguration,
+    ResourceType.ROOM: Room,
+}
+_RESOURCE_TYPES_BY_CLASS: Dict[Type[DataClassJsonMixin], ResourceType] = {
+    resource_class: resource_type for resource_type, resource_class in RESOURCE_CLASSES.items()
+}
 
 
 @dataclass
@@ -25,11 +53,142 @@ class HueApplicationCredential(DataClassJsonMixin):
     clientkey: str
 
 
+def load_cached_application_key(key_file_path: str) -> Optional[HueApplicationCredential]:
+    """Loads an application key saved by HueClient.request_application_key, if one exists.
+
+    Args:
+        key_file_path (str): Path to the cached key file
+
+    Returns:
+        Optional[HueApplicationCredential]: The cached credential or None if there is no cached key
+    """
+
+    if not os.path.exists(key_file_path):
+        return None
+
+    with open(key_file_path, 'r') as key_file:
+        return HueApplicationCredential.from_json(key_file.read().strip())
+
+
+def unwrap_hue_api_json(body: Union[dict, list]) -> dict:
+    """Some endpoints wrap the actual response in an array of size 1, unclear why. Unwraps it if so."""
+
+    return body[0] if isinstance(body, list) else body
+
+
+def raise_for_hue_error(response_json: dict):
+    """Raises a HueError if the JSON-style response from the Hue API reports any errors.
+
+    Args:
+        response_json (dict): Unwrapped response from the Hue API
+    """
+
+    # The name depends on whether or not there is more then 1 error
+    hue_errors = response_json.get('errors')
+    if hue_errors:
+        hue_error = hue_errors[0]
+    else:
+        hue_error = response_json.get('error')
+
+    if hue_error:
+        _logger.debug(pprint.PrettyPrinter().pformat(response_json))
+        raise HueError(hue_error.get('description'), hue_error.get('type'))
+
+
+def resource_name(resource_class: Type[DataClassJsonMixin]) -> str:
+    """Returns the url path of a resource dataclass, e.g. 'entertainment_configuration' for
+    EntertainmentConfiguration."""
+
+    resource_type = _RESOURCE_TYPES_BY_CLASS.get(resource_class)
+    if resource_type is not None:
+        return resource_type.value
+
+    return HueClient._camel_to_snake(resource_class.__name__)
+
+
+def decode_resources(items: List[dict], resource_types: Optional[Iterable[ResourceType]] = None
+                     ) -> Dict[ResourceType, List[DataClassJsonMixin]]:
+    """Decodes a mixed listing of resources, as returned by GET /resource, into their dataclasses in a single pass.
+
+    Args:
+        items (List[dict]): JSON-style resources, each with a 'type'
+        resource_types (Optional[Iterable[ResourceType]]): Types to decode, others are skipped.
+            Defaults to every type in RESOURCE_CLASSES.
+
+    Returns:
+        Dict[ResourceType, List[DataClassJsonMixin]]: Decoded resources by type, every requested type is present
+    """
+
+    if resource_types is None:
+        resource_types = RESOURCE_CLASSES.keys()
+
+    resources: Dict[ResourceType, List[DataClassJsonMixin]] = {}
+    decoders = {}
+    for resource_type in resource_types:
+        resources[resource_type] = []
+        decoders[resource_type.value] = (RESOURCE_CLASSES[resource_type].from_dict, resources[resource_type].append)
+
+    for item in items:
+        decoder = decoders.get(item.get('type', ''))
+        if decoder is None:
+            continue
+
+        from_dict, append = decoder
+        try:
+            append(from_dict(item))
+        except KeyError as e:
+            _logger.info('Unable to load response because of missing required fields. See debug log for details')
+            _logger.debug(pprint.PrettyPrinter().pformat(item))
+            raise e
+
+    return resources
+
+
+def decode_listing(resource_class: Type[ResourceT], response: dict) -> List[ResourceT]:
+    """Decodes the response of GET /resource/<type> into its dataclasses. Shared by HueClient and AsyncHueClient.
+
+    Args:
+        resource_class (Type[ResourceT]): Dataclass of the listed resources
+        response (dict): JSON-style response of the bridge
+
+    Returns:
+        List[ResourceT]: The decoded resources
+    """
+
+    try:
+        return [resource_class.from_dict(get_json) for get_json in response['data']]
+    except KeyError as e:
+        _logger.info('Unable to load response because of missing required fields. See debug log for details')
+        _logger.debug(pprint.PrettyPrinter().pformat(response))
+        raise e
+
+
+def light_put(light: Light) -> Tuple[str, dict, dict]:
+    """Builds the PUT of the state of a light that changed since it was loaded or last put to the bridge. Shared by
+    HueClient and AsyncHueClient.
+
+    Args:
+        light (Light): The light to put
+
+    Returns:
+        Tuple[str, dict, dict]: Resource name, JSON-style body and the state snapshot to pass to light.mark_clean()
+            once the PUT succeeded. The body is empty if nothing changed, in which case nothing should be sent.
+    """
+
+    state = light.snapshot()
+    body = light.to_put(state)
+    if body:
+        _sampled_logger.debug('PUT light/%s %s', light.id, body)
+    return f'light/{light.id}', body, state
+
+
 class HueClient:
 
     _HUE_APPLICATION_KEY = os.path.join(CACHE_DIRECTORY, 'hue_application.key')
 
-    def __init__(self, bridge_ip_address: str, bridge_certificate_path: Optional[str] = None, api_version: Optional[str] = 'v2'):
+    def __init__(self, bridge_ip_address: str, bridge_certificate_path: Optional[str] = None, api_version: Optional[str] = 'v2',
+                 transport: Optional[HueTransport] = None, application_key: Optional[HueApplicationCredential] = None,
+                 scheme: str = 'https'):
         """Constructor.
 
         Args:
@@ -38,29 +197,60 @@ class HueClient:
                 so it may be necessary to provide the public key. If not provided, default certificates are used.
                 Defaults to None.
             api_version (Optional[str]): The version of the Hue API to use. Defaults to v2.
+            transport (Optional[HueTransport]): Pooled HTTP transport used for every request to the bridge.
+                If not provided, a transport with the default pool size, timeouts and retry policy is created.
+            application_key (Optional[HueApplicationCredential]): Credential used to authenticate against the bridge.
+                If not provided, the cached key is loaded or a new one is requested. Defaults to None.
+            scheme (str): URL scheme used to reach the bridge. Only local stand-ins for the bridge should use http.
+                Defaults to https.
         """
 
         self.bridge_ip_address = bridge_ip_address
         self.bridge_certificate_path = bridge_certificate_path
         self.api_version = api_version
+        self.scheme = scheme
+        self.transport = transport if transport is not None else HueTransport()
+        self._topology_cache: Optional[TopologyCache] = None
+        self._topology_validation: Optional[threading.Thread] = None
+        self._topology_validation_error: Optional[Exception] = None
 
         # Check to see if a keyfile exists, and load it if it does - otherwise, run through basic authorization
         # https://developers.meethue.com/develop/hue-api-v2/getting-started/
 
-        if os.path.exists(self.__class__._HUE_APPLICATION_KEY):
-            with open(self.__class__._HUE_APPLICATION_KEY, 'r') as key_file:
-                self._hue_application_key = HueApplicationCredential.from_json(key_file.read().strip())
-        else:
+        self._hue_application_key = application_key
+        if self._hue_application_key is None:
+            self._hue_application_key = load_cached_application_key(self.__class__._HUE_APPLICATION_KEY)
+        if self._hue_application_key is None:
             self.request_application_key()
 
     
+    @property
+    def application_key(self) -> HueApplicationCredential:
+        """The application credential used to authenticate against the bridge."""
+
+        assert self._hue_application_key is not None, '__init__ loads or requests the application key'
+        return self._hue_application_key
+
+    @property
+    def base_url(self) -> str:
+        """Scheme and address of the bridge."""
+
+        return f'{self.scheme}://{self.bridge_ip_address}'
+
     @property
     def resource_endpoint(self) -> str:
         """Construct the resource endpoint for the Hue API to hit."""
 
-        return f'https://{self.bridge_ip_address}/clip/{self.api_version}/resource'
+        return f'{self.base_url}/clip/{self.api_version}/resource'
+
+    @property
+    def event_stream_endpoint(self) -> str:
+        """Construct the server-sent event stream endpoint of the Hue API."""
+
+        return f'{self.base_url}/eventstream/clip/{self.api_version}'
 
-    def _camel_to_snake(self, s: str) -> str:
+    @staticmethod
+    def _camel_to_snake(s: str) -> str:
         """Utility function to convert Python class names to snake_case url paths.
 
         Stolen from: https://www.geeksforgeeks.org/python-program-to-convert-camel-case-string-to-snake-case/
@@ -102,26 +292,20 @@ class HueClient:
             dict: JSON-style python dict from the Response.json() method
         """
 
-        try:
-            response_json = response.json()[0]  # Some endpoints wrap the actual response in an array of size 1, unclear why
-        except KeyError:
-            response_json = response.json()
+        response_json = unwrap_hue_api_json(response.json())
 
         # Error handling
         if raise_errors:
-
-            # The name depends on whether or not there is more then 1 error
-            hue_errors = response_json.get('errors')
-            if hue_errors:
-                hue_error = hue_errors[0]
-            else:
-                hue_error = response_json.get('error')
-            
-            if hue_error:
-                _logger.debug(pprint.PrettyPrinter().pformat(response_json))
-                raise HueError(hue_error.get('description'), hue_error.get('type'))
-
-            response.raise_for_status()
+            try:
+                raise_for_hue_error(response_json)
+                response.raise_for_status()
+            except HueError as e:
+                # CLIP v2 errors carry no type, only the HTTP status tells them apart
+                _API_ERRORS.labels(e.error_type if e.error_type is not None else f'http_{response.status_code}').inc()
+                raise
+            except requests.HTTPError:
+                _API_ERRORS.labels(f'http_{response.status_code}').inc()
+                raise
         
         return response_json
 
@@ -135,13 +319,12 @@ class HueClient:
             cache (bool): If True, saves request application key to cache. Defaults to True.
         """
 
-        response = requests.post(
-            f'https://{self.bridge_ip_address}/api',
+        response = self.transport.post(
+            f'{self.base_url}/api',
             data=json.dumps({
                 'devicetype': f'{APP_NAME}#HueClient',
                 'generateclientkey': True
-            }),
-            verify=False  # Frustratingly, my version of the Hue bridge does not support SSL
+            })
         )
         
         parsed_response = self._parse_hue_api_response(response, True)
@@ -149,28 +332,29 @@ class HueClient:
         self._hue_application_key = HueApplicationCredential.from_json(json.dumps(parsed_response['success']))
 
         if cache:
+            os.makedirs(os.path.dirname(self.__class__._HUE_APPLICATION_KEY), exist_ok=True)
             with open(self.__class__._HUE_APPLICATION_KEY, 'w') as key_file:
                 key_file.write(self._hue_application_key.to_json())
 
-    def get_resource(self, resource_name: str) -> dict:
+    def get_resource(self, resource_name: Optional[str] = None) -> dict:
         """ Construct and send an HTTP GET request for specified resource
 
         Args:
-            resource_name (str): The name of the resource requested
+            resource_name (Optional[str]): The name of the resource requested. If None, every resource of the
+                bridge is requested at once. Defaults to None.
 
         Returns:
             requests.Response: the HTTP response
         """
 
-        endpoint = self.resource_endpoint + '/' + resource_name
+        endpoint = self.resource_endpoint if resource_name is None else self.resource_endpoint + '/' + resource_name
 
         return self._parse_hue_api_response(
-            requests.get(
+            self.transport.get(
                 endpoint,
                 headers={
-                    'hue-application-key': self._hue_application_key.username
-                },
-                verify=False  # Frustratingly, my version of the Hue bridge does not support SSL
+                    'hue-application-key': self.application_key.username
+                }
             ),
             True
         )
@@ -189,76 +373,221 @@ class HueClient:
         endpoint = self.resource_endpoint + '/' + resource_name
         
         return self._parse_hue_api_response(
-            requests.put(
+            self.transport.put(
                 endpoint,
                 headers={
-                    'hue-application-key': self._hue_application_key.username
+                    'hue-application-key': self.application_key.username
                 },
-                data=body,
-                verify=False  # Frustratingly, my version of the Hue bridge does not support SSL
+                json=body
             ),
             True
         )
     
 
-    def list(self, resource_class: DataClassJsonMixin) -> List[object]:
+    def list(self, resource_class: Type[ResourceT]) -> List[ResourceT]:
         """Retrieves all resources of specified dataclass type. 
         
         Args:
             resource_class (DataClassJsonMixin): the Dataclass for the specified resource to retrieve.
         """
 
-        response = self.get_resource(self._camel_to_snake(resource_class.__name__))
+        return decode_listing(resource_class, self.get_resource(resource_name(resource_class)))
+
+    def load_all(self, resource_types: Optional[Iterable[ResourceType]] = None
+                 ) -> Dict[ResourceType, List[DataClassJsonMixin]]:
+        """Retrieves every resource of the bridge with a single request and decodes the requested types.
+
+        Args:
+            resource_types (Optional[Iterable[ResourceType]]): Types to decode. Defaults to every type in
+                RESOURCE_CLASSES.
+
+        Returns:
+            Dict[ResourceType, List[DataClassJsonMixin]]: Decoded resources by type
+        """
+
+        return decode_resources(self.get_resource()['data'], resource_types)
+
+    def load_registry(self, registry: Optional[ResourceRegistry] = None, cache: bool = True) -> ResourceRegistry:
+        """Loads every decodable resource of the bridge into a registry with a single request.
+
+        Args:
+            registry (Optional[ResourceRegistry]): Registry to load into. If None, a new one is created.
+            cache (bool): Whether to write the resources to the topology cache, see load_cached_registry.
+                Defaults to True.
+
+        Returns:
+            ResourceRegistry: the loaded registry
+        """
+
+        if registry is None:
+            registry = ResourceRegistry()
+
+        items = self._decodable_items()
+        for resources in decode_resources(items).values():
+            registry.add_all(resources)
+
+        if cache:
+            self._save_topology(items)
+
+        return registry
+
+    @property
+    def topology_cache(self) -> TopologyCache:
+        """The on-disk topology cache of this client's bridge."""
+
+        if self._topology_cache is None:
+            safe_address = ''.join(c if c.isalnum() else '_' for c in str(self.bridge_ip_address))
+            self._topology_cache = TopologyCache(
+                os.path.join(CACHE_DIRECTORY, f'hue_topology_{safe_address}.json.gz'), bridge=self.bridge_ip_address
+            )
+        return self._topology_cache
 
-        resources = []
+    def _decodable_items(self) -> List[dict]:
+        """Retrieves every resource of the bridge and keeps the JSON of the types in RESOURCE_CLASSES."""
+
+        resource_types = [resource_type.value for resource_type in RESOURCE_CLASSES]
+        return filter_resources(self.get_resource()['data'], resource_types)
+
+    def _save_topology(self, items: List[dict]):
         try:
-            for get_json in response['data']:
-                resources.append(resource_class.from_json(json.dumps(get_json)))
-        except KeyError as e:
-            _logger.info('Unable to load response because of missing required fields. See debug log for details')
-            _logger.debug(pprint.PrettyPrinter().pformat(response))
-            raise e
-        
-        return resources
+            self.topology_cache.save(items)
+        except OSError as e:
+            _logger.warning(f'Unable to write the topology cache: {e}')
+
+    def load_cached_registry(self, registry: Optional[ResourceRegistry] = None, validate: bool = True
+                             ) -> ResourceRegistry:
+        """Loads the topology from the on-disk cache without waiting for the bridge, then validates it in the
+        background. Falls back to load_registry if there is no usable cache.
+
+        Validation fetches every resource once, and only resources that were added, changed or removed since the
+        cache was written are decoded. Changed resources are refreshed in place, see ResourceRegistry.refresh, so
+        objects handed out before validation finished stay registered. The registry is locked per update, so it can be
+        read while validation runs. See wait_for_topology_validation.
+
+        The cache may be stale, so lights loaded from it have no clean state and their first put_light sends their
+        full state.
+
+        Args:
+            registry (Optional[ResourceRegistry]): Registry to load into. If None, a new one is created.
+            validate (bool): Whether to validate the cache against the bridge in the background. Defaults to True.
+
+        Returns:
+            ResourceRegistry: the loaded registry
+        """
+
+        start = time.perf_counter()
+        cached_items = self.topology_cache.load()
+        if cached_items is None:
+            return self.load_registry(registry)
+
+        if registry is None:
+            registry = ResourceRegistry()
+        for resources in decode_resources(cached_items).values():
+            for resource in resources:
+                if isinstance(resource, TrackedHueObject):
+                    resource.mark_unknown()
+            registry.add_all(resources)
+        _logger.info(f'Loaded {len(cached_items)} resources from the topology cache in '
+                     f'{(time.perf_counter() - start) * 1000.0:.1f} ms')
+
+        if validate:
+            self._topology_validation_error = None
+            self._topology_validation = threading.Thread(
+                target=self._validate_topology, args=(registry, cached_items), name='TopologyValidation', daemon=True
+            )
+            self._topology_validation.start()
+
+        return registry
+
+    def _validate_topology(self, registry: ResourceRegistry, cached_items: List[dict]):
+        try:
+            fresh_items = self._decodable_items()
+            added, changed, removed = diff_resources(cached_items, fresh_items)
+            for resources in decode_resources(added + changed).values():
+                for resource in resources:
+                    registry.refresh(resource)
+            for resource_id in removed:
+                registry.remove(resource_id)
+        except (requests.RequestException, HueError) as e:
+            _logger.warning(f'Unable to validate the topology cache, keeping the cached topology: {e}')
+            self._topology_validation_error = e
+            return
+        except Exception as e:
+            # Runs on its own thread, so anything not caught here would end it silently
+            _logger.exception('Unable to validate the topology cache, the registry may be partially updated')
+            self._topology_validation_error = e
+            return
+
+        if added or changed or removed:
+            self._save_topology(fresh_items)
+        _logger.info(f'Validated the topology cache: {len(added)} added, {len(changed)} changed, '
+                     f'{len(removed)} removed')
+
+    def wait_for_topology_validation(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the background validation started by load_cached_registry. Returns False on timeout, and
+        re-raises the exception if validation failed, e.g. because the bridge could not be reached."""
+
+        if self._topology_validation is not None:
+            self._topology_validation.join(timeout)
+            if self._topology_validation.is_alive():
+                return False
+        if self._topology_validation_error is not None:
+            raise self._topology_validation_error
+        return True
     
-    def put_light(self, light: Light):
-        """Takes data in Light dataclass and puts it to the bridge to update it.
+    def put_light(self, light: Light) -> Optional[dict]:
+        """Puts the state of the Light dataclass that changed since it was loaded or last put to the bridge.
+        No request is sent if nothing changed.
         
         NOTE: https://developers.meethue.com/develop/hue-api-v2/api-reference/#resource_light__id__put
+
+        Returns:
+            Optional[dict]: JSON-style response of the bridge, or None if nothing changed
         """
 
-        _logger.info(light.to_put())
+        name, body, state = light_put(light)
+        if not body:
+            return None
 
-        self.put_resource(f'light/{light.id}', light.to_put())
+        response = self.put_resource(name, body)
+        light.mark_clean(state)
+        return response
 
-    def test(self):
-        """ Tests connection to local Hue bridge. Raises Exceptions if a failure occurs."""
+    def set_entertainment_configuration_action(self, configuration: EntertainmentConfiguration,
+                                               action: EntertainmentAction):
+        """Starts or stops streaming for an entertainment configuration.
 
-        lights: List[Light] = self.list(Light)
-        light_index: Dict[str, Light] = {}  # Index Lights by their ID
-        for light in lights:
-            light_index[light.id] = light
-        
-        devices: List[Device] = self.list(Device)
+        NOTE: https://developers.meethue.com/develop/hue-entertainment/hue-entertainment-api/
+
+        Args:
+            configuration (EntertainmentConfiguration): The configuration to start or stop
+            action (EntertainmentAction): Whether to start or stop the configuration
+        """
 
-        for device in devices:
-            device_lights = device.get_resources_by_type(ResourceType.LIGHT)
+        _logger.info(f'{action.value} entertainment configuration {configuration.metadata.name}')
 
-            for idx, light_service in enumerate(device_lights):
-                light = light_index.get(light_service.rid)
+        self.put_resource(f'entertainment_configuration/{configuration.id}', {'action': action.value})
 
+    def test(self):
+        """ Tests connection to local Hue bridge. Raises Exceptions if a failure occurs."""
+
+        registry = self.load_cached_registry()
+
+        for device in registry.devices():
+            for idx, light in enumerate(registry.lights_of_device(device.id)):
                 _logger.info(f'{device.metadata.name} - light_service {idx} {light.id} on: {light.on.on}')
 
                 if device.metadata.name == 'Desk Lamp':
                     light.on.on = True
                     self.put_light(light)
-        
-        configurations: List[EntertainmentConfiguration] = self.list(EntertainmentConfiguration)
-        _logger.debug(configurations)
-        for configuration in configurations:
+
+        _logger.debug(registry.entertainment_configurations())
+        for configuration in registry.entertainment_configurations():
             _logger.info(f'{configuration.metadata.name}')
             for service_location in configuration.locations.service_locations:
-                light = light_index.get(service_location.service.rid)
+                for idx, light in enumerate(registry.lights_for_service(service_location.service.rid)):
+                    _logger.info(f'{configuration.metadata.name} configuration - light_service {idx} {light.id} on: {light.on.on}')
 
-                if light:
-                    _logger.info(f'{configuration.metadata.name} configuration - light_service {idx} {light.id} on: {light.on.on}')
\ No newline at end of file
+        # The listing above may come from the cache, the connection is only tested once validation is done
+        self.wait_for_topology_validation()
+        self.transport.log_latency_report()
@@ -0,0 +1,261 @@
+"""Vectorized conversion of RGB colors into the CIE xy + brightness colors Hue lights understand.
+
+Every light can only show colors inside its gamut triangle, either given by Color.gamut or by one of the GamutType
+defaults. Colors are converted for whole frames at once with NumPy, sRGB -> linear RGB -> CIE XYZ -> xy, and xy
+outside a light's gamut is moved to the closest point of the triangle, like the bridge does.
+
+NOTE: https://developers.meethue.com/develop/application-design-guidance/color-conversion-formulas-rgb-to-xy-and-back/
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.lighting.hue.enums import GamutType
+from core.lighting.hue.objects.color import Color
+from core.lighting.hue.objects.light import Light
+
+# ((red x, red y), (green x, green y), (blue x, blue y))
+GamutTriangle = Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float]]
+
+GAMUT_TRIANGLES = {
+    GamutType.A: ((0.704, 0.296), (0.2151, 0.7106), (0.138, 0.08)),
+    GamutType.B: ((0.675, 0.322), (0.409, 0.518), (0.167, 0.04)),
+    GamutType.C: ((0.6915, 0.3083), (0.17, 0.7), (0.1532, 0.0475)),
+}
+
+# Used when a light neither reports a gamut nor a known gamut type, e.g. GamutType.OTHER
+DEFAULT_GAMUT_TRIANGLE = GAMUT_TRIANGLES[GamutType.C]
+
+# Chromaticity reported for black, which has no chromaticity of its own
+WHITE_POINT = (0.3127, 0.3290)
+
+# Wide gamut RGB D65 -> XYZ, as given by the Hue color conversion guide
+_RGB_TO_XYZ = np.array([
+    [0.664511, 0.154324, 0.162028],
+    [0.283881, 0.668433, 0.047685],
+    [0.000088, 0.072310, 0.986039],
+])
+
+# sRGB -> linear for every 8-bit value, so uint8 frames skip the power function entirely
+_SRGB_TO_LINEAR_UINT8 = np.where(
+    np.arange(256) / 255.0 <= 0.04045,
+    np.arange(256) / 255.0 / 12.92,
+    ((np.arange(256) / 255.0 + 0.055) / 1.055) ** 2.4,
+)
+
+
+def gamut_triangle(color: Optional[Color]) -> GamutTriangle:
+    """Returns the gamut triangle of a light's Color, falling back to the GamutType defaults.
+
+    Args:
+        color (Optional[Color]): Color of a light, None for lights which do not support color
+
+    Returns:
+        GamutTriangle: Red, green and blue corners of the gamut
+    """
+
+    if color is not None and color.gamut is not None:
+        gamut = color.gamut
+        return ((gamut.red.x, gamut.red.y), (gamut.green.x, gamut.green.y), (gamut.blue.x, gamut.blue.y))
+    if color is not None and color.gamut_type in GAMUT_TRIANGLES:
+        return GAMUT_TRIANGLES[color.gamut_type]
+    return DEFAULT_GAMUT_TRIANGLE
+
+
+def srgb_to_linear(rgb: np.ndarray) -> np.ndarray:
+    """Removes the sRGB gamma from colors, either uint8 in [0, 255] or floats in [0.0, 1.0]."""
+
+    if rgb.dtype == np.uint8:
+        return _SRGB_TO_LINEAR_UINT8[rgb]
+
+    rgb = np.clip(rgb, 0.0, 1.0)
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+
+def rgb_to_xy_brightness(rgb: np.ndarray) -> np.ndarray:
+    """Converts sRGB colors into CIE xy and brightness, without clamping into any gamut.
+
+    Args:
+        rgb (np.ndarray): Array of shape (..., 3), uint8 in [0, 255] or floats in [0.0, 1.0]
+
+    Returns:
+        np.ndarray: Array of shape (..., 3) of (x, y, brightness), brightness being the luminance Y in [0.0, 1.0]
+    """
+
+    xyz = srgb_to_linear(np.asarray(rgb)) @ _RGB_TO_XYZ.T
+    total = xyz.sum(axis=-1)
+
+    result = np.empty(xyz.shape, dtype=np.float64)
+    black = total <= 0.0
+    safe_total = np.where(black, 1.0, total)
+    result[..., 0] = np.where(black, WHITE_POINT[0], xyz[..., 0] / safe_total)
+    result[..., 1] = np.where(black, WHITE_POINT[1], xyz[..., 1] / safe_total)
+    result[..., 2] = np.clip(xyz[..., 1], 0.0, 1.0)
+    return result
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def clamp_to_gamut(xy: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Moves every xy outside its gamut triangle to the closest point on the triangle's edges.
+
+    Args:
+        xy (np.ndarray): Array of shape (..., 2)
+        triangles (np.ndarray): Either one triangle of shape (3, 2), or one triangle per xy of shape (..., 3, 2)
+
+    Returns:
+        np.ndarray: Clamped xy of shape (..., 2)
+    """
+
+    xy = np.asarray(xy, dtype=np.float64)
+    triangles = np.broadcast_to(np.asarray(triangles, dtype=np.float64), xy.shape[:-1] + (3, 2))
+
+    corners = triangles
+    next_corners = np.roll(triangles, -1, axis=-2)
+    edges = next_corners - corners                      # (..., 3, 2)
+    to_point = xy[..., np.newaxis, :] - corners         # (..., 3, 2)
+
+    # Inside (or on an edge) when the point is on the same side of all three edges
+    sides = _cross(edges, to_point)                     # (..., 3)
+    inside = np.all(sides >= 0.0, axis=-1) | np.all(sides <= 0.0, axis=-1)
+
+    # Closest point on every edge, then the closest of the three
+    t = np.clip((to_point * edges).sum(axis=-1) / (edges * edges).sum(axis=-1), 0.0, 1.0)
+    closest = corners + t[..., np.newaxis] * edges      # (..., 3, 2)
+    distances = ((closest - xy[..., np.newaxis, :]) ** 2).sum(axis=-1)
+    nearest = np.take_along_axis(closest, distances.argmin(axis=-1)[..., np.newaxis, np.newaxis], axis=-2)[..., 0, :]
+
+    return np.where(inside[..., np.newaxis], xy, nearest)
+
+
+class GamutConverter:
+    """Converts RGB colors into xy + brightness clamped into a single gamut.
+
+    For 8-bit input, a lookup table of the whole RGB cube quantized to lut_levels per channel is built on first use,
+    so converting a frame is one fancy index instead of the full conversion. Instances are shared per gamut through
+    converter_for.
+    """
+
+    def __init__(self, triangle: GamutTriangle, lut_levels: int = 64):
+        """Constructor.
+
+        Args:
+            triangle (GamutTriangle): Red, green and blue corners of the gamut
+            lut_levels (int): Levels per channel of the 8-bit lookup table, a power of 2 up to 256. The table holds
+                lut_levels ** 3 colors. Defaults to 64.
+        """
+
+        if lut_levels < 2 or lut_levels > 256 or lut_levels & (lut_levels - 1):
+            raise ValueError(f'lut_levels must be a power of 2 between 2 and 256, got {lut_levels}')
+
+        self.triangle = triangle
+        self.lut_levels = lut_levels
+        self._triangle = np.array(triangle, dtype=np.float64)
+        self._bits = lut_levels.bit_length() - 1
+        self._lut: Optional[np.ndarray] = None
+
+    def convert(self, rgb: np.ndarray) -> np.ndarray:
+        """Converts colors exactly.
+
+        Args:
+            rgb (np.ndarray): Array of shape (..., 3), uint8 in [0, 255] or floats in [0.0, 1.0]
+
+        Returns:
+            np.ndarray: Array of shape (..., 3) of (x, y, brightness)
+        """
+
+        result = rgb_to_xy_brightness(rgb)
+        result[..., :2] = clamp_to_gamut(result[..., :2], self._triangle)
+        return result
+
+    @property
+    def lut(self) -> np.ndarray:
+        """(x, y, brightness) of every quantized RGB color, of shape (lut_levels ** 3, 3)."""
+
+        if self._lut is None:
+            # Center of every quantization step, so the error is at most half a step in each direction
+            step = 256 // self.lut_levels
+            levels = (np.arange(self.lut_levels) * step + (step - 1) / 2.0) / 255.0
+            r, g, b = np.meshgrid(levels, levels, levels, indexing='ij')
+            self._lut = self.convert(np.stack([r.ravel(), g.ravel(), b.ravel()], axis=-1)).astype(np.float32)
+        return self._lut
+
+    def convert_uint8(self, rgb: np.ndarray) -> np.ndarray:
+        """Converts 8-bit colors through the lookup table.
+
+        Args:
+            rgb (np.ndarray): uint8 array of shape (..., 3)
+
+        Returns:
+            np.ndarray: float32 array of shape (..., 3) of (x, y, brightness)
+        """
+
+        quantized = (np.asarray(rgb, dtype=np.uint8) >> (8 - self._bits)).astype(np.intp)
+        index = (quantized[..., 0] << (2 * self._bits)) | (quantized[..., 1] << self._bits) | quantized[..., 2]
+        return self.lut[index]
+
+
+@lru_cache(maxsize=32)
+def converter_for(triangle: GamutTriangle, lut_levels: int = 64) -> GamutConverter:
+    """Returns the shared GamutConverter of a gamut, so lookup tables are only built once per gamut."""
+
+    return GamutConverter(triangle, lut_levels=lut_levels)
+
+
+class LightColorConverter:
+    """Converts one RGB color per light into xy + brightness clamped into each light's own gamut.
+
+    The gamut triangles of the lights are stacked once, so converting a frame for every light is a handful of NumPy
+    operations no matter how many different gamuts the lights have.
+    """
+
+    def __init__(self, lights: Sequence[Light]):
+        """Constructor.
+
+        Args:
+            lights (Sequence[Light]): Lights in the order colors will be provided
+        """
+
+        self.light_ids = [light.id for light in lights]
+        self.triangles = [gamut_triangle(light.color) for light in lights]
+        self._triangles = np.array(self.triangles, dtype=np.float64).reshape(len(self.triangles), 3, 2)
+
+        # Light indexes per distinct gamut, for the lookup table path
+        groups: Dict[GamutTriangle, List[int]] = {}
+        for idx, triangle in enumerate(self.triangles):
+            groups.setdefault(triangle, []).append(idx)
+        self._groups = {triangle: np.array(indexes, dtype=np.intp) for triangle, indexes in groups.items()}
+
+    def convert(self, rgb: np.ndarray) -> np.ndarray:
+        """Converts a frame of colors.
+
+        Args:
+            rgb (np.ndarray): Array of shape (lights, 3) or (frames, lights, 3), uint8 in [0, 255] or floats in
+                [0.0, 1.0]
+
+        Returns:
+            np.ndarray: Array of the same shape of (x, y, brightness), e.g. values for HueStreamFrame.encode when
+                streaming StreamColorSpace.XY_BRIGHTNESS
+        """
+
+        result = rgb_to_xy_brightness(rgb)
+        result[..., :2] = clamp_to_gamut(result[..., :2], self._triangles)
+        return result
+
+    def convert_uint8(self, rgb: np.ndarray) -> np.ndarray:
+        """Converts a frame of 8-bit colors through the shared lookup table of each gamut, see GamutConverter.
+
+        Args:
+            rgb (np.ndarray): uint8 array of shape (lights, 3)
+
+        Returns:
+            np.ndarray: float32 array of shape (lights, 3) of (x, y, brightness)
+        """
+
+        result = np.empty((len(self.light_ids), 3), dtype=np.float32)
+        for triangle, indexes in self._groups.items():
+            result[indexes] = converter_for(triangle).convert_uint8(rgb[indexes])
+        return result
@@ -169,3 +169,13 @@ class ResourceType(Enum):
 class SignalStatus(Enum):
     NO_SIGNAL='no_signal'
     ON_OFF='on_off'
+
+
+class EntertainmentAction(Enum):
+    START='start'
+    STOP='stop'
+
+
+class StreamColorSpace(Enum):
+    RGB=0
+    XY_BRIGHTNESS=1
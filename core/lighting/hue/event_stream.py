@@ -0,0 +1,528 @@
+"""Live local mirror of bridge state, kept up to date through the CLIP v2 server-sent event stream.
+
+Reading state through HueClient.list re-downloads and re-parses every resource of a type. Instead, HueStateMirror is
+loaded once and EventStreamSubscriber applies the incremental add/update/delete events that the bridge pushes, so
+reading the current state does not touch the network. Whenever the stream drops, the mirror is fully resynced before
+events are applied again, because events sent while disconnected are lost.
+
+NOTE: https://developers.meethue.com/develop/hue-api-v2/core-concepts/#events
+"""
+import copy
+import http.server
+import json
+import logging
+import queue
+import socket
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type, cast
+
+import requests
+from dataclasses_json import DataClassJsonMixin
+
+from core.exceptions import LibraryException
+from core.lighting.hue.client import RESOURCE_CLASSES, HueClient
+from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.objects.device import Device
+from core.lighting.hue.objects.entertainment_configuration import EntertainmentConfiguration
+from core.lighting.hue.objects.light import Light
+from core.lighting.hue.objects.room import Room
+
+_logger = logging.getLogger(__name__)
+
+EVENT_ADD = 'add'
+EVENT_UPDATE = 'update'
+EVENT_DELETE = 'delete'
+
+# Callback signature: (event type, resource type, resource id, decoded object or None if it was deleted)
+MirrorListener = Callable[[str, ResourceType, str, Optional[DataClassJsonMixin]], None]
+
+
+def _deep_merge(target: dict, update: dict):
+    """Merges a partial update into a JSON-style dict in place. Nested dicts are merged, everything else replaced."""
+
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class HueStateMirror:
+    """In-memory mirror of the Light, Device, EntertainmentConfiguration and Room resources of a bridge.
+
+    An update only carries the fields that changed, so updates of resources the mirror does not hold are ignored and
+    counted in events_ignored. They are picked up with the next resync.
+    """
+
+    TRACKED_RESOURCES: Dict[ResourceType, Type[DataClassJsonMixin]] = dict(RESOURCE_CLASSES)
+    _TRACKED_NAMES = {resource_type.value: resource_type for resource_type in TRACKED_RESOURCES}
+
+    def __init__(self):
+        self._raw: Dict[ResourceType, Dict[str, dict]] = {resource_type: {} for resource_type in self.TRACKED_RESOURCES}
+        self._objects: Dict[ResourceType, Dict[str, DataClassJsonMixin]] = {
+            resource_type: {} for resource_type in self.TRACKED_RESOURCES
+        }
+        self._lock = threading.RLock()
+        self._listeners: List[MirrorListener] = []
+
+        self.events_applied = 0
+        self.events_ignored = 0
+        self.resyncs = 0
+
+    def add_listener(self, listener: MirrorListener):
+        """Registers a callback which is called after every change applied to the mirror."""
+
+        self._listeners.append(listener)
+
+    def _notify(self, event_type: str, resource_type: ResourceType, resource_id: str,
+                resource: Optional[DataClassJsonMixin]):
+        for listener in self._listeners:
+            try:
+                listener(event_type, resource_type, resource_id, resource)
+            except Exception:
+                _logger.debug('Mirror listener failed', exc_info=True)
+
+    def _decode(self, resource_type: ResourceType, resource_id: str):
+        """Decodes the raw dict of a resource into its dataclass, keeping the previous object if it fails."""
+
+        try:
+            resource = self.TRACKED_RESOURCES[resource_type].from_dict(self._raw[resource_type][resource_id])
+        except (KeyError, ValueError, TypeError):
+            _logger.debug(f'Unable to decode {resource_type.value} {resource_id}', exc_info=True)
+            return self._objects[resource_type].get(resource_id)
+
+        self._objects[resource_type][resource_id] = resource
+        return resource
+
+    def load(self, resource_type: ResourceType, items: List[dict]):
+        """Replaces every resource of a type with a full listing from the bridge.
+
+        Args:
+            resource_type (ResourceType): Type of the listed resources
+            items (List[dict]): The 'data' of a GET /resource/<type> response
+        """
+
+        with self._lock:
+            removed_ids = set(self._raw[resource_type]) - {item['id'] for item in items}
+
+            self._raw[resource_type] = {item['id']: copy.deepcopy(item) for item in items}
+            self._objects[resource_type] = {}
+            for resource_id in self._raw[resource_type]:
+                resource = self._decode(resource_type, resource_id)
+                if resource is not None:
+                    self._notify(EVENT_ADD, resource_type, resource_id, resource)
+
+            for resource_id in removed_ids:
+                self._notify(EVENT_DELETE, resource_type, resource_id, None)
+
+    def resync(self, client: HueClient):
+        """Reloads every tracked resource type from the bridge with a single request.
+
+        Args:
+            client (HueClient): Client used to list the resources
+        """
+
+        listings: Dict[ResourceType, List[dict]] = {resource_type: [] for resource_type in self.TRACKED_RESOURCES}
+        for item in client.get_resource()['data']:
+            resource_type = self._TRACKED_NAMES.get(item.get('type'))
+            if resource_type is not None:
+                listings[resource_type].append(item)
+
+        with self._lock:
+            for resource_type, items in listings.items():
+                self.load(resource_type, items)
+            self.resyncs += 1
+
+        _logger.debug(f'Resynced mirror: { {t.value: len(o) for t, o in self._objects.items()} }')
+
+    def apply_event(self, event: dict):
+        """Applies a single event from the event stream.
+
+        Args:
+            event (dict): An event with a 'type' of add, update or delete and a 'data' list of (partial) resources
+        """
+
+        event_type = event.get('type', '')
+
+        with self._lock:
+            for item in event.get('data', []):
+                try:
+                    resource_type = ResourceType(item.get('type'))
+                except ValueError:
+                    continue
+                if resource_type not in self.TRACKED_RESOURCES:
+                    continue
+
+                resource_id = item['id']
+                raw = self._raw[resource_type]
+
+                if event_type == EVENT_DELETE:
+                    raw.pop(resource_id, None)
+                    self._objects[resource_type].pop(resource_id, None)
+                    resource = None
+                elif event_type == EVENT_ADD:
+                    raw[resource_id] = copy.deepcopy(item)
+                    resource = self._decode(resource_type, resource_id)
+                    if resource is None:
+                        raw.pop(resource_id)
+                        self.events_ignored += 1
+                        continue
+                elif event_type == EVENT_UPDATE:
+                    if resource_id not in raw:
+                        _logger.debug(f'Ignoring update of unknown {resource_type.value} {resource_id}')
+                        self.events_ignored += 1
+                        continue
+                    _deep_merge(raw[resource_id], item)
+                    resource = self._decode(resource_type, resource_id)
+                else:
+                    continue
+
+                self.events_applied += 1
+                self._notify(event_type, resource_type, resource_id, resource)
+
+    def get(self, resource_type: ResourceType, resource_id: str) -> Optional[DataClassJsonMixin]:
+        """Returns the mirrored resource of a type by id, or None if it is unknown."""
+
+        with self._lock:
+            return self._objects[resource_type].get(resource_id)
+
+    def all(self, resource_type: ResourceType) -> List[DataClassJsonMixin]:
+        """Returns every mirrored resource of a type."""
+
+        with self._lock:
+            return list(self._objects[resource_type].values())
+
+    def lights(self) -> List[Light]:
+        return cast(List[Light], self.all(ResourceType.LIGHT))
+
+    def devices(self) -> List[Device]:
+        return cast(List[Device], self.all(ResourceType.DEVICE))
+
+    def entertainment_configurations(self) -> List[EntertainmentConfiguration]:
+        return cast(List[EntertainmentConfiguration], self.all(ResourceType.ENTERTAINMENT_CONFIGURATION))
+
+    def rooms(self) -> List[Room]:
+        return cast(List[Room], self.all(ResourceType.ROOM))
+
+
+def parse_event_stream(lines: Iterable[str]) -> Iterator[dict]:
+    """Parses server-sent event lines into Hue events, yielding each event as soon as its message is complete.
+
+    Args:
+        lines (Iterable[str]): Decoded lines of the event stream, without line endings
+
+    Yields:
+        dict: Every Hue event contained in each message
+    """
+
+    data_lines: List[str] = []
+    for line in lines:
+        if line is None:
+            continue
+
+        if line == '':
+            if data_lines:
+                try:
+                    events = json.loads('\n'.join(data_lines))
+                except json.JSONDecodeError:
+                    _logger.debug(f'Dropping malformed event stream message: {data_lines}')
+                    events = []
+                data_lines = []
+
+                for event in events:
+                    yield event
+        elif line.startswith(':'):
+            continue  # Comment, the bridge sends ': hi' when a stream is opened
+        elif line.startswith('data:'):
+            data_lines.append(line[5:].lstrip(' '))
+
+
+class EventStreamSubscriber:
+    """Keeps a HueStateMirror in sync with a bridge on a background thread."""
+
+    def __init__(
+        self,
+        client: HueClient,
+        mirror: Optional[HueStateMirror] = None,
+        connect_timeout: float = 3.05,
+        read_timeout: Optional[float] = None,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0
+    ):
+        """Constructor.
+
+        Args:
+            client (HueClient): Client whose bridge is mirrored
+            mirror (Optional[HueStateMirror]): Mirror to keep in sync. If None, a new one is created. Defaults to None.
+            connect_timeout (float): Seconds to wait for the stream to connect. Defaults to 3.05.
+            read_timeout (Optional[float]): Seconds without any data after which the stream is considered dead and
+                reconnected. The bridge may be silent for a long time, so defaults to None (no timeout).
+            reconnect_delay (float): Initial delay before reconnecting in seconds, doubled after every consecutive
+                failure. Defaults to 1.0.
+            max_reconnect_delay (float): Upper bound on the reconnect delay in seconds. Defaults to 30.0.
+        """
+
+        self.client = client
+        self.mirror = mirror if mirror is not None else HueStateMirror()
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._stop_event = threading.Event()
+        self._synced_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._response: Optional[requests.Response] = None
+
+        self.connections = 0
+        self.last_event_id: Optional[str] = None
+
+    def start(self, wait_for_sync: bool = True, timeout: Optional[float] = 10.0):
+        """Starts the subscriber thread.
+
+        Args:
+            wait_for_sync (bool): If True, blocks until the first full resync completed. Defaults to True.
+            timeout (Optional[float]): Seconds to wait for the first resync. Defaults to 10.0.
+        """
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='EventStreamSubscriber', daemon=True)
+        self._thread.start()
+
+        if wait_for_sync and not self._synced_event.wait(timeout):
+            raise LibraryException(f'Event stream subscriber did not sync within {timeout}s')
+
+    def stop(self):
+        """Stops the subscriber thread and closes the stream."""
+
+        self._stop_event.set()
+
+        # Closing the response from this thread blocks while the subscriber thread is reading from it, shutting down
+        # the socket instead wakes the reader up
+        response = self._response
+        connection = getattr(response.raw, 'connection', None) if response is not None else None
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        delay = self.reconnect_delay
+
+        while not self._stop_event.is_set():
+            try:
+                self._response = self.client.transport.get(
+                    self.client.event_stream_endpoint,
+                    headers={
+                        'hue-application-key': self.client.application_key.username,
+                        'Accept': 'text/event-stream'
+                    },
+                    stream=True,
+                    timeout=(self.connect_timeout, self.read_timeout)
+                )
+                self._response.raise_for_status()
+                self.connections += 1
+
+                # Events that happened while disconnected are lost, so resync only after the stream is open
+                self.mirror.resync(self.client)
+                self._synced_event.set()
+                delay = self.reconnect_delay
+
+                # Chunked streams can be split on chunk boundaries, anything else has to be read byte by byte so that
+                # events are not held back waiting for a full read buffer
+                chunk_size = None if self._response.raw.chunked else 1
+                lines = (line.decode('utf-8') for line in self._response.iter_lines(chunk_size=chunk_size))
+
+                for event in parse_event_stream(lines):
+                    self.mirror.apply_event(event)
+                    self.last_event_id = event.get('id')
+
+                _logger.info('Event stream closed by the bridge, reconnecting')
+            except (requests.RequestException, LibraryException, OSError) as e:
+                if self._stop_event.is_set():
+                    break
+                _logger.info(f'Event stream failed, reconnecting in {delay:.1f}s: {e}')
+                _logger.debug('', exc_info=True)
+                self._stop_event.wait(delay)
+                delay = min(delay * 2.0, self.max_reconnect_delay)
+            finally:
+                if self._response is not None:
+                    self._response.close()
+                    self._response = None
+
+    def __enter__(self) -> 'EventStreamSubscriber':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class LocalEventStreamServer:
+    """A local stand-in for the bridge's resource listing and event stream endpoints, used for testing.
+
+    Serves GET /clip/v2/resource/<type> from an in-memory state and pushes events published through publish() to
+    every open /eventstream/clip/v2 connection. disconnect_all() drops open streams to exercise reconnects.
+    """
+
+    def __init__(self, resources: Optional[Dict[ResourceType, List[dict]]] = None, host: str = '127.0.0.1',
+                 port: int = 0):
+        """Constructor.
+
+        Args:
+            resources (Optional[Dict[ResourceType, List[dict]]]): Initial JSON-style resources by type.
+                Defaults to None.
+            host (str): Address to bind to. Defaults to 127.0.0.1.
+            port (int): Port to bind to, 0 picks a free port. Defaults to 0.
+        """
+
+        self._resources: Dict[str, Dict[str, dict]] = {}
+        for resource_type, items in (resources or {}).items():
+            self._resources[resource_type.value] = {item['id']: copy.deepcopy(item) for item in items}
+        self._lock = threading.Lock()
+        self._streams: List[queue.Queue] = []
+        self._event_id = 0
+
+        server = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Headers and body go out in separate writes, Nagle would delay the body
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._do_get(self)
+
+            def do_PUT(self):
+                server._do_put(self)
+
+            def do_POST(self):
+                server._do_post(self)
+
+        self._server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return cast(Tuple[str, int], self._server.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='LocalEventStreamServer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.disconnect_all()
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'LocalEventStreamServer':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _do_get(self, handler: http.server.BaseHTTPRequestHandler):
+        if handler.path.startswith('/eventstream/'):
+            self._serve_stream(handler)
+        elif handler.path.rstrip('/') == '/clip/v2/resource':
+            self._serve_listing(handler, None)
+        elif handler.path.startswith('/clip/v2/resource/'):
+            self._serve_listing(handler, handler.path[len('/clip/v2/resource/'):])
+        else:
+            handler.send_error(404)
+
+    def _do_put(self, handler: http.server.BaseHTTPRequestHandler):
+        handler.send_error(405)
+
+    def _do_post(self, handler: http.server.BaseHTTPRequestHandler):
+        handler.send_error(405)
+
+    def _serve_listing(self, handler: http.server.BaseHTTPRequestHandler, resource_name: Optional[str]):
+        with self._lock:
+            if resource_name is None:
+                items = [item for resources in self._resources.values() for item in resources.values()]
+            else:
+                items = list(self._resources.get(resource_name, {}).values())
+        body = json.dumps({'errors': [], 'data': items}).encode()
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _serve_stream(self, handler: http.server.BaseHTTPRequestHandler):
+        messages: queue.Queue = queue.Queue()
+        with self._lock:
+            self._streams.append(messages)
+
+        handler.close_connection = True
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+
+        def write_chunk(data: bytes):
+            handler.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            handler.wfile.flush()
+
+        try:
+            write_chunk(b': hi\n\n')
+            while True:
+                message = messages.get()
+                if message is None:
+                    break
+                write_chunk(message)
+            write_chunk(b'')
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                if messages in self._streams:
+                    self._streams.remove(messages)
+
+    def publish(self, event_type: str, items: List[dict]):
+        """Applies an event to the served state and pushes it to every open stream.
+
+        Args:
+            event_type (str): add, update or delete
+            items (List[dict]): (Partial) resources, each with at least an 'id' and a 'type'
+        """
+
+        with self._lock:
+            for item in items:
+                resources = self._resources.setdefault(item['type'], {})
+                if event_type == EVENT_DELETE:
+                    resources.pop(item['id'], None)
+                elif event_type == EVENT_UPDATE and item['id'] in resources:
+                    _deep_merge(resources[item['id']], item)
+                else:
+                    resources[item['id']] = copy.deepcopy(item)
+
+            self._event_id += 1
+            event = {'id': str(self._event_id), 'type': event_type, 'data': items}
+            message = f'id: {self._event_id}:0\ndata: {json.dumps([event])}\n\n'.encode()
+            for stream in self._streams:
+                stream.put(message)
+
+    def disconnect_all(self):
+        """Closes every open event stream, as the bridge does when it restarts."""
+
+        with self._lock:
+            for stream in self._streams:
+                stream.put(None)
+            self._streams = []
@@ -0,0 +1,216 @@
+"""Drives gradient lights, e.g. gradient light strips, from spectral bands.
+
+A gradient light shows up to 5 color points, interpolated along its length by the bridge. GradientRenderer spreads the
+bands of every FeatureFrame over those points, low bands on the first point, and packs the result either into the
+REST gradient of a Light or into per-segment colors for entertainment channels whose members address the light's
+segments (EntertainmentChannelSegment.index).
+
+Every point is quantized, xy to a step just below what is visible and brightness to a few percent, and update() only
+reports a change once a point moved by at least a full step from the gradient last emitted. Small fluctuations, and
+values dithering around a rounding boundary, thus never turn into commands, which keeps the extra points from
+multiplying the command rate against the bridge.
+"""
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+import numpy as np
+
+from core.lighting.hue.color import GamutTriangle, converter_for, gamut_triangle
+from core.lighting.hue.enums import SupportedGradientMode
+from core.lighting.hue.objects.color import Color, _CIEXYGamut
+from core.lighting.hue.objects.entertainment_configuration import EntertainmentConfiguration
+from core.lighting.hue.objects.light import Light, _GradientPoint
+from core.lighting.hue.spatial import default_band_colors
+
+if TYPE_CHECKING:
+    from core.audio.features import FeatureFrame
+
+MAX_GRADIENT_POINTS = 5
+
+
+def choose_gradient_mode(mode_values: Sequence[SupportedGradientMode], mirrored: bool = False) -> SupportedGradientMode:
+    """Returns the interpolated mode to render with, mirrored if requested and supported.
+
+    Raises:
+        ValueError: If the light supports no interpolated mode, random_pixelated cannot show bands in order
+    """
+
+    preferred = [SupportedGradientMode.INTERPOLATED_PALETTE]
+    if mirrored:
+        preferred.insert(0, SupportedGradientMode.INTERPOLATED_PALETTE_MIRRORED)
+
+    for mode in preferred:
+        if mode in mode_values:
+            return mode
+    raise ValueError(f'No interpolated gradient mode among {[mode.value for mode in mode_values]}')
+
+
+def segment_channels(configuration: EntertainmentConfiguration, service_id: str) -> List[int]:
+    """Returns the ids of the channels addressing segments of an entertainment service, ordered by segment index."""
+
+    segments = []
+    for channel in configuration.channels:
+        for member in channel.members:
+            if member.service.rid == service_id:
+                segments.append((member.index, channel.channel_id))
+    return [channel_id for _, channel_id in sorted(segments)]
+
+
+def _interpolation_weights(source_count: int, target_count: int) -> np.ndarray:
+    """Returns (target_count, source_count) weights spreading evenly spaced sources over evenly spaced targets.
+
+    Every row sums to 1, and every target blends the sources nearest to it with a triangular falloff.
+    """
+
+    sources = (np.arange(source_count) + 0.5) / source_count
+    targets = (np.arange(target_count) + 0.5) / target_count
+    width = 1.0 / min(source_count, target_count)
+    weights = np.maximum(0.0, 1.0 - np.abs(targets[:, np.newaxis] - sources[np.newaxis, :]) / width)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+class GradientRenderer:
+    """Maps FeatureFrames onto the points of a gradient light, emitting only when the quantized gradient changes."""
+
+    def __init__(
+        self,
+        point_count: int,
+        mode: SupportedGradientMode,
+        band_count: int,
+        triangle: Optional[GamutTriangle] = None,
+        xy_step: float = 0.005,
+        brightness_step: float = 2.0,
+        min_brightness: float = 1.0,
+        peak_decay: float = 0.999
+    ):
+        """Constructor.
+
+        Args:
+            point_count (int): Points of the gradient, at most MAX_GRADIENT_POINTS
+            mode (SupportedGradientMode): An interpolated mode, see choose_gradient_mode. With the mirrored mode,
+                the first point is in the middle of the light and the last at both ends.
+            band_count (int): Number of bands of the FeatureFrames, see FeatureExtractor
+            triangle (Optional[GamutTriangle]): Gamut of the light. Defaults to gamut C.
+            xy_step (float): Quantization step of the xy of every point. Defaults to 0.005.
+            brightness_step (float): Quantization step of brightness in percent. Defaults to 2.
+            min_brightness (float): Brightness below which the light is turned off, in percent. Defaults to 1.
+            peak_decay (float): Per frame decay of the running peak every band is normalized by. Defaults to 0.999.
+        """
+
+        if not 1 < point_count <= MAX_GRADIENT_POINTS:
+            raise ValueError(f'Gradients have 2 to {MAX_GRADIENT_POINTS} points, got {point_count}')
+
+        self.point_count = point_count
+        self.mode = mode
+        self.band_count = band_count
+        self.xy_step = xy_step
+        self.brightness_step = brightness_step
+        self.min_brightness = min_brightness
+        self.peak_decay = peak_decay
+        self._converter = converter_for(triangle if triangle is not None else gamut_triangle(None))
+
+        # Point color is the level weighted mix of the colors of its bands
+        self._weights = _interpolation_weights(band_count, point_count)
+        self._band_colors = default_band_colors(band_count)
+        self._peaks = np.full(band_count, 1e-9)
+        self._levels = np.zeros(band_count)
+
+        # Latest quantized gradient, the state emitted on change
+        self.point_rgb = np.zeros((point_count, 3))  # Colors in [0.0, 1.0] with their level applied
+        self.point_xy: np.ndarray = np.zeros((point_count, 2))
+        self.brightness = 0.0                         # Percent, of the brightest point
+        self._point_levels: np.ndarray = np.zeros(point_count)    # Percent
+        self._emitted = False
+
+        self.frames = 0
+        self.changes = 0
+
+    @classmethod
+    def for_light(cls, light: Light, band_count: int, mirrored: bool = False, **kwargs) -> 'GradientRenderer':
+        """Returns a renderer for the gradient of a light.
+
+        Raises:
+            ValueError: If the light has no gradient
+        """
+
+        if light.gradient is None:
+            raise ValueError(f'Light {light.id} has no gradient')
+
+        return cls(
+            min(light.gradient.points_capable, MAX_GRADIENT_POINTS),
+            choose_gradient_mode(light.gradient.mode_values, mirrored),
+            band_count,
+            triangle=gamut_triangle(light.color),
+            **kwargs
+        )
+
+    def update(self, frame: 'FeatureFrame') -> bool:
+        """Renders a frame. Returns True if the quantized gradient changed, i.e. if it should be sent."""
+
+        self.frames += 1
+
+        np.multiply(self._peaks, self.peak_decay, out=self._peaks)
+        np.maximum(self._peaks, frame.bands, out=self._peaks)
+        np.divide(frame.bands, self._peaks, out=self._levels)
+
+        mixed = self._weights @ (self._band_colors * self._levels[:, np.newaxis])
+        levels = self._weights @ self._levels
+        brightest = np.max(mixed, axis=1, keepdims=True)
+        colors = np.divide(mixed, brightest, out=np.zeros_like(mixed), where=brightest > 0.0)
+
+        xy = self._converter.convert(colors)[:, :2]
+        if self._emitted and np.all(np.abs(xy - self.point_xy) < self.xy_step) and \
+                np.all(np.abs(levels * 100.0 - self._point_levels) < self.brightness_step):
+            return False
+
+        self._emitted = True
+        self.changes += 1
+        self.point_xy = np.round(xy / self.xy_step) * self.xy_step
+        self._point_levels = np.round(levels * 100.0 / self.brightness_step) * self.brightness_step
+        self.point_rgb = colors * np.clip(self._point_levels / 100.0, 0.0, 1.0)[:, np.newaxis]
+        self.brightness = float(min(np.max(self._point_levels), 100.0))
+        return True
+
+    def rest_payload(self) -> dict:
+        """Returns the gradient as a JSON-style PUT body for /resource/light."""
+
+        on = self.brightness >= self.min_brightness
+        body = {
+            'on': {'on': on},
+            'gradient': {
+                'points': [
+                    {'color': {'xy': {'x': round(x, 4), 'y': round(y, 4)}}} for x, y in self.point_xy.tolist()
+                ],
+                'mode': self.mode.value,
+            },
+        }
+        if on:
+            body['dimming'] = {'brightness': round(self.brightness, 1)}
+        return body
+
+    def apply_to_light(self, light: Light):
+        """Writes the gradient into a Light, e.g. before HueClient.put_light or CommandScheduler.submit."""
+
+        if light.gradient is None:
+            raise ValueError(f'Light {light.id} has no gradient')
+
+        light.gradient.mode = self.mode
+        light.gradient.points = [
+            _GradientPoint(Color(_CIEXYGamut(round(x, 4), round(y, 4)))) for x, y in self.point_xy.tolist()
+        ]
+        light.on.on = self.brightness >= self.min_brightness
+        if light.dimming is not None and light.on.on:
+            light.dimming.brightness = round(self.brightness, 1)
+
+    def segment_colors(self, segment_count: int) -> np.ndarray:
+        """Returns the gradient interpolated over segments, RGB in [0.0, 1.0] of shape (segment_count, 3).
+
+        Colors are in segment index order, ready for the channels returned by segment_channels.
+        """
+
+        if self.mode == SupportedGradientMode.INTERPOLATED_PALETTE_MIRRORED:
+            # Interpolate over one half and mirror it, first point in the middle
+            half = (segment_count + 1) // 2
+            colors = _interpolation_weights(self.point_count, half) @ self.point_rgb
+            return np.concatenate((colors[::-1], colors[segment_count % 2:]))
+
+        return _interpolation_weights(self.point_count, segment_count) @ self.point_rgb
@@ -0,0 +1,133 @@
+"""Base class of all Hue objects."""
+import json
+from typing import TYPE_CHECKING, Optional, Type, TypeVar, cast
+
+from dataclasses_json import DataClassJsonMixin
+from dataclasses_json.core import Json, _asdict, _ExtendedEncoder
+
+from core.lighting.hue.objects.decoder import decoder_for
+
+
+if TYPE_CHECKING:
+    # The registration below makes HueObject a DataClassJsonMixin at runtime, type checkers need to see it declared
+    _HueObjectBase = DataClassJsonMixin
+else:
+    _HueObjectBase = object
+
+_HueObjectT = TypeVar('_HueObjectT', bound='HueObject')
+
+
+class HueObject(_HueObjectBase):
+    """Drop-in replacement for DataClassJsonMixin on the Hue dataclasses.
+
+    DataClassJsonMixin does not declare __slots__, so every instance of a class that inherits from it carries a
+    __dict__ even when the dataclass itself is slotted. HueObject declares empty __slots__, decodes through a compiled
+    decoder (see core.lighting.hue.objects.decoder) instead of walking type hints on every call, and encodes through
+    dataclasses_json. It is registered as a virtual subclass of DataClassJsonMixin so existing type checks still hold.
+
+    Subclasses are declared with @dataclass(slots=True).
+    """
+
+    __slots__ = ()
+
+    dataclass_json_config = None
+
+    @classmethod
+    def from_dict(cls: Type[_HueObjectT], kvs: Json, *, infer_missing: bool = False) -> _HueObjectT:
+        return decoder_for(cls)(cast(dict, kvs))
+
+    @classmethod
+    def from_json(cls: Type[_HueObjectT], s, *, parse_float=None, parse_int=None, parse_constant=None,
+                  infer_missing: bool = False, **kw) -> _HueObjectT:
+        kvs = json.loads(s, parse_float=parse_float, parse_int=parse_int, parse_constant=parse_constant, **kw)
+        return cls.from_dict(kvs, infer_missing=infer_missing)
+
+    def to_dict(self, encode_json: bool = False) -> dict:
+        return _asdict(self, encode_json=encode_json)
+
+    def to_json(self, **kw) -> str:
+        return json.dumps(self.to_dict(encode_json=False), cls=_ExtendedEncoder, **kw)
+
+
+DataClassJsonMixin.register(HueObject)
+
+
+class TrackedHueObject(HueObject):
+    """A HueObject whose writable state is tracked, so that a PUT only carries the fields that actually changed.
+
+    The writable state is snapshotted when the object is created (i.e. decoded from the bridge) and whenever
+    mark_clean() is called after a successful PUT. to_put() diffs the current state against that snapshot, which also
+    catches changes made to nested objects and lists in place. Subclasses implement _put_state().
+
+    The object may change while a PUT is in flight, so a PUT is built from a snapshot() and that same snapshot is
+    passed to mark_clean(). Changes made in the meantime then stay dirty and go out with the next PUT:
+
+        state = light.snapshot()
+        client.put_resource(f'light/{light.id}', light.to_put(state))
+        light.mark_clean(state)
+    """
+
+    __slots__ = ('_clean_state',)
+
+    def __post_init__(self):
+        self._clean_state = self._put_state()
+
+    def _put_state(self) -> dict:
+        """Returns the full writable state of self as a JSON-style PUT body."""
+
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        """Returns the current writable state, to build a PUT from with to_put and to pass to mark_clean after it."""
+
+        return self._put_state()
+
+    def mark_clean(self, state: dict):
+        """Marks a state as known to the bridge, typically after a successful PUT.
+
+        Args:
+            state (dict): The snapshot() the PUT was built from, not the current state, which may have changed
+                while the request was in flight
+        """
+
+        self._clean_state = state
+
+    def mark_unknown(self):
+        """Forgets which state the bridge has, so the next to_put returns the full state. Used for objects that were
+        not decoded from a response of the bridge, e.g. loaded from a cache which may be stale."""
+
+        self._clean_state = None
+
+    def to_put(self, state: Optional[dict] = None) -> dict:
+        """Returns a JSON-style PUT body containing only the state that changed since the object was last clean.
+
+        An empty dict means nothing changed and no request needs to be sent.
+
+        Args:
+            state (Optional[dict]): A snapshot() to diff, see mark_clean. Defaults to None, i.e. the current state.
+        """
+
+        if state is None:
+            state = self._put_state()
+        clean_state = getattr(self, '_clean_state', None)
+        if clean_state is None:
+            return state  # e.g. after a copy, the snapshot is not carried over so everything is sent
+
+        body = {}
+        for key, value in state.items():
+            clean_value = clean_state.get(key)
+            if value == clean_value:
+                continue
+
+            if isinstance(value, dict) and isinstance(clean_value, dict):
+                body[key] = {
+                    sub_key: sub_value for sub_key, sub_value in value.items() if clean_value.get(sub_key) != sub_value
+                }
+            else:
+                body[key] = value
+
+        return body
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self.to_put())
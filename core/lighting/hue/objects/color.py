@@ -1,13 +1,12 @@
 from dataclasses import dataclass
 from typing import List, Optional
 
-from dataclasses_json import DataClassJsonMixin
-
 from core.lighting.hue.enums import GamutType
+from core.lighting.hue.objects.base import HueObject
 
 
-@dataclass
-class _CIEXYGamut(DataClassJsonMixin):
+@dataclass(slots=True)
+class _CIEXYGamut(HueObject):
     """A CIE XY gamut position. 
     
     NOTE: https://spec.oneapi.io/oneipl/0.6/concepts/cie-chromaticity-diagram-and-color-gamut.html"""
@@ -16,15 +15,15 @@ class _CIEXYGamut(DataClassJsonMixin):
     y: float # [0.0, 1.0]
 
 
-@dataclass
-class _RGBGamut(DataClassJsonMixin):
+@dataclass(slots=True)
+class _RGBGamut(HueObject):
     red: _CIEXYGamut
     green: _CIEXYGamut
     blue: _CIEXYGamut
 
 
-@dataclass
-class Color(DataClassJsonMixin):
+@dataclass(slots=True)
+class Color(HueObject):
     """How light Color data is structured in the Hue API."""
     
     xy: _CIEXYGamut
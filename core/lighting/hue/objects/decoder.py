@@ -0,0 +1,152 @@
+"""Compiled dict -> dataclass decoders for the Hue objects.
+
+dataclasses_json walks the type hints of every field, reflectively, on every call to from_dict. Since the Hue objects
+never change at runtime, the type hints are resolved once per class instead, and a specialized decoder function is
+generated from them. The generated function is plain Python with one expression per field, for example:
+
+    def decode_Color(d):
+        return cls(
+            xy=_decode_0(d['xy']),
+            gamut_type=(_decode_1(_v1) if (_v1 := d.get('gamut_type')) is not None else None),
+            gamut=(_decode_2(_v2) if (_v2 := d.get('gamut')) is not None else None)
+        )
+"""
+import dataclasses
+from datetime import datetime, timezone
+from enum import Enum
+import threading
+from types import NoneType
+import typing
+from typing import Any, Callable, Dict, Union
+
+Decoder = Callable[[dict], Any]
+
+_decoders: Dict[type, Decoder] = {}
+_decoders_lock = threading.RLock()
+
+
+def _decode_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+def _optional_type(type_hint: Any) -> Any:
+    """Returns X for Optional[X], or None if the type hint is not Optional."""
+
+    if typing.get_origin(type_hint) is Union:
+        arguments = [argument for argument in typing.get_args(type_hint) if argument is not NoneType]
+        if len(arguments) == 1:
+            return arguments[0]
+    return None
+
+
+class _DecoderBuilder:
+    """Generates the source of a decoder for a single dataclass."""
+
+    def __init__(self, cls: type):
+        self.cls = cls
+        self.namespace: Dict[str, Any] = {'cls': cls}
+        self._names = 0
+
+    def _bind(self, value: Any) -> str:
+        """Adds a value to the namespace of the generated function and returns its name."""
+
+        name = f'_decode_{self._names}'
+        self._names += 1
+        self.namespace[name] = value
+        return name
+
+    def expression(self, type_hint: Any, value: str) -> str:
+        """Returns a Python expression which converts the JSON-style value expression into type_hint."""
+
+        optional = _optional_type(type_hint)
+        if optional is not None:
+            inner = self.expression(optional, value)
+            return value if inner == value else f'(None if {value} is None else {inner})'
+
+        origin = typing.get_origin(type_hint)
+        if origin in (list, typing.List):
+            (item_type,) = typing.get_args(type_hint) or (Any,)
+            inner = self.expression(item_type, '_item')
+            return value if inner == '_item' else f'[{inner} for _item in {value}]'
+
+        if dataclasses.is_dataclass(type_hint):
+            return f'{self._bind(decoder_for(type_hint))}({value})'
+        if isinstance(type_hint, type) and issubclass(type_hint, Enum):
+            return f'{self._bind(type_hint)}({value})'
+        if type_hint is datetime:
+            return f'{self._bind(_decode_datetime)}({value})'
+
+        # str, int, float, bool and anything unknown are passed through as they are
+        return value
+
+    def source(self) -> str:
+        type_hints = typing.get_type_hints(self.cls)
+        arguments = []
+
+        for idx, field in enumerate(dataclasses.fields(self.cls)):
+            if not field.init:
+                continue
+
+            type_hint = type_hints[field.name]
+            if field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING:
+                # Required, a missing key raises a KeyError just like dataclasses_json
+                arguments.append(f'{field.name}={self.expression(type_hint, f"d[{field.name!r}]")}')
+                continue
+
+            if field.default is not dataclasses.MISSING:
+                default = self._bind(field.default) if field.default is not None else 'None'
+            else:
+                default = f'{self._bind(field.default_factory)}()'
+
+            variable = f'_v{idx}'
+            inner_type = _optional_type(type_hint) or type_hint
+            inner = self.expression(inner_type, variable)
+            if inner == variable and default == 'None':
+                arguments.append(f'{field.name}=d.get({field.name!r})')
+                continue
+
+            arguments.append(
+                f'{field.name}=({inner} '
+                f'if ({variable} := d.get({field.name!r})) is not None else {default})'
+            )
+
+        body = ',\n        '.join(arguments)
+        return f'def decode_{self.cls.__name__}(d):\n    return cls(\n        {body}\n    )\n'
+
+    def build(self) -> Decoder:
+        source = self.source()
+        exec(compile(source, f'<decoder {self.cls.__module__}.{self.cls.__qualname__}>', 'exec'), self.namespace)
+        decoder = self.namespace[f'decode_{self.cls.__name__}']
+        decoder.__source__ = source
+        return decoder
+
+
+def decoder_for(cls: type) -> Decoder:
+    """Returns the compiled decoder of a dataclass, generating it on first use.
+
+    Args:
+        cls (type): A dataclass
+
+    Returns:
+        Decoder: Function which turns a JSON-style dict into an instance of cls
+    """
+
+    decoder = _decoders.get(cls)
+    if decoder is not None:
+        return decoder
+
+    with _decoders_lock:
+        if cls not in _decoders:
+            # Register a trampoline first so that self-referencing dataclasses do not recurse forever
+            _decoders[cls] = lambda d: _decoders[cls](d)
+            try:
+                _decoders[cls] = _DecoderBuilder(cls).build()
+            except Exception:
+                del _decoders[cls]
+                raise
+
+        return _decoders[cls]
@@ -1,14 +1,13 @@
 from dataclasses import dataclass
 from typing import List, Optional
 
-from dataclasses_json import DataClassJsonMixin
-
 from core.lighting.hue.enums import Archetype, ResourceType
+from core.lighting.hue.objects.base import HueObject
 from core.lighting.hue.objects.resource import Resource
 
 
-@dataclass
-class _ProductData(DataClassJsonMixin):
+@dataclass(slots=True)
+class _ProductData(HueObject):
     """ Only exists as part of a DeviceGet and should not be instantiated on its own."""
     model_id: str
     manufacturer_name: str
@@ -19,15 +18,15 @@ class _ProductData(DataClassJsonMixin):
     hardware_platform_type: Optional[str] = None
 
 
-@dataclass
-class _DeviceMetadata(DataClassJsonMixin):
+@dataclass(slots=True)
+class _DeviceMetadata(HueObject):
     """ Only exists as part of a DeviceGet and should not be instantiated on its own."""
     name: str
     archetype: Archetype
 
 
-@dataclass
-class Device(DataClassJsonMixin):
+@dataclass(slots=True)
+class Device(HueObject):
     """An instance of a Hue DeviceGet as returned by the /resource/device endpoint.
     
     See: https://developers.meethue.com/develop/hue-api-v2/api-reference/#resource_device_get"""
@@ -1,38 +1,37 @@
 from dataclasses import dataclass
 from typing import Optional, List
 
-from dataclasses_json import DataClassJsonMixin
-
 from core.lighting.hue.enums import EntertainmentConfigurationType, EntertainmentConfigurationStatus, StreamProxyMode, ResourceType
+from core.lighting.hue.objects.base import HueObject
 from core.lighting.hue.objects.position import Position
 from core.lighting.hue.objects.resource import Resource
 
-@dataclass
-class _ECMetadata(DataClassJsonMixin):
+@dataclass(slots=True)
+class _ECMetadata(HueObject):
     name: str
 
 
-@dataclass
-class _ECStreamProxy(DataClassJsonMixin):
+@dataclass(slots=True)
+class _ECStreamProxy(HueObject):
     mode: StreamProxyMode
     node: Resource
 
 
-@dataclass
-class EntertainmentChannelSegment(DataClassJsonMixin):
+@dataclass(slots=True)
+class EntertainmentChannelSegment(HueObject):
     index: int
     service: Resource
 
 
-@dataclass
-class EntertainmentChannel(DataClassJsonMixin):
+@dataclass(slots=True)
+class EntertainmentChannel(HueObject):
     channel_id: int
     position: Position
     members: List[EntertainmentChannelSegment]
 
 
-@dataclass
-class ServiceLocation(DataClassJsonMixin):
+@dataclass(slots=True)
+class ServiceLocation(HueObject):
     service: Resource
     positions: List[Position]
     equalization_factor: float # [-1.0, 1.0]
@@ -40,12 +39,12 @@ class ServiceLocation(DataClassJsonMixin):
     position: Optional[Position] = None
 
 
-@dataclass
-class _ECLocations(DataClassJsonMixin):
+@dataclass(slots=True)
+class _ECLocations(HueObject):
     service_locations: List[ServiceLocation]
 
-@dataclass
-class EntertainmentConfiguration(DataClassJsonMixin):
+@dataclass(slots=True)
+class EntertainmentConfiguration(HueObject):
     """An EntertainmentConfiguration defines a configuration of resources as used by the Hue Entertainment API. 
         It is key for synchronized, streaming applications."""
     
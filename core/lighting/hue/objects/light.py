@@ -1,105 +1,109 @@
 from dataclasses import dataclass
 from datetime import datetime
-import json
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-from dataclasses_json import DataClassJsonMixin
-
-from core.lighting.hue.enums import SupportedDynamicStatus, LightMode, SupportedGradientMode, SignalStatus, SupportedEffect, PowerUpColorMode, PowerUpDimmingMode, PowerUpOnMode, PowerUpPreset, ResourceType
+from core.lighting.hue.enums import SupportedDynamicStatus, LightMode, SupportedGradientMode, SignalStatus, SupportedEffect, SupportedTimedEffect, PowerUpColorMode, PowerUpDimmingMode, PowerUpOnMode, PowerUpPreset, ResourceType
+from core.lighting.hue.objects.base import HueObject, TrackedHueObject
 from core.lighting.hue.objects.resource import Resource
 from core.lighting.hue.objects.color import Color
 
 
-@dataclass
-class _LightOn(DataClassJsonMixin):
+@dataclass(slots=True)
+class _LightOn(HueObject):
     on: bool
 
-@dataclass
-class _LightDimming(DataClassJsonMixin):
+@dataclass(slots=True)
+class _LightDimming(HueObject):
     brightness: float  # (0.0, 100.0]
     min_dim_level: Optional[float] = None  # [0.0, 100.0]
 
-@dataclass
-class _MirekSchema(DataClassJsonMixin):
+@dataclass(slots=True)
+class _MirekSchema(HueObject):
     mirek_minimum: int  # [153, 500]
     mirek_maximum: int  # [153, 500]
 
-@dataclass 
-class _LightColorTemperature(DataClassJsonMixin):
+@dataclass(slots=True)
+class _LightColorTemperature(HueObject):
     mirek: int  # [153, 500]
     mirek_valid: Optional[bool] = None
     mirek_schema: Optional[_MirekSchema] = None
 
-@dataclass
-class _LightDynamics(DataClassJsonMixin):
+@dataclass(slots=True)
+class _LightDynamics(HueObject):
     status: SupportedDynamicStatus
     status_values: List[SupportedDynamicStatus]
     speed: float # [0.0, 1.0]
     speed_valid: bool
 
-@dataclass
-class _LightAlert(DataClassJsonMixin):
+@dataclass(slots=True)
+class _LightAlert(HueObject):
     action_values: List[str]  # AlertEffectType enum maybe?
 
-@dataclass
-class _SignalStatus(DataClassJsonMixin):
+@dataclass(slots=True)
+class _SignalStatus(HueObject):
     signal: SignalStatus
     estimated_end: datetime
 
-@dataclass
-class _LightSignalling(DataClassJsonMixin):
+@dataclass(slots=True)
+class _LightSignalling(HueObject):
     status: Optional[_SignalStatus] = None
 
-@dataclass
-class _LightGradient(DataClassJsonMixin):
-    points: List[Color]  # Maximum of 5 can be specified
+@dataclass(slots=True)
+class _GradientPoint(HueObject):
+    color: Color
+
+@dataclass(slots=True)
+class _LightGradient(HueObject):
+    points: List[_GradientPoint]  # Maximum of 5 can be specified
     mode: SupportedGradientMode
     points_capable: int
     mode_values: List[SupportedGradientMode]
     pixel_count: Optional[int] = None
 
-@dataclass
-class _LightEffect(DataClassJsonMixin):
+@dataclass(slots=True)
+class _LightEffect(HueObject):
     # effect: SupportedEffect  # This field isn't returned by my lights
     status_values: List[SupportedEffect]
     status: SupportedEffect
     effect_values: List[SupportedEffect]
 
-@dataclass
-class _LightTimedEffect(DataClassJsonMixin):
-    effect: SupportedEffect
-    status_values: List[SupportedEffect]
-    status: SupportedEffect
-    effect_values: List[SupportedEffect]
+@dataclass(slots=True)
+class _LightTimedEffect(HueObject):
+    effect: SupportedTimedEffect
+    status_values: List[SupportedTimedEffect]
+    status: SupportedTimedEffect
+    effect_values: List[SupportedTimedEffect]
     duration: Optional[int] = None  # Seconds
 
-@dataclass
-class _PowerUpColor(DataClassJsonMixin):
+@dataclass(slots=True)
+class _PowerUpColor(HueObject):
     mode: PowerUpColorMode
     color_temperature: Optional[_LightColorTemperature] = None
     color: Optional[Color] = None
 
-@dataclass
-class _PowerUpDimming(DataClassJsonMixin):
+@dataclass(slots=True)
+class _PowerUpDimming(HueObject):
     mode: PowerUpDimmingMode
     dimming: Optional[_LightDimming] = None
 
-@dataclass
-class _PowerUpOn(DataClassJsonMixin):
+@dataclass(slots=True)
+class _PowerUpOn(HueObject):
     mode: PowerUpOnMode
     on: Optional[_LightOn] = None
 
-@dataclass
-class _LightPowerUp(DataClassJsonMixin):
+@dataclass(slots=True)
+class _LightPowerUp(HueObject):
     preset: PowerUpPreset
     configured: bool
     on: _PowerUpOn
     dimming: _PowerUpDimming
     color: _PowerUpColor
 
-@dataclass
-class Light(DataClassJsonMixin):
+@dataclass(slots=True)
+class Light(TrackedHueObject):
     """An instance of a Hue LightGet as returned by a call to /resource/light
+
+    Changes to on, dimming, color, color_temperature, gradient and dynamics are tracked, see TrackedHueObject.
     """
 
     type: ResourceType
@@ -122,11 +126,32 @@ class Light(DataClassJsonMixin):
     id_v1: Optional[str] = None
 
 
-    def to_put(self) -> dict:
-        """Converts self into a JSON-style dict that is a valid PUT request to /resource/light"""
+    def _put_state(self) -> dict:
+        """The writable state of self as a JSON-style PUT body for /resource/light
+
+        NOTE: https://developers.meethue.com/develop/hue-api-v2/api-reference/#resource_light__id__put
+        """
 
-        return json.dumps({
+        state: Dict[str, Any] = {
             'on': {
                 'on': self.on.on
             }
-        })
+        }
+
+        if self.dimming is not None:
+            state['dimming'] = {'brightness': self.dimming.brightness}
+        if self.color is not None:
+            state['color'] = {'xy': {'x': self.color.xy.x, 'y': self.color.xy.y}}
+        if self.color_temperature is not None and self.color_temperature.mirek is not None:
+            state['color_temperature'] = {'mirek': self.color_temperature.mirek}
+        if self.gradient is not None:
+            state['gradient'] = {
+                'points': [
+                    {'color': {'xy': {'x': point.color.xy.x, 'y': point.color.xy.y}}} for point in self.gradient.points
+                ],
+                'mode': self.gradient.mode.value
+            }
+        if self.dynamics is not None:
+            state['dynamics'] = {'speed': self.dynamics.speed}
+
+        return state
@@ -1,11 +1,10 @@
-from dataclasses_json import DataClassJsonMixin
-
-
 from dataclasses import dataclass
 
+from core.lighting.hue.objects.base import HueObject
+
 
-@dataclass
-class Position(DataClassJsonMixin):
+@dataclass(slots=True)
+class Position(HueObject):
     x: float # [-1.0, 1.0]
     y: float # [-1.0, 1.0]
     z: float # [-1.0, 1.0]
\ No newline at end of file
@@ -1,11 +1,10 @@
 from dataclasses import dataclass
 
-from dataclasses_json import DataClassJsonMixin
-
 from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.objects.base import HueObject
 
 
-@dataclass
-class Resource(DataClassJsonMixin):
+@dataclass(slots=True)
+class Resource(HueObject):
     rid: str
     rtype: ResourceType
\ No newline at end of file
@@ -0,0 +1,27 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.objects.base import HueObject
+from core.lighting.hue.objects.resource import Resource
+
+
+@dataclass(slots=True)
+class _RoomMetadata(HueObject):
+    name: str
+    archetype: str  # The bridge knows dozens of room archetypes and keeps adding more, so not using an Enum here
+
+
+@dataclass(slots=True)
+class Room(HueObject):
+    """An instance of a Hue RoomGet as returned by a call to /resource/room. A room groups devices, and its
+    grouped_light service controls all of their lights with a single command.
+
+    See: https://developers.meethue.com/develop/hue-api-v2/api-reference/#resource_room_get"""
+
+    type: ResourceType
+    id: str
+    children: List[Resource]
+    services: List[Resource]
+    metadata: _RoomMetadata
+    id_v1: Optional[str] = None
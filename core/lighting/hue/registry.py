@@ -0,0 +1,345 @@
+"""Indexed registry of loaded Hue resources.
+
+Resources are indexed by id, by ResourceType, by owner device and by entertainment configuration channel so that the
+lookups the render loop does on every frame (light for a service, lights of a channel, channels of a light) are
+dictionary reads instead of scans over Device.services or EntertainmentConfiguration.channels.
+"""
+import dataclasses
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple, cast
+
+from dataclasses_json import DataClassJsonMixin
+
+from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.objects.base import TrackedHueObject
+from core.lighting.hue.objects.device import Device
+from core.lighting.hue.objects.entertainment_configuration import EntertainmentChannel, EntertainmentConfiguration
+from core.lighting.hue.objects.light import Light
+from core.lighting.hue.objects.resource import Resource
+from core.lighting.hue.objects.room import Room
+
+_logger = logging.getLogger(__name__)
+
+# (entertainment configuration id, channel id)
+ChannelKey = Tuple[str, int]
+
+
+class ResourceRegistry:
+    """Holds every loaded resource and keeps lookup indexes up to date as resources are added, replaced or removed.
+
+    Light state changes only touch the id and type indexes. Entertainment and room indexes depend on devices,
+    configurations, rooms and on which lights exist, so they are rebuilt lazily on the next such lookup after one of
+    those changed or a light was added or removed.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._by_id: Dict[str, Any] = {}
+        self._by_type: Dict[ResourceType, Dict[str, Any]] = {}
+
+        # device id -> rtype -> services of that type, and service rid -> device id
+        self._services_by_owner: Dict[str, Dict[ResourceType, List[Resource]]] = {}
+        self._owner_by_service: Dict[str, str] = {}
+
+        self._entertainment_dirty = True
+        self._channels: Dict[ChannelKey, EntertainmentChannel] = {}
+        self._channel_lights: Dict[ChannelKey, List[str]] = {}
+        self._light_channels: Dict[str, List[ChannelKey]] = {}
+
+        self._rooms_dirty = True
+        self._room_lights: Dict[str, List[str]] = {}
+        self._room_grouped_light: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, resource_id: str) -> bool:
+        return resource_id in self._by_id
+
+    @staticmethod
+    def _resource_type(resource: Any) -> ResourceType:
+        return resource.type
+
+    def add(self, resource: Any):
+        """Adds a resource, replacing any previously registered resource with the same id.
+
+        Args:
+            resource (DataClassJsonMixin): A decoded resource with an id and a type, e.g. a Light or Device
+        """
+
+        with self._lock:
+            previous = self._by_id.get(resource.id)
+            if previous is not None:
+                self._unindex(previous)
+
+            resource_type = self._resource_type(resource)
+            self._by_id[resource.id] = resource
+            self._by_type.setdefault(resource_type, {})[resource.id] = resource
+
+            if resource_type == ResourceType.DEVICE:
+                services: Dict[ResourceType, List[Resource]] = {}
+                for service in resource.services:
+                    services.setdefault(service.rtype, []).append(service)
+                    self._owner_by_service[service.rid] = resource.id
+                self._services_by_owner[resource.id] = services
+                self._entertainment_dirty = True
+                self._rooms_dirty = True
+            elif resource_type == ResourceType.ENTERTAINMENT_CONFIGURATION:
+                self._entertainment_dirty = True
+            elif resource_type == ResourceType.ROOM:
+                self._rooms_dirty = True
+            elif resource_type == ResourceType.LIGHT and previous is None:
+                self._entertainment_dirty = True
+                self._rooms_dirty = True
+
+    def refresh(self, resource: Any) -> DataClassJsonMixin:
+        """Adds a resource, or copies its fields onto the registered resource with the same id, so that references
+        held elsewhere, e.g. by the render loop or a CommandScheduler, see the new state rather than an orphaned
+        object. A refreshed TrackedHueObject is marked clean with the new state.
+
+        Args:
+            resource (DataClassJsonMixin): A decoded resource with an id and a type, typically fresh from the bridge
+
+        Returns:
+            DataClassJsonMixin: The registered resource
+        """
+
+        with self._lock:
+            existing = self._by_id.get(resource.id)
+            if existing is None or type(existing) is not type(resource):
+                self.add(resource)
+                return resource
+
+            for field in dataclasses.fields(resource):
+                setattr(existing, field.name, getattr(resource, field.name))
+            if isinstance(existing, TrackedHueObject):
+                existing.mark_clean(resource.snapshot())
+            self.add(existing)  # Reindexes, e.g. the services of a device may have changed
+            return existing
+
+    def add_all(self, resources: Iterable[DataClassJsonMixin]):
+        """Adds every resource of an iterable."""
+
+        with self._lock:
+            for resource in resources:
+                self.add(resource)
+
+    def remove(self, resource_id: str) -> Optional[DataClassJsonMixin]:
+        """Removes a resource by id.
+
+        Args:
+            resource_id (str): Id of the resource to remove
+
+        Returns:
+            Optional[DataClassJsonMixin]: The removed resource or None if it was not registered
+        """
+
+        with self._lock:
+            resource = self._by_id.pop(resource_id, None)
+            if resource is not None:
+                self._unindex(resource)
+                if self._resource_type(resource) == ResourceType.LIGHT:
+                    self._entertainment_dirty = True
+                    self._rooms_dirty = True
+            return resource
+
+    def _unindex(self, resource: Any):
+        resource_type = self._resource_type(resource)
+        self._by_type.get(resource_type, {}).pop(resource.id, None)
+
+        if resource_type == ResourceType.DEVICE:
+            for services in self._services_by_owner.pop(resource.id, {}).values():
+                for service in services:
+                    if self._owner_by_service.get(service.rid) == resource.id:
+                        del self._owner_by_service[service.rid]
+            self._entertainment_dirty = True
+            self._rooms_dirty = True
+        elif resource_type == ResourceType.ENTERTAINMENT_CONFIGURATION:
+            self._entertainment_dirty = True
+        elif resource_type == ResourceType.ROOM:
+            self._rooms_dirty = True
+
+    def clear(self):
+        """Removes every resource."""
+
+        with self._lock:
+            self._reset()
+
+    def on_mirror_event(self, event_type: str, resource_type: ResourceType, resource_id: str,
+                        resource: Optional[DataClassJsonMixin]):
+        """Listener for HueStateMirror.add_listener that keeps the registry in sync with the mirror."""
+
+        if resource is None:
+            self.remove(resource_id)
+        else:
+            self.add(resource)
+
+    # === Lookups ===
+
+    def get(self, resource_id: str) -> Optional[DataClassJsonMixin]:
+        """Returns a resource of any type by id, or None if it is not registered."""
+
+        return self._by_id.get(resource_id)
+
+    def all(self, resource_type: ResourceType) -> List[DataClassJsonMixin]:
+        """Returns every registered resource of a type."""
+
+        return list(self._by_type.get(resource_type, {}).values())
+
+    def light(self, light_id: str) -> Optional[Light]:
+        return self._by_type.get(ResourceType.LIGHT, {}).get(light_id)
+
+    def lights(self) -> List[Light]:
+        return cast(List[Light], self.all(ResourceType.LIGHT))
+
+    def devices(self) -> List[Device]:
+        return cast(List[Device], self.all(ResourceType.DEVICE))
+
+    def entertainment_configurations(self) -> List[EntertainmentConfiguration]:
+        return cast(List[EntertainmentConfiguration], self.all(ResourceType.ENTERTAINMENT_CONFIGURATION))
+
+    def rooms(self) -> List[Room]:
+        return cast(List[Room], self.all(ResourceType.ROOM))
+
+    def owner_of(self, service_rid: str) -> Optional[Device]:
+        """Returns the device which owns a service, or None if it is unknown."""
+
+        device_id = self._owner_by_service.get(service_rid)
+        return self._by_id.get(device_id) if device_id is not None else None
+
+    def services_of(self, device_id: str, resource_type: ResourceType) -> List[Resource]:
+        """Returns the services of a device by rtype, the indexed equivalent of Device.get_resources_by_type."""
+
+        return self._services_by_owner.get(device_id, {}).get(resource_type, [])
+
+    def lights_of_device(self, device_id: str) -> List[Light]:
+        """Returns the registered lights of a device."""
+
+        lights = self._by_type.get(ResourceType.LIGHT, {})
+        return [
+            lights[service.rid] for service in self.services_of(device_id, ResourceType.LIGHT) if service.rid in lights
+        ]
+
+    def lights_for_service(self, service_rid: str) -> List[Light]:
+        """Resolves any service of a device to its lights.
+
+        EntertainmentChannelSegment and ServiceLocation reference the entertainment service of a device rather than
+        its light, so those are resolved through the owning device.
+
+        Args:
+            service_rid (str): rid of a light or any other service of a device
+
+        Returns:
+            List[Light]: The lights of the service's device
+        """
+
+        light = self.light(service_rid)
+        if light is not None:
+            return [light]
+
+        device_id = self._owner_by_service.get(service_rid)
+        return self.lights_of_device(device_id) if device_id is not None else []
+
+    # === Entertainment lookups ===
+
+    def _rebuild_entertainment_indexes(self):
+        channels: Dict[ChannelKey, EntertainmentChannel] = {}
+        channel_lights: Dict[ChannelKey, List[str]] = {}
+        light_channels: Dict[str, List[ChannelKey]] = {}
+
+        for configuration in self._by_type.get(ResourceType.ENTERTAINMENT_CONFIGURATION, {}).values():
+            for channel in configuration.channels:
+                key = (configuration.id, channel.channel_id)
+                channels[key] = channel
+
+                light_ids: List[str] = []
+                for member in channel.members:
+                    for light in self.lights_for_service(member.service.rid):
+                        if light.id not in light_ids:
+                            light_ids.append(light.id)
+                channel_lights[key] = light_ids
+
+                for light_id in light_ids:
+                    light_channels.setdefault(light_id, []).append(key)
+
+        self._channels = channels
+        self._channel_lights = channel_lights
+        self._light_channels = light_channels
+        self._entertainment_dirty = False
+
+    def _entertainment_indexes(self):
+        if self._entertainment_dirty:
+            with self._lock:
+                if self._entertainment_dirty:
+                    self._rebuild_entertainment_indexes()
+
+    def channel(self, configuration_id: str, channel_id: int) -> Optional[EntertainmentChannel]:
+        """Returns a channel of an entertainment configuration, or None if it is unknown."""
+
+        self._entertainment_indexes()
+        return self._channels.get((configuration_id, channel_id))
+
+    def lights_for_channel(self, configuration_id: str, channel_id: int) -> List[Light]:
+        """Returns the lights driven by a channel of an entertainment configuration."""
+
+        self._entertainment_indexes()
+        lights = self._by_type.get(ResourceType.LIGHT, {})
+        return [
+            lights[light_id] for light_id in self._channel_lights.get((configuration_id, channel_id), [])
+            if light_id in lights
+        ]
+
+    def channels_for_light(self, light_id: str) -> List[ChannelKey]:
+        """Returns the (configuration id, channel id) of every entertainment channel that drives a light."""
+
+        self._entertainment_indexes()
+        return self._light_channels.get(light_id, [])
+
+    # === Room lookups ===
+
+    def _rebuild_room_indexes(self):
+        room_lights: Dict[str, List[str]] = {}
+        room_grouped_light: Dict[str, str] = {}
+
+        for room in self._by_type.get(ResourceType.ROOM, {}).values():
+            light_ids: List[str] = []
+            for child in room.children:
+                if child.rtype == ResourceType.DEVICE:
+                    lights = self.lights_of_device(child.rid)
+                else:
+                    lights = self.lights_for_service(child.rid)
+
+                for light in lights:
+                    if light.id not in light_ids:
+                        light_ids.append(light.id)
+            room_lights[room.id] = light_ids
+
+            for service in room.services:
+                if service.rtype == ResourceType.GROUPED_LIGHT:
+                    room_grouped_light[room.id] = service.rid
+
+        self._room_lights = room_lights
+        self._room_grouped_light = room_grouped_light
+        self._rooms_dirty = False
+
+    def _room_indexes(self):
+        if self._rooms_dirty:
+            with self._lock:
+                if self._rooms_dirty:
+                    self._rebuild_room_indexes()
+
+    def light_ids_of_room(self, room_id: str) -> List[str]:
+        """Returns the ids of the lights of every device in a room."""
+
+        self._room_indexes()
+        return self._room_lights.get(room_id, [])
+
+    def grouped_light_of_room(self, room_id: str) -> Optional[str]:
+        """Returns the id of the grouped_light service of a room, which controls all of its lights at once."""
+
+        self._room_indexes()
+        return self._room_grouped_light.get(room_id)
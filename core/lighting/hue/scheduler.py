@@ -0,0 +1,314 @@
+"""Rate-aware scheduling of REST commands to the Hue bridge.
+
+The bridge handles roughly 10 light commands and 1 grouped_light command per second, and queues or drops anything
+above that. CommandScheduler sits between callers and HueClient.put_resource: it keeps only the latest pending state
+of every light, drains them through token buckets sized to those limits, and replaces the commands for a whole room
+with a single grouped_light command when every light of the room is about to receive the same state.
+
+NOTE: https://developers.meethue.com/develop/hue-api-v2/core-concepts/#limitations
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from core.exceptions import LibraryException
+from core.lighting.hue.client import HueClient
+from core.lighting.hue.objects.light import Light
+from core.lighting.hue.registry import ResourceRegistry
+from core.metrics import REGISTRY
+from core.throttled_logging import RateLimitedLogger
+
+_logger = logging.getLogger(__name__)
+_rate_limited_logger = RateLimitedLogger(_logger)
+
+_LIGHT_UPDATES = REGISTRY.counter(
+    'light_updates_total', 'Light updates submitted to the command scheduler by outcome', ('outcome',)
+)
+
+# grouped_light does not support gradients, and its dynamics only take a duration while a light's take a speed, so
+# lights are only grouped on the state they share with it
+_GROUPABLE_STATE = ('on', 'dimming', 'color', 'color_temperature')
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at a fixed rate."""
+
+    def __init__(self, rate: float, capacity: float):
+        """Constructor.
+
+        Args:
+            rate (float): Tokens added per second
+            capacity (float): Maximum number of tokens, i.e. the largest burst allowed
+        """
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Takes tokens from the bucket if enough are available."""
+
+        self._refill(time.monotonic())
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def time_until_available(self, tokens: float = 1.0) -> float:
+        """Seconds until the requested number of tokens is available."""
+
+        self._refill(time.monotonic())
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+
+class CommandScheduler:
+    """Coalesces light updates and sends them to the bridge within its rate limits on a background thread.
+
+    Updates that do not fit into max_pending are counted as dropped. Updates whose command failed are counted as
+    failed and are not retried, see _send.
+    """
+
+    def __init__(
+        self,
+        client: HueClient,
+        registry: Optional[ResourceRegistry] = None,
+        light_rate: float = 10.0,
+        light_burst: float = 2.0,
+        group_rate: float = 1.0,
+        group_burst: float = 1.0,
+        max_pending: int = 256
+    ):
+        """Constructor.
+
+        Args:
+            client (HueClient): Client used to send commands
+            registry (Optional[ResourceRegistry]): Registry used to find rooms and their grouped_light. If None,
+                commands are never grouped. Defaults to None.
+            light_rate (float): Light commands per second. Defaults to 10.
+            light_burst (float): Largest burst of light commands. Defaults to 2.
+            group_rate (float): grouped_light commands per second. Defaults to 1.
+            group_burst (float): Largest burst of grouped_light commands. Defaults to 1.
+            max_pending (int): Maximum number of lights with a pending update, further lights are dropped.
+                Defaults to 256.
+        """
+
+        self.client = client
+        self.registry = registry
+        self.max_pending = max_pending
+
+        self._light_bucket = TokenBucket(light_rate, light_burst)
+        self._group_bucket = TokenBucket(group_rate, group_burst)
+
+        # Insertion ordered, so a light keeps its place in the queue when a newer state replaces its pending one
+        self._pending: Dict[str, Light] = {}
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._in_flight = 0
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.dropped = 0
+        self.failed = 0
+        self.errors = 0
+        self.light_commands = 0
+        self.group_commands = 0
+        self._coalesced_metric = _LIGHT_UPDATES.labels('coalesced')
+        self._dropped_metric = _LIGHT_UPDATES.labels('dropped')
+        self._failed_metric = _LIGHT_UPDATES.labels('failed')
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def metrics(self) -> dict:
+        """Returns a JSON-style dict of the scheduler's counters."""
+
+        return {
+            'queue_depth': self.queue_depth,
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'unchanged': self.unchanged,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'errors': self.errors,
+            'light_commands': self.light_commands,
+            'group_commands': self.group_commands,
+        }
+
+    def submit(self, light: Light):
+        """Queues the current state of a light. Replaces the light's pending state if it already has one.
+
+        Args:
+            light (Light): Light whose changed state should be sent, see Light.to_put
+        """
+
+        with self._condition:
+            self.submitted += 1
+
+            if light.id in self._pending:
+                self.coalesced += 1
+                self._coalesced_metric.inc()
+                self._pending[light.id] = light
+            elif len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                self._dropped_metric.inc()
+                return
+            else:
+                self._pending[light.id] = light
+
+            self._condition.notify()
+
+    def submit_all(self, lights: List[Light]):
+        for light in lights:
+            self.submit(light)
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='CommandScheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, flush_timeout: Optional[float] = None):
+        """Stops the scheduler thread.
+
+        Args:
+            flush_timeout (Optional[float]): If set, waits up to that many seconds for pending updates to be sent
+                before stopping. Defaults to None.
+        """
+
+        if flush_timeout is not None:
+            self.flush(flush_timeout)
+
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def flush(self, timeout: float) -> bool:
+        """Waits until every pending update was sent.
+
+        Returns:
+            bool: True if the queue drained within the timeout
+        """
+
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def __enter__(self) -> 'CommandScheduler':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _take_group(self) -> Optional[tuple]:
+        """Finds a room whose lights are all pending with the same state and removes them from the queue.
+
+        Returns:
+            Optional[tuple]: (grouped_light id, body, lights, their snapshots) or None if no room can be grouped
+        """
+
+        if self.registry is None or len(self._pending) < 2:
+            return None
+
+        for room in self.registry.rooms():
+            grouped_light_id = self.registry.grouped_light_of_room(room.id)
+            light_ids = self.registry.light_ids_of_room(room.id)
+            if grouped_light_id is None or len(light_ids) < 2 or any(i not in self._pending for i in light_ids):
+                continue
+
+            lights = [self._pending[light_id] for light_id in light_ids]
+            states = [light.snapshot() for light in lights]
+            changed_keys = {key for light, state in zip(lights, states) for key in light.to_put(state)}
+            if not changed_keys or not changed_keys.issubset(_GROUPABLE_STATE):
+                continue
+
+            # Every field that changed on any of the lights must now have the same value on all of them, fields that
+            # did not change are left alone and may differ between the lights
+            body = {key: states[0].get(key) for key in changed_keys}
+            if any(body[key] is None or state.get(key) != body[key] for state in states[1:] for key in changed_keys):
+                continue
+
+            for light_id in light_ids:
+                del self._pending[light_id]
+            return grouped_light_id, body, lights, states
+
+        return None
+
+    def _send(self, resource_name: str, body: dict, lights: List[Light], states: List[dict]):
+        """Sends a command built from states, the snapshots of lights, and marks the lights clean with them.
+
+        A failed command is not retried: its lights are already removed from the pending queue and counted as failed.
+        They are not marked clean either, so their next submitted update carries the failed state again.
+        """
+
+        try:
+            self.client.put_resource(resource_name, body)
+        except (LibraryException, requests.RequestException) as e:
+            self.errors += 1
+            self.failed += len(lights)
+            self._failed_metric.inc(len(lights))
+            _rate_limited_logger.info('Failed to send %s: %s', resource_name, e)
+            return
+
+        # Changes made while the request was in flight are not in the snapshots, so they stay pending on the lights
+        for light, state in zip(lights, states):
+            light.mark_clean(state)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._condition:
+                while not self._pending and not self._stop_event.is_set():
+                    self._condition.wait()
+                if self._stop_event.is_set():
+                    break
+
+                group = self._take_group() if self._group_bucket.time_until_available() == 0.0 else None
+                if group is not None:
+                    self._group_bucket.try_acquire()
+                    self._in_flight += 1
+                else:
+                    wait = self._light_bucket.time_until_available()
+                    if wait > 0.0:
+                        self._condition.wait(wait)
+                        continue
+
+                    light_id = next(iter(self._pending))
+                    light = self._pending.pop(light_id)
+                    self._light_bucket.try_acquire()
+                    self._in_flight += 1
+
+            try:
+                if group is not None:
+                    grouped_light_id, body, lights, states = group
+                    self.group_commands += 1
+                    self._send(f'grouped_light/{grouped_light_id}', body, lights, states)
+                else:
+                    state = light.snapshot()
+                    body = light.to_put(state)
+                    if body:
+                        self.light_commands += 1
+                        self._send(f'light/{light.id}', body, [light], [state])
+                    else:
+                        self.unchanged += 1
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
@@ -0,0 +1,239 @@
+"""A local stand-in for a whole Hue bridge, for load and latency testing without hardware.
+
+BridgeSimulator extends LocalEventStreamServer, which serves resource listings and the event stream, with the rest of
+what HueClient talks to:
+
+* POST /api exchanges an application key, failing with error 101 while the link button is not pressed.
+* GET /clip/v2/resource/<type>/<id> returns a single resource.
+* PUT /clip/v2/resource/<type>/<id> merges the body into the resource and publishes an update event, as the bridge
+  does.
+
+Every request to /clip/v2 needs an issued hue-application-key. Responses can be delayed by a fixed latency plus
+random jitter, and fail at a configurable rate. PUTs are subject to the bridge's command rate limits, about 10 light
+and 1 grouped_light command per second, answered with 429 once exceeded. The real bridge queues or drops such commands
+rather than always rejecting them, but a rejection makes the excess visible to a load test.
+"""
+import http.server
+import json
+import random
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional
+
+from core.lighting.hue.enums import ResourceType
+from core.lighting.hue.event_stream import EVENT_UPDATE, LocalEventStreamServer
+from core.lighting.hue.scheduler import TokenBucket
+from core.lighting.hue.synthetic import synthetic_topology
+
+
+class BridgeSimulator(LocalEventStreamServer):
+    """Simulates the CLIP v2 API of a bridge with latency, jitter, injected errors and command rate limits."""
+
+    def __init__(
+        self,
+        resources: Optional[Dict[ResourceType, List[dict]]] = None,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        light_rate: Optional[float] = 10.0,
+        light_burst: float = 2.0,
+        group_rate: Optional[float] = 1.0,
+        group_burst: float = 1.0,
+        link_button: bool = True,
+        seed: Optional[int] = None
+    ):
+        """Constructor.
+
+        Args:
+            resources (Optional[Dict[ResourceType, List[dict]]]): Initial JSON-style resources by type, e.g. from
+                synthetic_topology. Defaults to None, i.e. a synthetic topology of 100 lights.
+            host (str): Address to bind to. Defaults to 127.0.0.1.
+            port (int): Port to bind to, 0 picks a free port. Defaults to 0.
+            latency (float): Seconds every response is delayed by. Defaults to 0.
+            jitter (float): Maximum random delay in seconds added to latency. Defaults to 0.
+            error_rate (float): Fraction of requests failed on purpose. Defaults to 0.
+            error_status (int): HTTP status of failed requests. HueTransport retries 502, 503 and 504, so those are
+                only seen by the caller if every retry fails as well. Defaults to 500.
+            light_rate (Optional[float]): Light commands per second, None for no limit. Defaults to 10.
+            light_burst (float): Largest burst of light commands. Defaults to 2.
+            group_rate (Optional[float]): grouped_light commands per second, None for no limit. Defaults to 1.
+            group_burst (float): Largest burst of grouped_light commands. Defaults to 1.
+            link_button (bool): Whether the link button is pressed, i.e. POST /api issues keys. Defaults to True.
+            seed (Optional[int]): Seed of the jitter and error injection. Defaults to None.
+        """
+
+        super().__init__(resources if resources is not None else synthetic_topology(100), host, port)
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.link_button = link_button
+
+        self._buckets = {
+            resource_type.value: TokenBucket(rate, burst)
+            for resource_type, rate, burst in (
+                (ResourceType.LIGHT, light_rate, light_burst),
+                (ResourceType.GROUPED_LIGHT, group_rate, group_burst),
+            )
+            if rate is not None
+        }
+        self._random = random.Random(seed)
+        self._keys: Dict[str, str] = {}
+        self._stats_lock = threading.Lock()
+
+        self.requests = 0
+        self.commands_applied = 0
+        self.rate_limited = 0
+        self.errors_injected = 0
+        self.unauthorized = 0
+
+    def issue_key(self) -> str:
+        """Issues an application key without the link button, e.g. for a load test that skips the key exchange."""
+
+        username = secrets.token_hex(20)
+        with self._stats_lock:
+            self._keys[username] = secrets.token_hex(16).upper()
+        return username
+
+    def stats(self) -> dict:
+        """Returns a JSON-style dict of requests served, commands applied and requests failed by reason."""
+
+        with self._stats_lock:
+            return {
+                'requests': self.requests,
+                'commands_applied': self.commands_applied,
+                'rate_limited': self.rate_limited,
+                'errors_injected': self.errors_injected,
+                'unauthorized': self.unauthorized,
+            }
+
+    def _send_json(self, handler: http.server.BaseHTTPRequestHandler, status: int, payload: object):
+        body = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _send_errors(self, handler: http.server.BaseHTTPRequestHandler, status: int, description: str):
+        self._send_json(handler, status, {'errors': [{'description': description}], 'data': []})
+
+    def _send_v1_error(self, handler: http.server.BaseHTTPRequestHandler, error_type: int, description: str):
+        """Sends an error the way /api does, with status 200 and the error in the body."""
+
+        self._send_json(handler, 200, [{'error': {'type': error_type, 'address': '/', 'description': description}}])
+
+    def _read_body(self, handler: http.server.BaseHTTPRequestHandler) -> bytes:
+        """Reads the body up front, a keep-alive connection is out of sync if a failed request leaves it unread."""
+
+        return handler.rfile.read(int(handler.headers.get('Content-Length') or 0))
+
+    def _admit(self, handler: http.server.BaseHTTPRequestHandler) -> bool:
+        """Delays the request and decides whether it fails. Returns False once a failure has been sent."""
+
+        delay = self.latency + (self._random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+        if delay > 0.0:
+            time.sleep(delay)
+
+        with self._stats_lock:
+            self.requests += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors_injected += 1
+                failed = True
+            else:
+                failed = False
+
+        if failed:
+            self._send_errors(handler, self.error_status, 'internal error')
+        return not failed
+
+    def _authorized(self, handler: http.server.BaseHTTPRequestHandler) -> bool:
+        if handler.headers.get('hue-application-key') in self._keys:
+            return True
+
+        with self._stats_lock:
+            self.unauthorized += 1
+        self._send_errors(handler, 403, 'unauthorized user')
+        return False
+
+    def _do_get(self, handler: http.server.BaseHTTPRequestHandler):
+        if handler.path.startswith('/clip/v2/') or handler.path.startswith('/eventstream/'):
+            if not self._authorized(handler) or not self._admit(handler):
+                return
+
+        parts = handler.path.rstrip('/').split('/')
+        if len(parts) == 6 and handler.path.startswith('/clip/v2/resource/'):
+            with self._lock:
+                item = self._resources.get(parts[4], {}).get(parts[5])
+            if item is None:
+                self._send_errors(handler, 404, f'Cannot find resource {parts[4]}/{parts[5]}')
+                return
+            self._send_json(handler, 200, {'errors': [], 'data': [item]})
+            return
+
+        super()._do_get(handler)
+
+    def _do_put(self, handler: http.server.BaseHTTPRequestHandler):
+        parts = handler.path.rstrip('/').split('/')
+        data = self._read_body(handler)
+        if len(parts) != 6 or not handler.path.startswith('/clip/v2/resource/'):
+            handler.send_error(405)
+            return
+        if not self._authorized(handler) or not self._admit(handler):
+            return
+
+        resource_name, resource_id = parts[4], parts[5]
+        with self._lock:
+            exists = resource_id in self._resources.get(resource_name, {})
+        if not exists:
+            self._send_errors(handler, 404, f'Cannot find resource {resource_name}/{resource_id}')
+            return
+
+        bucket = self._buckets.get(resource_name)
+        with self._stats_lock:
+            limited = bucket is not None and not bucket.try_acquire()
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            self._send_errors(handler, 429, 'Too many requests')
+            return
+
+        try:
+            body = json.loads(data)
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            self._send_errors(handler, 400, 'body contains invalid json')
+            return
+
+        self.publish(EVENT_UPDATE, [dict(body, id=resource_id, type=resource_name)])
+        with self._stats_lock:
+            self.commands_applied += 1
+        self._send_json(handler, 200, {'errors': [], 'data': [{'rid': resource_id, 'rtype': resource_name}]})
+
+    def _do_post(self, handler: http.server.BaseHTTPRequestHandler):
+        data = self._read_body(handler)
+        if handler.path.rstrip('/') != '/api':
+            handler.send_error(405)
+            return
+        if not self._admit(handler):
+            return
+
+        try:
+            body = json.loads(data)
+        except ValueError:
+            body = None
+        if not isinstance(body, dict) or 'devicetype' not in body:
+            self._send_v1_error(handler, 5, 'invalid/missing parameters in body')
+            return
+        if not self.link_button:
+            self._send_v1_error(handler, 101, 'link button not pressed')
+            return
+
+        username = self.issue_key()
+        self._send_json(handler, 200, [{'success': {'username': username, 'clientkey': self._keys[username]}}])
@@ -0,0 +1,159 @@
+"""Maps audio features onto lights by where they are in the room.
+
+Entertainment channels and service locations place every light at (x, y, z) in [-1.0, 1.0]: x from left to right, y
+from back to front and z from floor to ceiling. SpatialMapper turns those positions into a dense weight matrix once:
+
+* x pans between the left and right channel of stereo audio, linearly so mono audio keeps its level everywhere.
+* z picks the frequency bands a light follows, bass on the floor and treble at the ceiling, with a Gaussian falloff
+  across neighbouring bands.
+* y blends between onsets, which flash the front, and overall loudness, which fills the back.
+
+A frame's features are normalized into a single vector, and every feature has a color. Every channel color is then one
+matrix multiply of the weights with the colored feature vector, no matter how many channels there are.
+"""
+import colorsys
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.lighting.hue.objects.entertainment_configuration import EntertainmentConfiguration
+
+if TYPE_CHECKING:
+    from core.audio.features import FeatureFrame
+
+
+def channel_positions(configuration: EntertainmentConfiguration) -> np.ndarray:
+    """Returns the (x, y, z) of every channel in the order of configuration.channels, of shape (channels, 3)."""
+
+    return np.array(
+        [(channel.position.x, channel.position.y, channel.position.z) for channel in configuration.channels],
+        dtype=np.float64
+    ).reshape(len(configuration.channels), 3)
+
+
+def service_positions(configuration: EntertainmentConfiguration) -> Tuple[List[str], np.ndarray]:
+    """Returns the ids of every located service and its (x, y, z), of shape (services, 3).
+
+    Services spanning several positions, e.g. gradient light strips, are placed at the mean of their positions.
+    """
+
+    ids = []
+    positions = []
+    for location in configuration.locations.service_locations:
+        points = location.positions or ([location.position] if location.position is not None else [])
+        if not points:
+            continue
+        ids.append(location.service.rid)
+        positions.append(np.mean([(point.x, point.y, point.z) for point in points], axis=0))
+
+    return ids, np.array(positions, dtype=np.float64).reshape(len(positions), 3)
+
+
+def default_band_colors(band_count: int) -> np.ndarray:
+    """Returns a color per band from red for the lowest band to violet for the highest, of shape (band_count, 3)."""
+
+    return np.array(
+        [colorsys.hsv_to_rgb(0.8 * band / max(band_count - 1, 1), 1.0, 1.0) for band in range(band_count)],
+        dtype=np.float64
+    ).reshape(band_count, 3)
+
+
+class SpatialMapper:
+    """Turns FeatureFrames into a color per light from a precomputed (lights, features) weight matrix.
+
+    The feature vector holds the left bands, the right bands, the onset strength and the RMS level, each normalized by
+    its own slowly decaying peak.
+    """
+
+    def __init__(
+        self,
+        positions: np.ndarray,
+        band_count: int,
+        band_spread: float = 1.0,
+        onset_gain: float = 1.0,
+        ambient_gain: float = 0.5,
+        band_colors: Optional[np.ndarray] = None,
+        onset_color: Sequence[float] = (1.0, 1.0, 1.0),
+        ambient_color: Sequence[float] = (0.2, 0.3, 1.0),
+        peak_decay: float = 0.999
+    ):
+        """Constructor.
+
+        Args:
+            positions (np.ndarray): (x, y, z) of every light in [-1.0, 1.0], of shape (lights, 3)
+            band_count (int): Number of bands of the FeatureFrames, see FeatureExtractor
+            band_spread (float): Standard deviation in bands of the falloff around a light's own band. Defaults to 1.
+            onset_gain (float): Weight of onsets on lights at the very front. Defaults to 1.
+            ambient_gain (float): Weight of the RMS level on lights at the very back. Defaults to 0.5.
+            band_colors (Optional[np.ndarray]): RGB color of every band in [0.0, 1.0], of shape (band_count, 3).
+                Defaults to default_band_colors.
+            onset_color (Sequence[float]): RGB color of onsets. Defaults to white.
+            ambient_color (Sequence[float]): RGB color of the RMS level. Defaults to a deep blue.
+            peak_decay (float): Per frame decay of the running peak every feature is normalized by. Defaults to 0.999.
+        """
+
+        positions = np.clip(np.asarray(positions, dtype=np.float64).reshape(-1, 3), -1.0, 1.0)
+        self.positions = positions
+        self.band_count = band_count
+        self.peak_decay = peak_decay
+
+        x, y, z = positions[:, 0], positions[:, 1], positions[:, 2]
+        right = (x + 1.0) / 2.0
+        front = (y + 1.0) / 2.0
+
+        centers = (z + 1.0) / 2.0 * (band_count - 1)
+        distance = np.arange(band_count)[np.newaxis, :] - centers[:, np.newaxis]
+        height = np.exp(-0.5 * (distance / max(band_spread, 1e-6)) ** 2)
+        height /= height.sum(axis=1, keepdims=True)
+
+        feature_count = 2 * band_count + 2
+        self.weights = np.zeros((len(positions), feature_count))
+        self.weights[:, :band_count] = height * (1.0 - right)[:, np.newaxis]
+        self.weights[:, band_count:2 * band_count] = height * right[:, np.newaxis]
+        self.weights[:, 2 * band_count] = front * onset_gain
+        self.weights[:, 2 * band_count + 1] = (1.0 - front) * ambient_gain
+
+        if band_colors is None:
+            band_colors = default_band_colors(band_count)
+        self.feature_colors = np.vstack((band_colors, band_colors, [onset_color], [ambient_color])).astype(np.float64)
+
+        # Preallocated per frame buffers, see map
+        self._features = np.zeros(feature_count)
+        self._peaks = np.full(feature_count, 1e-9)
+        self._colored = np.zeros((feature_count, 3))
+        self.rgb = np.zeros((len(positions), 3))
+
+    @classmethod
+    def from_configuration(
+        cls,
+        configuration: EntertainmentConfiguration,
+        band_count: int,
+        **kwargs
+    ) -> 'SpatialMapper':
+        """Returns a mapper over the channels of an entertainment configuration, in the order they are streamed."""
+
+        return cls(channel_positions(configuration), band_count, **kwargs)
+
+    def map(self, frame: 'FeatureFrame', right: Optional['FeatureFrame'] = None) -> np.ndarray:
+        """Updates rgb, the color of every light in [0.0, 1.0] of shape (lights, 3), and returns it.
+
+        Args:
+            frame (FeatureFrame): Features of mono audio, or of the left channel if right is set
+            right (Optional[FeatureFrame]): Features of the right channel. Defaults to None, i.e. mono.
+        """
+
+        bands = self.band_count
+        features = self._features
+        features[:bands] = frame.bands
+        features[bands:2 * bands] = (right if right is not None else frame).bands
+        features[2 * bands] = frame.onset if right is None else max(frame.onset, right.onset)
+        features[2 * bands + 1] = frame.rms if right is None else 0.5 * (frame.rms + right.rms)
+
+        np.multiply(self._peaks, self.peak_decay, out=self._peaks)
+        np.maximum(self._peaks, features, out=self._peaks)
+        np.divide(features, self._peaks, out=features)
+
+        np.multiply(self.feature_colors, features[:, np.newaxis], out=self._colored)
+        np.matmul(self.weights, self._colored, out=self.rgb)
+        np.clip(self.rgb, 0.0, 1.0, out=self.rgb)
+        return self.rgb
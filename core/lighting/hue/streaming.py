@@ -0,0 +1,478 @@
+"""Hue Entertainment streaming.
+
+REST commands are rate limited by the bridge to roughly 10 per second, which is far too slow to follow music. The
+Entertainment API instead accepts a continuous stream of binary frames over UDP (DTLS on port 2100), where every frame
+carries the color of every channel of an EntertainmentConfiguration.
+
+NOTE: https://developers.meethue.com/develop/hue-entertainment/hue-entertainment-api/
+
+Frame layout (HueStream v2):
+    "HueStream"                     9 bytes
+    version                         2 bytes (0x02, 0x00)
+    sequence id                     1 byte
+    reserved                        2 bytes
+    color space                     1 byte (0x00 RGB, 0x01 XY + brightness)
+    reserved                        1 byte
+    entertainment configuration id  36 bytes (ASCII UUID)
+    per channel                     7 bytes (channel id, then three big-endian uint16 values)
+"""
+import logging
+import socket
+import struct
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, cast
+
+from core.exceptions import ConnectionException, MissingDependencyException
+from core.lighting.hue.enums import EntertainmentAction, StreamColorSpace
+from core.metrics import REGISTRY
+from core.throttled_logging import RateLimitedLogger
+from core.lighting.hue.objects.entertainment_configuration import EntertainmentConfiguration
+
+if TYPE_CHECKING:
+    from core.lighting.hue.client import HueClient
+
+_logger = logging.getLogger(__name__)
+_rate_limited_logger = RateLimitedLogger(_logger)
+
+_STREAM_FRAMES = REGISTRY.counter('entertainment_frames_total', 'Entertainment stream frames by outcome', ('outcome',))
+
+STREAM_PORT = 2100
+MAX_CHANNELS = 20
+
+_PROTOCOL_NAME = b'HueStream'
+_HEADER = struct.Struct('>9sBBBHBB36s')
+_CHANNEL = struct.Struct('>BHHH')
+_UINT16_MAX = 0xFFFF
+
+
+def frame_size(channel_count: int) -> int:
+    """Size in bytes of a frame carrying the specified number of channels."""
+
+    return _HEADER.size + _CHANNEL.size * channel_count
+
+
+class HueStreamFrame:
+    """A reusable, preallocated HueStream v2 frame for a single entertainment configuration."""
+
+    def __init__(self, configuration_id: str, channel_ids: Sequence[int],
+                 color_space: StreamColorSpace = StreamColorSpace.RGB):
+        """Constructor.
+
+        Args:
+            configuration_id (str): Id of the EntertainmentConfiguration being streamed
+            channel_ids (Sequence[int]): Channel ids of the configuration, in the order colors will be provided
+            color_space (StreamColorSpace): Whether values are RGB or XY + brightness. Defaults to RGB.
+        """
+
+        if len(channel_ids) > MAX_CHANNELS:
+            raise ValueError(f'HueStream supports at most {MAX_CHANNELS} channels, got {len(channel_ids)}')
+
+        self.configuration_id = configuration_id
+        self.channel_ids = list(channel_ids)
+        self.color_space = color_space
+        self.buffer = bytearray(frame_size(len(self.channel_ids)))
+
+        self._configuration_id_bytes = configuration_id.encode('ascii')
+        for idx, channel_id in enumerate(self.channel_ids):
+            _CHANNEL.pack_into(self.buffer, _HEADER.size + idx * _CHANNEL.size, channel_id, 0, 0, 0)
+
+    def encode(self, sequence: int, values: Sequence[Tuple[float, float, float]]) -> bytearray:
+        """Writes a sequence id and channel values into the frame buffer.
+
+        Args:
+            sequence (int): Sequence id of the frame, wraps at 256
+            values (Sequence[Tuple[float, float, float]]): One (r, g, b) or (x, y, brightness) tuple per channel,
+                each component in [0.0, 1.0]
+
+        Returns:
+            bytearray: the frame buffer, which is reused by the next call to encode
+        """
+
+        _HEADER.pack_into(
+            self.buffer, 0,
+            _PROTOCOL_NAME, 0x02, 0x00, sequence & 0xFF, 0, self.color_space.value, 0, self._configuration_id_bytes
+        )
+
+        offset = _HEADER.size
+        for channel_id, (a, b, c) in zip(self.channel_ids, values):
+            _CHANNEL.pack_into(self.buffer, offset, channel_id, _to_uint16(a), _to_uint16(b), _to_uint16(c))
+            offset += _CHANNEL.size
+
+        return self.buffer
+
+
+def _to_uint16(value: float) -> int:
+    if value <= 0.0:
+        return 0
+    if value >= 1.0:
+        return _UINT16_MAX
+    return int(value * _UINT16_MAX + 0.5)
+
+
+def decode_frame(data: bytes) -> Tuple[int, StreamColorSpace, str, List[Tuple[int, int, int, int]]]:
+    """Decodes a HueStream v2 frame.
+
+    Args:
+        data (bytes): Raw frame
+
+    Returns:
+        Tuple[int, StreamColorSpace, str, List[Tuple[int, int, int, int]]]: sequence id, color space,
+            entertainment configuration id and a (channel id, value, value, value) tuple per channel
+    """
+
+    if len(data) < _HEADER.size or (len(data) - _HEADER.size) % _CHANNEL.size:
+        raise ValueError(f'Invalid HueStream frame size {len(data)}')
+
+    name, major, _, sequence, _, color_space, _, configuration_id = _HEADER.unpack_from(data, 0)
+    if name != _PROTOCOL_NAME or major != 0x02:
+        raise ValueError('Not a HueStream v2 frame')
+
+    channels = [
+        _CHANNEL.unpack_from(data, offset) for offset in range(_HEADER.size, len(data), _CHANNEL.size)
+    ]
+
+    return (
+        sequence, StreamColorSpace(color_space), configuration_id.decode('ascii'),
+        cast(List[Tuple[int, int, int, int]], channels)
+    )
+
+
+class UdpDatagramTransport:
+    """Plain UDP datagram transport. Used to stream to a LoopbackEntertainmentReceiver."""
+
+    def __init__(self, address: Tuple[str, int]):
+        self.address = address
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.connect(address)
+
+    def send(self, data: bytes):
+        self._socket.send(data)
+
+    def close(self):
+        self._socket.close()
+
+
+class DtlsDatagramTransport:
+    """DTLS 1.2 PSK transport required by the Hue bridge.
+
+    The standard library has no DTLS support, so this relies on the optional python-mbedtls package.
+    """
+
+    CIPHER_SUITE = 'TLS-PSK-WITH-AES-128-GCM-SHA256'
+
+    def __init__(self, bridge_ip_address: str, username: str, clientkey: str, port: int = STREAM_PORT):
+        """Constructor.
+
+        Args:
+            bridge_ip_address (str): IP address of the Hue bridge
+            username (str): The application key username, used as the PSK identity
+            clientkey (str): The hex encoded clientkey returned when the application key was generated
+            port (int): Streaming port of the bridge. Defaults to 2100.
+        """
+
+        try:
+            from mbedtls import tls
+        except ImportError:
+            raise MissingDependencyException('python-mbedtls', 'Hue Entertainment streaming')
+
+        configuration = tls.DTLSConfiguration(
+            pre_shared_key=(username, bytes.fromhex(clientkey)),
+            ciphers=[self.CIPHER_SUITE],
+            validate_certificates=False
+        )
+        self._socket = tls.ClientContext(configuration).wrap_socket(
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM),
+            server_hostname=None
+        )
+
+        try:
+            self._socket.connect((bridge_ip_address, port))
+            self._socket.do_handshake()
+        except Exception as e:
+            self._socket.close()
+            raise ConnectionException(f'DTLS handshake with {bridge_ip_address}:{port} failed: {e}', 'HueClient')
+
+    def send(self, data: bytes):
+        self._socket.send(data)
+
+    def close(self):
+        self._socket.close()
+
+
+class EntertainmentStreamer:
+    """Streams colors for every channel of an EntertainmentConfiguration at a fixed rate.
+
+    Callers set channel colors whenever they like, and a background sender thread transmits the latest colors of all
+    channels once per tick. The bridge expects a continuous stream, so frames are sent even if nothing changed.
+    If the sender falls behind, missed ticks are skipped instead of being sent in a burst.
+    """
+
+    def __init__(
+        self,
+        configuration: EntertainmentConfiguration,
+        client: Optional['HueClient'] = None,
+        transport: Optional[object] = None,
+        frame_rate: float = 50.0,
+        color_space: StreamColorSpace = StreamColorSpace.RGB
+    ):
+        """Constructor.
+
+        Args:
+            configuration (EntertainmentConfiguration): The configuration whose channels are streamed
+            client (Optional[HueClient]): Client used to start and stop the configuration and to open a DTLS
+                connection to its bridge. If None, the configuration is not started or stopped through the REST API.
+                Defaults to None.
+            transport (Optional[object]): Datagram transport with send(bytes) and close() methods. If None, a
+                DtlsDatagramTransport to the client's bridge is opened on start. Defaults to None.
+            frame_rate (float): Frames per second, the bridge expects between 25 and 50. Defaults to 50.
+            color_space (StreamColorSpace): Color space of the values passed to set_color. Defaults to RGB.
+        """
+
+        if client is None and transport is None:
+            raise ValueError('Either a client or a transport is required to stream')
+        if not 0.0 < frame_rate <= 60.0:
+            raise ValueError(f'Frame rate must be in (0, 60], got {frame_rate}')
+
+        self.configuration = configuration
+        self.client = client
+        self.transport = transport
+        self.frame_rate = frame_rate
+
+        channel_ids = [channel.channel_id for channel in configuration.channels]
+        self.frame = HueStreamFrame(configuration.id, channel_ids, color_space)
+
+        self._channel_index: Dict[int, int] = {channel_id: idx for idx, channel_id in enumerate(channel_ids)}
+        self._values: List[Tuple[float, float, float]] = [(0.0, 0.0, 0.0)] * len(channel_ids)
+        self._values_lock = threading.Lock()
+
+        self._sequence = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._owns_transport = False
+
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.send_errors = 0
+        self._sent_metric = _STREAM_FRAMES.labels('sent')
+        self._skipped_metric = _STREAM_FRAMES.labels('skipped')
+        self._failed_metric = _STREAM_FRAMES.labels('failed')
+
+    @property
+    def channel_ids(self) -> List[int]:
+        return self.frame.channel_ids
+
+    @property
+    def is_streaming(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_color(self, channel_id: int, value: Tuple[float, float, float]):
+        """Sets the color of a single channel, sent with the next frame.
+
+        Args:
+            channel_id (int): Channel id of the entertainment configuration
+            value (Tuple[float, float, float]): (r, g, b) or (x, y, brightness), each component in [0.0, 1.0]
+        """
+
+        with self._values_lock:
+            self._values[self._channel_index[channel_id]] = value
+
+    def set_colors(self, values: Sequence[Tuple[float, float, float]]):
+        """Sets the colors of all channels at once, in the order of channel_ids.
+
+        Args:
+            values (Sequence[Tuple[float, float, float]]): One value per channel
+        """
+
+        if len(values) != len(self._values):
+            raise ValueError(f'Expected {len(self._values)} channel values, got {len(values)}')
+
+        with self._values_lock:
+            self._values = list(values)
+
+    def start(self):
+        """Starts the entertainment configuration and the sender thread."""
+
+        if self.is_streaming:
+            return
+
+        if self.client is not None:
+            self.client.set_entertainment_configuration_action(self.configuration, EntertainmentAction.START)
+
+            if self.transport is None:
+                credential = self.client.application_key
+                try:
+                    self.transport = DtlsDatagramTransport(
+                        self.client.bridge_ip_address, credential.username, credential.clientkey
+                    )
+                except Exception:
+                    # The configuration is already started, left active it would block other streaming clients
+                    try:
+                        self.client.set_entertainment_configuration_action(self.configuration, EntertainmentAction.STOP)
+                    except Exception:
+                        _logger.debug('Unable to stop the entertainment configuration', exc_info=True)
+                    raise
+                self._owns_transport = True
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='EntertainmentStreamer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the sender thread and the entertainment configuration."""
+
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._owns_transport:
+            self.transport.close()
+            self.transport = None
+            self._owns_transport = False
+
+        if self.client is not None:
+            self.client.set_entertainment_configuration_action(self.configuration, EntertainmentAction.STOP)
+
+        _logger.info(f'Streamed {self.frames_sent} frames, skipped {self.frames_skipped}, errors {self.send_errors}')
+
+    def send_frame(self):
+        """Encodes the latest channel colors and sends them as a single frame."""
+
+        with self._values_lock:
+            data = self.frame.encode(self._sequence, self._values)
+
+        try:
+            self.transport.send(data)
+        except OSError:
+            self.send_errors += 1
+            self._failed_metric.inc()
+            _rate_limited_logger.debug('Failed to send entertainment frame', exc_info=True)
+            return
+
+        self._sequence = (self._sequence + 1) & 0xFF
+        self.frames_sent += 1
+        self._sent_metric.inc()
+
+    def _run(self):
+        period = 1.0 / self.frame_rate
+        next_deadline = time.monotonic()
+
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now < next_deadline:
+                self._stop_event.wait(next_deadline - now)
+                continue
+
+            self.send_frame()
+            next_deadline += period
+
+            # Skip the ticks we missed rather than catching up with a burst of stale frames
+            behind = time.monotonic() - next_deadline
+            if behind > period:
+                missed = int(behind / period)
+                self.frames_skipped += missed
+                self._skipped_metric.inc(missed)
+                next_deadline += missed * period
+
+    def __enter__(self) -> 'EntertainmentStreamer':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class LoopbackEntertainmentReceiver:
+    """A local stand-in for the bridge's streaming endpoint, used to measure throughput and frame loss.
+
+    Frames are received over plain UDP, decoded, and checked for gaps in the sequence ids.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        """Constructor.
+
+        Args:
+            host (str): Address to bind to. Defaults to 127.0.0.1.
+            port (int): Port to bind to, 0 picks a free port. Defaults to 0.
+        """
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.1)
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.frames_received = 0
+        self.frames_lost = 0
+        self.frames_invalid = 0
+        self.last_channels: List[Tuple[int, int, int, int]] = []
+        self._last_sequence: Optional[int] = None
+        self._first_frame_time: Optional[float] = None
+        self._last_frame_time: Optional[float] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._socket.getsockname()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='LoopbackEntertainmentReceiver', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._socket.close()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                data = self._socket.recv(frame_size(MAX_CHANNELS))
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            try:
+                sequence, _, _, channels = decode_frame(data)
+            except ValueError:
+                self.frames_invalid += 1
+                continue
+
+            now = time.monotonic()
+            if self._first_frame_time is None:
+                self._first_frame_time = now
+            self._last_frame_time = now
+
+            if self._last_sequence is not None:
+                self.frames_lost += (sequence - self._last_sequence - 1) & 0xFF
+            self._last_sequence = sequence
+            self.frames_received += 1
+            self.last_channels = channels
+
+    def stats(self) -> dict:
+        """Returns a JSON-style dict of throughput and loss statistics."""
+
+        elapsed = 0.0
+        if self._first_frame_time is not None and self._last_frame_time is not None:
+            elapsed = self._last_frame_time - self._first_frame_time
+        expected = self.frames_received + self.frames_lost
+
+        return {
+            'frames_received': self.frames_received,
+            'frames_lost': self.frames_lost,
+            'frames_invalid': self.frames_invalid,
+            'loss_ratio': self.frames_lost / expected if expected else 0.0,
+            'frames_per_second': (self.frames_received - 1) / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def __enter__(self) -> 'LoopbackEntertainmentReceiver':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,188 @@
+"""Synthetic Hue resources for benchmarks and local stand-ins for the bridge.
+
+Every function returns JSON-style dicts shaped like the responses of the CLIP v2 API. Ids are derived from the index
+so the same topology is generated on every call.
+"""
+import math
+import uuid
+from typing import Dict, List
+
+from core.lighting.hue.enums import ResourceType
+
+_NAMESPACE = uuid.UUID('8a0f6b5e-7c0e-4f64-9a55-2f6a8e6b1c3d')
+
+GAMUT_C = {
+    'red': {'x': 0.6915, 'y': 0.3083},
+    'green': {'x': 0.17, 'y': 0.7},
+    'blue': {'x': 0.1532, 'y': 0.0475},
+}
+
+
+def synthetic_id(kind: str, idx: int) -> str:
+    """Returns a stable UUID for the idx-th synthetic resource of a kind."""
+
+    return str(uuid.uuid5(_NAMESPACE, f'{kind}/{idx}'))
+
+
+def synthetic_light(idx: int) -> dict:
+    """A color light with every optional field this library decodes."""
+
+    return {
+        'type': ResourceType.LIGHT.value,
+        'id': synthetic_id('light', idx),
+        'id_v1': f'/lights/{idx + 1}',
+        'owner': {'rid': synthetic_id('device', idx), 'rtype': ResourceType.DEVICE.value},
+        'on': {'on': idx % 2 == 0},
+        'mode': 'normal',
+        'dimming': {'brightness': 100.0 * ((idx % 10) + 1) / 10, 'min_dim_level': 0.2},
+        'color_temperature': {
+            'mirek': 153 + idx % 347,
+            'mirek_valid': True,
+            'mirek_schema': {'mirek_minimum': 153, 'mirek_maximum': 500},
+        },
+        'color': {'xy': {'x': 0.3, 'y': 0.3}, 'gamut_type': 'C', 'gamut': GAMUT_C},
+        'dynamics': {
+            'status': 'none',
+            'status_values': ['none', 'dynamic_palette'],
+            'speed': 0.0,
+            'speed_valid': False,
+        },
+        'alert': {'action_values': ['breathe']},
+        'signaling': {},
+        'effects': {
+            'status_values': ['no_effect', 'candle', 'fire'],
+            'status': 'no_effect',
+            'effect_values': ['no_effect', 'candle', 'fire'],
+        },
+        'timed_effects': {
+            'effect': 'no_effect',
+            'status_values': ['no_effect', 'sunrise'],
+            'status': 'no_effect',
+            'effect_values': ['no_effect', 'sunrise'],
+        },
+        'power_up': {
+            'preset': 'safety',
+            'configured': True,
+            'on': {'mode': 'on', 'on': {'on': True}},
+            'dimming': {'mode': 'dimming', 'dimming': {'brightness': 100.0}},
+            'color': {'mode': 'color_temperature', 'color_temperature': {'mirek': 366}},
+        },
+    }
+
+
+def synthetic_device(idx: int) -> dict:
+    """The device owning the idx-th synthetic light, with a light and an entertainment service."""
+
+    return {
+        'type': ResourceType.DEVICE.value,
+        'id': synthetic_id('device', idx),
+        'id_v1': f'/lights/{idx + 1}',
+        'product_data': {
+            'model_id': 'LCA005',
+            'manufacturer_name': 'Signify Netherlands B.V.',
+            'product_name': 'Hue color lamp',
+            'product_archetype': 'sultan_bulb',
+            'certified': True,
+            'software_version': '1.104.2',
+        },
+        'metadata': {'name': f'Light {idx + 1}', 'archetype': 'sultan_bulb'},
+        'services': [
+            {'rid': synthetic_id('light', idx), 'rtype': ResourceType.LIGHT.value},
+            {'rid': synthetic_id('entertainment', idx), 'rtype': ResourceType.ENTERTAINMENT.value},
+        ],
+    }
+
+
+def synthetic_entertainment_configuration(idx: int, light_indexes: List[int]) -> dict:
+    """An entertainment configuration with one channel per light, placed on a circle around the listener."""
+
+    channels = []
+    service_locations = []
+    for channel_id, light_idx in enumerate(light_indexes):
+        angle = 2.0 * math.pi * channel_id / max(len(light_indexes), 1)
+        position = {'x': round(math.sin(angle), 4), 'y': round(math.cos(angle), 4), 'z': 0.0}
+        service = {'rid': synthetic_id('entertainment', light_idx), 'rtype': ResourceType.ENTERTAINMENT.value}
+
+        channels.append({'channel_id': channel_id, 'position': position, 'members': [{'index': 0, 'service': service}]})
+        service_locations.append({
+            'service': service, 'position': position, 'positions': [position], 'equalization_factor': 1.0
+        })
+
+    return {
+        'type': ResourceType.ENTERTAINMENT_CONFIGURATION.value,
+        'id': synthetic_id('entertainment_configuration', idx),
+        'metadata': {'name': f'Area {idx + 1}'},
+        'configuration_type': 'music',
+        'status': 'inactive',
+        'stream_proxy': {
+            'mode': 'auto',
+            'node': {'rid': synthetic_id('entertainment', light_indexes[0] if light_indexes else 0),
+                     'rtype': ResourceType.ENTERTAINMENT.value},
+        },
+        'channels': channels,
+        'locations': {'service_locations': service_locations},
+    }
+
+
+def synthetic_room(idx: int, light_indexes: List[int]) -> dict:
+    """A room of the devices of some lights, with the grouped_light service that controls all of them."""
+
+    return {
+        'type': ResourceType.ROOM.value,
+        'id': synthetic_id('room', idx),
+        'id_v1': f'/groups/{idx + 1}',
+        'children': [
+            {'rid': synthetic_id('device', light_idx), 'rtype': ResourceType.DEVICE.value}
+            for light_idx in light_indexes
+        ],
+        'services': [{'rid': synthetic_id('grouped_light', idx), 'rtype': ResourceType.GROUPED_LIGHT.value}],
+        'metadata': {'name': f'Room {idx + 1}', 'archetype': 'living_room'},
+    }
+
+
+def synthetic_grouped_light(idx: int) -> dict:
+    """The grouped_light service of the idx-th synthetic room."""
+
+    return {
+        'type': ResourceType.GROUPED_LIGHT.value,
+        'id': synthetic_id('grouped_light', idx),
+        'id_v1': f'/groups/{idx + 1}',
+        'owner': {'rid': synthetic_id('room', idx), 'rtype': ResourceType.ROOM.value},
+        'on': {'on': True},
+        'dimming': {'brightness': 100.0},
+    }
+
+
+def synthetic_topology(light_count: int, lights_per_configuration: int = 10, lights_per_room: int = 5
+                       ) -> Dict[ResourceType, List[dict]]:
+    """A full topology: one device per light, and lights grouped into entertainment configurations and into rooms,
+    each with a grouped_light.
+
+    Args:
+        light_count (int): Number of lights
+        lights_per_configuration (int): Number of lights in each entertainment configuration, the bridge allows at
+            most 20 channels. Defaults to 10.
+        lights_per_room (int): Number of lights in each room. Defaults to 5.
+
+    Returns:
+        Dict[ResourceType, List[dict]]: JSON-style resources by type
+    """
+
+    return {
+        ResourceType.LIGHT: [synthetic_light(idx) for idx in range(light_count)],
+        ResourceType.DEVICE: [synthetic_device(idx) for idx in range(light_count)],
+        ResourceType.ENTERTAINMENT_CONFIGURATION: [
+            synthetic_entertainment_configuration(
+                idx // lights_per_configuration,
+                list(range(idx, min(idx + lights_per_configuration, light_count)))
+            )
+            for idx in range(0, light_count, lights_per_configuration)
+        ],
+        ResourceType.ROOM: [
+            synthetic_room(idx // lights_per_room, list(range(idx, min(idx + lights_per_room, light_count))))
+            for idx in range(0, light_count, lights_per_room)
+        ],
+        ResourceType.GROUPED_LIGHT: [
+            synthetic_grouped_light(idx // lights_per_room) for idx in range(0, light_count, lights_per_room)
+        ],
+    }
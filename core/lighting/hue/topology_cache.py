@@ -0,0 +1,99 @@
+"""On-disk cache of the bridge's topology, so a restart can render before the bridge answered a single request.
+
+The cache holds the raw JSON of every decodable resource (lights, devices, entertainment configurations and rooms) as
+returned by GET /resource, gzip compressed. Raw JSON rather than the decoded dataclasses keeps the file independent of
+the dataclasses, and decoding it goes through the same compiled decoders as a bridge response.
+
+Validating a cache against a fresh listing is a per-resource diff, so only resources that were added, changed or
+removed since the cache was written need to be decoded and replaced in a registry.
+"""
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+class TopologyCache:
+    """A gzip compressed JSON file of resource items, written atomically."""
+
+    def __init__(self, path: str, bridge: Optional[str] = None):
+        """Constructor.
+
+        Args:
+            path (str): Path of the cache file
+            bridge (Optional[str]): Address of the bridge the cache belongs to. A cache written for another bridge is
+                ignored. Defaults to None.
+        """
+
+        self.path = path
+        self.bridge = bridge
+
+    def load(self) -> Optional[List[dict]]:
+        """Returns the cached resource items, or None if there is no usable cache."""
+
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            _logger.warning(f'Ignoring unreadable topology cache {self.path}: {e}')
+            return None
+
+        if cached.get('version') != CACHE_VERSION or cached.get('bridge') != self.bridge:
+            _logger.info(f'Ignoring topology cache {self.path} of another version or bridge')
+            return None
+
+        return cached['resources']
+
+    def save(self, items: List[dict]):
+        """Writes resource items, replacing the cache file only once the new one is complete."""
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporary_path = f'{self.path}.tmp'
+        with gzip.open(temporary_path, 'wt', encoding='utf-8', compresslevel=6) as cache_file:
+            json.dump(
+                {'version': CACHE_VERSION, 'bridge': self.bridge, 'saved_at': time.time(), 'resources': items},
+                cache_file,
+                separators=(',', ':')
+            )
+        os.replace(temporary_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def filter_resources(items: Iterable[dict], resource_types: Iterable[str]) -> List[dict]:
+    """Returns the items whose type is one of resource_types, e.g. the values of the decodable ResourceTypes."""
+
+    resource_types = set(resource_types)
+    return [item for item in items if item.get('type') in resource_types]
+
+
+def diff_resources(cached: Iterable[dict], fresh: Iterable[dict]) -> Tuple[List[dict], List[dict], List[str]]:
+    """Compares two listings of resource items by id.
+
+    Returns:
+        Tuple[List[dict], List[dict], List[str]]: (added items, changed items, ids of removed items)
+    """
+
+    cached_by_id: Dict[str, dict] = {item['id']: item for item in cached}
+
+    added = []
+    changed = []
+    for item in fresh:
+        previous = cached_by_id.pop(item['id'], None)
+        if previous is None:
+            added.append(item)
+        elif previous != item:
+            changed.append(item)
+
+    return added, changed, list(cached_by_id)
@@ -0,0 +1,169 @@
+"""HTTP transport used by the HueClient.
+
+Every request to the bridge goes through a single persistent requests.Session so that TCP and TLS handshakes are only
+paid when the pool has to open a new connection. The transport also records request latency per endpoint in the
+hue_request_duration_ms histogram of the metrics registry, split by whether the request reused a pooled connection or
+had to open a new one, which makes handshake cost visible.
+"""
+import logging
+import re
+import time
+from typing import Dict, List, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+_REQUESTS = REGISTRY.counter(
+    'hue_requests_total', 'Requests sent to the bridge by response status', ('endpoint', 'status')
+)
+_REQUEST_FAILURES = REGISTRY.counter(
+    'hue_request_failures_total', 'Requests to the bridge that got no response', ('endpoint', 'reason')
+)
+_REQUEST_DURATION = REGISTRY.histogram(
+    'hue_request_duration_ms', 'Latency of requests to the bridge in milliseconds', ('endpoint', 'connection')
+)
+
+
+class HueTransport:
+    """Persistent, pooled HTTP transport for the Hue bridge."""
+
+    NEW_CONNECTION = 'new_connection'
+    REUSED_CONNECTION = 'reused_connection'
+
+    # Resource ids are UUIDs, collapse them so latency is grouped by endpoint rather than by individual resource
+    _RESOURCE_ID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+    def __init__(
+        self,
+        pool_size: int = 4,
+        timeout: Union[float, Tuple[float, float]] = (3.05, 5.0),
+        retries: int = 2,
+        backoff_factor: float = 0.1,
+        retry_statuses: Tuple[int, ...] = (502, 503, 504),
+        verify: Union[bool, str] = False
+    ):
+        """Constructor.
+
+        Args:
+            pool_size (int): Maximum number of pooled keep-alive connections to the bridge. Defaults to 4.
+            timeout (Union[float, Tuple[float, float]]): Timeout in seconds passed to requests, either a single value
+                or a (connect, read) tuple. Defaults to (3.05, 5.0).
+            retries (int): Number of retries for failed connections and retryable statuses. Defaults to 2.
+            backoff_factor (float): Exponential backoff factor between retries in seconds. Defaults to 0.1.
+            retry_statuses (Tuple[int, ...]): HTTP statuses which are retried. Defaults to (502, 503, 504).
+            verify (Union[bool, str]): Passed to requests, either a bool or a path to a CA bundle. Defaults to False
+                because many Hue bridges do not support SSL verification.
+        """
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.verify = verify
+
+        self._retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=retry_statuses,
+            raise_on_status=False  # Let the caller parse the error body returned by the bridge
+        )
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=self._retry)
+
+        self._session = requests.Session()
+        self._session.mount('https://', self._adapter)
+        self._session.mount('http://', self._adapter)
+
+    def _endpoint_key(self, method: str, url: str) -> str:
+        """Normalizes a method and url into the key used for latency histograms."""
+
+        path = url.split('://', 1)[-1]
+        path = path[path.find('/'):] if '/' in path else '/'
+        return f'{method} {self._RESOURCE_ID_PATTERN.sub("{id}", path)}'
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends a request through the pooled session and records its latency.
+
+        Args:
+            method (str): HTTP method
+            url (str): Full URL to request
+            **kwargs: Passed through to requests.Session.request
+
+        Returns:
+            requests.Response: the HTTP response
+        """
+
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('verify', self.verify)
+
+        # The pool counts every connection it opens, so a change in that count means this request paid a handshake
+        pool = self._adapter.poolmanager.connection_from_url(url)
+        connections_before = pool.num_connections
+
+        endpoint = self._endpoint_key(method, url)
+        start = time.perf_counter()
+        try:
+            response = self._session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            _REQUEST_FAILURES.labels(endpoint, type(e).__name__).inc()
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+        connection = self.NEW_CONNECTION if pool.num_connections > connections_before else self.REUSED_CONNECTION
+        _REQUESTS.labels(endpoint, response.status_code).inc()
+        _REQUEST_DURATION.labels(endpoint, connection).observe(elapsed_ms)
+
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def latency_report(self) -> Dict[str, Dict[str, dict]]:
+        """Summarizes the hue_request_duration_ms histogram by endpoint and connection type. The histogram lives in
+        the metrics registry, so the report covers every transport of the process.
+
+        The difference between the new_connection and reused_connection means of an endpoint approximates the cost
+        of the TCP and TLS handshake.
+
+        Returns:
+            Dict[str, Dict[str, dict]]: endpoint -> connection type -> histogram summary, see MetricsRegistry.collect
+        """
+
+        report: Dict[str, Dict[str, dict]] = {}
+        for labels, child in _REQUEST_DURATION.children():
+            report.setdefault(labels['endpoint'], {})[labels['connection']] = child.summary()
+        return report
+
+    def log_latency_report(self, level: int = logging.INFO):
+        """Logs the latency report, one line per endpoint and connection type."""
+
+        lines: List[str] = []
+        for endpoint, histograms in sorted(self.latency_report().items()):
+            for connection, summary in sorted(histograms.items()):
+                lines.append(f'{endpoint} [{connection}] count {summary["count"]}, mean {summary["mean"]} ms, '
+                             f'p50 {summary["p50"]} ms, p90 {summary["p90"]} ms, p99 {summary["p99"]} ms')
+
+        for line in lines:
+            _logger.log(level, line)
+
+    def close(self):
+        """Closes all pooled connections."""
+
+        self._session.close()
+
+    def __enter__(self) -> 'HueTransport':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
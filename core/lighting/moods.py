@@ -0,0 +1,208 @@
+"""Moods restrict how audio features map to light colors and intensities.
+
+A Mood preset lists the hue ranges it allows, its saturation, the brightness bounds of _LightDimming.brightness and
+how responsive brightness is to the music. Presets are compiled once into lookup tables: a palette of allowed colors,
+already converted into xy for every gamut in use, and an intensity curve. Mapping a FeatureFrame to every light is then
+a handful of vectorized table lookups.
+
+MoodEngine holds the compiled tables behind a single reference. set_mood compiles the new tables first and then swaps
+the reference, which is atomic, so the render loop never waits on a lock and never sees half of a mood.
+"""
+import colorsys
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.lighting.hue.color import GamutTriangle, converter_for, gamut_triangle
+from core.lighting.hue.objects.light import Light
+
+if TYPE_CHECKING:
+    from core.audio.features import FeatureFrame
+
+# Resolution of the lookup tables
+PALETTE_SIZE = 1024
+INTENSITY_SIZE = 1024
+
+
+@dataclass
+class Mood:
+    """A mood preset. Hues are in degrees, brightness in the (0.0, 100.0] range of _LightDimming.brightness."""
+
+    name: str
+    hue_ranges: List[Tuple[float, float]] = field(default_factory=lambda: [(0.0, 360.0)])  # [start, end) degrees
+    saturation: float = 1.0             # [0.0, 1.0]
+    min_brightness: float = 1.0         # (0.0, 100.0]
+    max_brightness: float = 100.0       # (0.0, 100.0]
+    responsiveness: float = 1.0         # Exponent of the intensity curve, below 1 reacts more to quiet passages
+    release: float = 0.85               # Fraction of brightness kept per frame while the music gets quieter
+    hue_per_beat: float = 0.02          # Fraction of the palette the colors move on every beat
+    hue_spread: float = 0.5             # Fraction of the palette spread across the lights
+
+
+MOODS: Dict[str, Mood] = {mood.name: mood for mood in (
+    Mood('party'),
+    Mood('calm', hue_ranges=[(190.0, 280.0)], saturation=0.7, min_brightness=5.0, max_brightness=60.0,
+         responsiveness=0.6, release=0.95, hue_per_beat=0.005, hue_spread=0.3),
+    Mood('warm', hue_ranges=[(330.0, 360.0), (0.0, 50.0)], saturation=0.85, min_brightness=10.0,
+         max_brightness=80.0, responsiveness=0.8, release=0.9, hue_per_beat=0.01),
+    Mood('cool', hue_ranges=[(160.0, 250.0)], saturation=0.9, min_brightness=5.0, max_brightness=90.0),
+)}
+
+
+class CompiledMood:
+    """Lookup tables of a Mood. Immutable once built, except for the per-gamut palettes which are added lazily."""
+
+    def __init__(self, mood: Mood):
+        self.mood = mood
+
+        total = sum(end - start for start, end in mood.hue_ranges)
+        if total <= 0.0:
+            raise ValueError(f'Mood {mood.name} allows no hues')
+        if not 0.0 < mood.min_brightness <= mood.max_brightness <= 100.0:
+            raise ValueError(f'Mood {mood.name} needs 0 < min_brightness <= max_brightness <= 100')
+
+        # Palette positions are spread over the allowed ranges in proportion to their widths
+        positions = np.linspace(0.0, total, PALETTE_SIZE, endpoint=False)
+        hues = np.empty(PALETTE_SIZE)
+        offset = 0.0
+        for start, end in mood.hue_ranges:
+            in_range = (positions >= offset) & (positions < offset + end - start)
+            hues[in_range] = (start + positions[in_range] - offset) % 360.0
+            offset += end - start
+
+        self.palette_rgb = np.array(
+            [colorsys.hsv_to_rgb(hue / 360.0, mood.saturation, 1.0) for hue in hues], dtype=np.float64
+        )
+        self.intensity = mood.min_brightness + (mood.max_brightness - mood.min_brightness) * (
+            np.linspace(0.0, 1.0, INTENSITY_SIZE) ** mood.responsiveness
+        )
+        self._palettes_xy: Dict[GamutTriangle, np.ndarray] = {}
+
+    def palette_xy(self, triangle: GamutTriangle) -> np.ndarray:
+        """Returns the palette as xy clamped into a gamut, of shape (PALETTE_SIZE, 2)."""
+
+        palette = self._palettes_xy.get(triangle)
+        if palette is None:
+            palette = converter_for(triangle).convert(self.palette_rgb)[:, :2]
+            self._palettes_xy[triangle] = palette
+        return palette
+
+
+class MoodEngine:
+    """Maps FeatureFrames to a color and brightness for every light, within the current mood."""
+
+    def __init__(self, lights: Sequence[Optional[Light]], mood: Mood = MOODS['party'], peak_decay: float = 0.999):
+        """Constructor.
+
+        Args:
+            lights (Sequence[Optional[Light]]): Lights in the order values are produced. None stands for an output
+                without a known light, e.g. an entertainment channel, and uses the default gamut.
+            mood (Mood): Initial mood. Defaults to party.
+            peak_decay (float): Per frame decay of the running peak every band is normalized by. Defaults to 0.999.
+        """
+
+        self.lights = list(lights)
+        self.peak_decay = peak_decay
+
+        triangles = [gamut_triangle(light.color if light is not None else None) for light in self.lights]
+        self._triangles: List[GamutTriangle] = list(dict.fromkeys(triangles))
+        self._light_gamut = np.array([self._triangles.index(triangle) for triangle in triangles], dtype=np.intp)
+        self._light_offset = np.arange(len(self.lights)) / max(len(self.lights), 1)
+
+        # Preallocated per frame buffers, see map
+        count = len(self.lights)
+        self._band_of_light = np.zeros(0, dtype=np.intp)  # Sized on the first frame, once the band count is known
+        self._peaks = np.zeros(0)
+        self._level = np.zeros(count)
+        self._position = np.zeros(count)
+        self._palette_index = np.zeros(count, dtype=np.intp)
+        self._intensity_index = np.zeros(count, dtype=np.intp)
+        self.brightness = np.zeros(count)
+        self.xy = np.zeros((count, 2))
+        self.rgb = np.zeros((count, 3))
+        self._beats = 0
+
+        self._gamut_offset = self._light_gamut * PALETTE_SIZE
+        self._xy_index = np.zeros(count, dtype=np.intp)
+        self._ratio = np.zeros(0)
+        self._scratch = np.zeros(count)
+
+        self._compiled: Tuple[CompiledMood, np.ndarray] = self._compile(mood)
+
+    def _compile(self, mood: Mood) -> Tuple[CompiledMood, np.ndarray]:
+        """Returns the compiled mood and the xy palettes of all gamuts in use, stacked into one array."""
+
+        compiled = CompiledMood(mood)
+        palettes = [compiled.palette_xy(triangle) for triangle in self._triangles]
+        return compiled, np.concatenate(palettes) if palettes else np.zeros((0, 2))
+
+    @property
+    def mood(self) -> Mood:
+        return self._compiled[0].mood
+
+    def set_mood(self, mood: Mood):
+        """Switches moods. The tables are compiled on the calling thread and swapped in with a single assignment."""
+
+        self._compiled = self._compile(mood)
+
+    def map(self, frame: 'FeatureFrame'):
+        """Updates xy, rgb and brightness of every light from a FeatureFrame.
+
+        Every light follows the energy of one band, low bands on the first lights, normalized by the band's running
+        peak. Results are written into the preallocated xy, rgb and brightness arrays, in the order of lights.
+        """
+
+        compiled, palettes = self._compiled  # One read, the mood cannot change halfway through the frame
+        mood = compiled.mood
+
+        band_count = len(frame.bands)
+        if len(self._peaks) != band_count:
+            self._band_of_light = (np.arange(len(self.lights)) * band_count) // max(len(self.lights), 1)
+            self._peaks = np.full(band_count, 1e-9)
+            self._ratio = np.zeros(band_count)
+
+        np.multiply(self._peaks, self.peak_decay, out=self._peaks)
+        np.maximum(self._peaks, frame.bands, out=self._peaks)
+
+        # Level in [0.0, 1.0] per light, falling no faster than the mood's release
+        np.divide(frame.bands, self._peaks, out=self._ratio)
+        level = self._scratch
+        np.take(self._ratio, self._band_of_light, out=level)
+        np.sqrt(level, out=level)
+        np.multiply(self._level, mood.release, out=self._level)
+        np.maximum(self._level, level, out=self._level)
+        if frame.beat:
+            self._beats += 1
+
+        np.multiply(self._level, INTENSITY_SIZE - 1, out=level)
+        np.copyto(self._intensity_index, level, casting='unsafe')
+        np.take(compiled.intensity, self._intensity_index, out=self.brightness)
+
+        base = ((self._beats + frame.beat_phase) * mood.hue_per_beat) % 1.0
+        np.multiply(self._light_offset, mood.hue_spread, out=self._position)
+        np.add(self._position, base, out=self._position)
+        np.mod(self._position, 1.0, out=self._position)
+        np.multiply(self._position, PALETTE_SIZE - 1, out=self._position)
+        np.copyto(self._palette_index, self._position, casting='unsafe')
+
+        np.add(self._gamut_offset, self._palette_index, out=self._xy_index)
+        np.take(palettes, self._xy_index, axis=0, out=self.xy)
+        np.take(compiled.palette_rgb, self._palette_index, axis=0, out=self.rgb)
+
+    def stream_values(self) -> np.ndarray:
+        """Returns (x, y, brightness) per light with brightness in [0.0, 1.0], for StreamColorSpace.XY_BRIGHTNESS."""
+
+        return np.column_stack((self.xy, self.brightness / 100.0))
+
+    def apply_to_lights(self):
+        """Writes the mapped xy and brightness into the Light objects, e.g. before submitting them to a scheduler."""
+
+        for light, (x, y), brightness in zip(self.lights, self.xy.tolist(), self.brightness.tolist()):
+            if light is None:
+                continue
+            if light.color is not None:
+                light.color.xy.x = round(x, 4)
+                light.color.xy.y = round(y, 4)
+            if light.dimming is not None:
+                light.dimming.brightness = round(brightness, 1)
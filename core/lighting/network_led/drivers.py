@@ -0,0 +1,207 @@
+"""Strip drivers which send frames to network LED controllers over UDP.
+
+Both drivers plug into LedStrip like any other StripDriver, so frames are rendered with the same brightness and gamma
+table and then framed into preallocated packets. Controllers such as WLED expect pixels in RGB order and reorder them
+for their strips themselves, so strips driving them should use PixelOrder.RGB or PixelOrder.RGBW.
+
+Every packet of a frame is sent back to back from a single socket. Send errors are counted instead of raised, a
+controller rebooting or dropping off the network must not stop the render loop.
+
+For installs with several controllers, create every driver with synchronized=True and call sync_drivers once all of
+them have been written: controllers hold the frame until the sync packet arrives, so they all latch it together.
+"""
+import logging
+import socket
+from abc import abstractmethod
+from typing import Iterable, List, Optional, Tuple
+
+from core.lighting.network_led.protocols import (DDP_MAX_DATA, DDP_PORT, E131_PORT, DdpFramer, E131Framer,
+                                                 e131_multicast_address)
+from core.lighting.strip.drivers import StripDriver
+
+_logger = logging.getLogger(__name__)
+
+
+class NetworkStripDriver(StripDriver):
+    """Base class of drivers sending frames over UDP."""
+
+    def __init__(self, bytes_per_pixel: int = 3, synchronized: bool = False):
+        """Constructor.
+
+        Args:
+            bytes_per_pixel (int): 3 for RGB or 4 for RGBW strips. Defaults to 3.
+            synchronized (bool): If True, frames are only displayed on sync(). Defaults to False.
+        """
+
+        self.bytes_per_pixel = bytes_per_pixel
+        self.synchronized = synchronized
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._frame_size: Optional[int] = None
+
+        self.frames_sent = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.send_errors = 0
+
+    def write(self, buffer: bytearray):
+        # Packets are sized on the first frame, and again only if the strip length changes
+        if self._frame_size != len(buffer):
+            self._frame_size = len(buffer)
+            self._build(len(buffer))
+
+        self._send_frame(memoryview(buffer))
+        self.frames_sent += 1
+
+    @abstractmethod
+    def _build(self, frame_size: int):
+        """Preallocates the packets of frames of frame_size bytes."""
+
+        pass
+
+    @abstractmethod
+    def _send_frame(self, data: memoryview):
+        pass
+
+    @abstractmethod
+    def sync(self):
+        """Displays the frames written since the last sync, when synchronized."""
+
+        pass
+
+    def _send(self, packet: bytearray, address: tuple):
+        try:
+            self.bytes_sent += self._socket.sendto(packet, address)
+            self.packets_sent += 1
+        except OSError as e:
+            self.send_errors += 1
+            if self.send_errors == 1:
+                _logger.warning(f'Sending to {address[0]}:{address[1]} failed, further errors are only counted: {e}')
+
+    def stats(self) -> dict:
+        """Returns a JSON-style dict of sent frames, packets and errors."""
+
+        return {
+            'frames_sent': self.frames_sent,
+            'packets_sent': self.packets_sent,
+            'bytes_sent': self.bytes_sent,
+            'send_errors': self.send_errors,
+        }
+
+    def close(self):
+        self._socket.close()
+
+
+class DdpDriver(NetworkStripDriver):
+    """Sends frames with DDP, e.g. to WLED. Pixels are split into packets of up to 480 RGB pixels."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int = DDP_PORT,
+        bytes_per_pixel: int = 3,
+        synchronized: bool = False,
+        max_data: int = DDP_MAX_DATA
+    ):
+        """Constructor.
+
+        Args:
+            host (str): Address of the controller
+            port (int): Port of the controller. Defaults to DDP_PORT.
+            bytes_per_pixel (int): 3 for RGB or 4 for RGBW strips. Defaults to 3.
+            synchronized (bool): If True, no packet of a frame carries the push flag and frames are displayed by
+                sync(). Defaults to False.
+            max_data (int): Most pixel bytes per packet. Defaults to DDP_MAX_DATA.
+        """
+
+        super().__init__(bytes_per_pixel, synchronized)
+        self.address = (host, port)
+        self.max_data = max_data
+        self._framer: Optional[DdpFramer] = None
+
+    def _build(self, frame_size: int):
+        self._framer = DdpFramer(frame_size, self.bytes_per_pixel, self.max_data)
+
+    def _send_frame(self, data: memoryview):
+        assert self._framer is not None, 'write() builds the framer before the first frame'
+        for packet, _, _ in self._framer.frame(data, push=not self.synchronized):
+            self._send(packet, self.address)
+
+    def sync(self):
+        if self._framer is not None:
+            self._send(self._framer.push_packet, self.address)
+
+
+class E131Driver(NetworkStripDriver):
+    """Sends frames with E1.31 (sACN). Pixels are split into universes of 170 RGB or 128 RGBW pixels."""
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: int = E131_PORT,
+        bytes_per_pixel: int = 3,
+        start_universe: int = 1,
+        synchronized: bool = False,
+        sync_address: Optional[int] = None,
+        source_name: str = 'ambient_light_sync',
+        priority: int = 100
+    ):
+        """Constructor.
+
+        Args:
+            host (Optional[str]): Address of the controller. Defaults to None, which sends every universe to its
+                multicast group.
+            port (int): Port of the controller. Defaults to E131_PORT.
+            bytes_per_pixel (int): 3 for RGB or 4 for RGBW strips. Defaults to 3.
+            start_universe (int): Universe of the first pixels. Defaults to 1.
+            synchronized (bool): If True, universes carry a synchronization address and are displayed by sync().
+                Defaults to False.
+            sync_address (Optional[int]): Universe synchronization packets are sent to. Drivers latched together
+                should share it. Defaults to start_universe.
+            source_name (str): Name of this source shown by controllers. Defaults to ambient_light_sync.
+            priority (int): Priority of this source in [0, 200]. Defaults to 100.
+        """
+
+        super().__init__(bytes_per_pixel, synchronized)
+        self.host = host
+        self.port = port
+        self.start_universe = start_universe
+        self.sync_address = sync_address if sync_address is not None else start_universe
+        self.source_name = source_name
+        self.priority = priority
+
+        if host is None:
+            self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+
+        self._framer: Optional[E131Framer] = None
+        self._addresses: List[Tuple[str, int]] = []
+        self._sync_target = (host or e131_multicast_address(self.sync_address), port)
+
+    def _build(self, frame_size: int):
+        self._framer = E131Framer(
+            frame_size,
+            self.bytes_per_pixel,
+            start_universe=self.start_universe,
+            sync_address=self.sync_address if self.synchronized else 0,
+            source_name=self.source_name,
+            priority=self.priority
+        )
+        self._addresses = [
+            (self.host or e131_multicast_address(universe), self.port) for universe in self._framer.universes
+        ]
+
+    def _send_frame(self, data: memoryview):
+        assert self._framer is not None, 'write() builds the framer before the first frame'
+        for (packet, _, _, _), address in zip(self._framer.frame(data), self._addresses):
+            self._send(packet, address)
+
+    def sync(self):
+        if self._framer is not None and self.synchronized:
+            self._send(self._framer.next_sync_packet(), self._sync_target)
+
+
+def sync_drivers(drivers: Iterable[NetworkStripDriver]):
+    """Latches the frames written to synchronized drivers, as close together in time as possible."""
+
+    for driver in drivers:
+        driver.sync()
@@ -0,0 +1,234 @@
+"""Packet framing for network LED controllers, e.g. WLED on an ESP32.
+
+Two UDP protocols are supported:
+
+* DDP (Distributed Display Protocol, http://www.3waylabs.com/ddp/): pixel data addressed by byte offset, up to 1440
+  bytes per packet. Packets without the push flag are buffered by the controller, and a packet with the push flag
+  displays everything received so far.
+* E1.31 (sACN, ANSI E1.31-2018): DMX universes of up to 512 channels. Universes carrying a synchronization address are
+  held by the controller until a synchronization packet for that address arrives.
+
+Framers split a frame across as many packets (DDP) or universes (E1.31) as needed. Every packet is preallocated with
+its header filled in once, so framing a frame only copies pixel bytes and patches sequence numbers.
+"""
+import struct
+import uuid
+from typing import List, Optional, Tuple
+
+DDP_PORT = 4048
+DDP_MAX_DATA = 1440  # 480 RGB pixels, keeps packets below a typical MTU
+
+_DDP_HEADER = struct.Struct('!BBBBIH')
+_DDP_VERSION_1 = 0x40
+_DDP_PUSH = 0x01
+_DDP_TYPE_RGB8 = 0x0B
+_DDP_TYPE_RGBW8 = 0x1B
+_DDP_DEFAULT_OUTPUT = 0x01
+
+E131_PORT = 5568
+E131_MAX_CHANNELS = 512
+
+_ACN_PACKET_IDENTIFIER = b'ASC-E1.17\x00\x00\x00'
+_VECTOR_ROOT_E131_DATA = 0x00000004
+_VECTOR_ROOT_E131_EXTENDED = 0x00000008
+_VECTOR_E131_DATA_PACKET = 0x00000002
+_VECTOR_E131_EXTENDED_SYNCHRONIZATION = 0x00000001
+_VECTOR_DMP_SET_PROPERTY = 0x02
+
+_E131_DATA_OFFSET = 126
+_E131_SEQUENCE_OFFSET = 111
+_E131_SYNC_PACKET_SIZE = 49
+
+
+class DdpFramer:
+    """Splits frames into DDP packets."""
+
+    def __init__(self, frame_size: int, bytes_per_pixel: int = 3, max_data: int = DDP_MAX_DATA):
+        """Constructor.
+
+        Args:
+            frame_size (int): Bytes per frame, pixels * bytes_per_pixel
+            bytes_per_pixel (int): 3 for RGB or 4 for RGBW. Defaults to 3.
+            max_data (int): Most pixel bytes per packet, rounded down to whole pixels. Defaults to DDP_MAX_DATA.
+        """
+
+        self.frame_size = frame_size
+        data_type = _DDP_TYPE_RGBW8 if bytes_per_pixel == 4 else _DDP_TYPE_RGB8
+        max_data -= max_data % bytes_per_pixel
+
+        # (packet, first byte of the frame it carries, number of bytes)
+        self.packets: List[Tuple[bytearray, int, int]] = []
+        for offset in range(0, frame_size, max_data):
+            length = min(max_data, frame_size - offset)
+            packet = bytearray(_DDP_HEADER.size + length)
+            _DDP_HEADER.pack_into(packet, 0, _DDP_VERSION_1, 0, data_type, _DDP_DEFAULT_OUTPUT, offset, length)
+            self.packets.append((packet, offset, length))
+
+        self.push_packet = bytearray(_DDP_HEADER.size)
+        _DDP_HEADER.pack_into(self.push_packet, 0, _DDP_VERSION_1 | _DDP_PUSH, 0, data_type, _DDP_DEFAULT_OUTPUT, 0, 0)
+
+        self._sequence = 0
+
+    def frame(self, data: memoryview, push: bool = True) -> List[Tuple[bytearray, int, int]]:
+        """Copies a frame into the packets.
+
+        Args:
+            data (memoryview): The frame, frame_size bytes
+            push (bool): If True, the last packet displays the frame. If False, the frame is only displayed by a
+                later push packet, see push_packet. Defaults to True.
+
+        Returns:
+            List[Tuple[bytearray, int, int]]: The packets, reused by the next call
+        """
+
+        last = len(self.packets) - 1
+        for idx, (packet, offset, length) in enumerate(self.packets):
+            self._sequence = self._sequence % 15 + 1  # 1 to 15 per packet, 0 means sequence numbers are not used
+            packet[0] = _DDP_VERSION_1 | (_DDP_PUSH if push and idx == last else 0)
+            packet[1] = self._sequence
+            packet[_DDP_HEADER.size:] = data[offset:offset + length]
+
+        return self.packets
+
+
+def decode_ddp(packet: bytes) -> Tuple[bool, int, int, memoryview]:
+    """Returns (push, sequence, offset, data) of a DDP packet.
+
+    Raises:
+        ValueError: If packet is not a DDP version 1 packet
+    """
+
+    if len(packet) < _DDP_HEADER.size:
+        raise ValueError('Packet is shorter than a DDP header')
+
+    flags, sequence, _, _, offset, length = _DDP_HEADER.unpack_from(packet, 0)
+    if flags & 0xC0 != _DDP_VERSION_1:
+        raise ValueError('Not a DDP version 1 packet')
+
+    data = memoryview(packet)[_DDP_HEADER.size:_DDP_HEADER.size + length]
+    return bool(flags & _DDP_PUSH), sequence & 0x0F, offset, data
+
+
+def _pack_root_layer(packet: bytearray, vector: int, cid: bytes):
+    struct.pack_into('!HH12sHI16s', packet, 0, 0x0010, 0x0000, _ACN_PACKET_IDENTIFIER,
+                     0x7000 | (len(packet) - 16), vector, cid)
+
+
+class E131Framer:
+    """Splits frames into E1.31 universes."""
+
+    def __init__(
+        self,
+        frame_size: int,
+        bytes_per_pixel: int = 3,
+        start_universe: int = 1,
+        sync_address: int = 0,
+        source_name: str = 'ambient_light_sync',
+        priority: int = 100,
+        cid: Optional[uuid.UUID] = None
+    ):
+        """Constructor.
+
+        Args:
+            frame_size (int): Bytes per frame, pixels * bytes_per_pixel
+            bytes_per_pixel (int): 3 for RGB or 4 for RGBW, pixels never straddle two universes. Defaults to 3.
+            start_universe (int): Universe of the first pixels. Defaults to 1.
+            sync_address (int): Universe synchronization packets are sent to, 0 to display every universe as soon as
+                it arrives. Defaults to 0.
+            source_name (str): Name of this source shown by controllers. Defaults to ambient_light_sync.
+            priority (int): Priority of this source in [0, 200]. Defaults to 100.
+            cid (Optional[uuid.UUID]): Component identifier of this source. Defaults to a random one.
+        """
+
+        self.frame_size = frame_size
+        self.channels_per_universe = E131_MAX_CHANNELS - E131_MAX_CHANNELS % bytes_per_pixel
+        self.start_universe = start_universe
+        self.sync_address = sync_address
+        self.cid = (cid or uuid.uuid4()).bytes
+
+        # (packet, universe, first byte of the frame it carries, number of bytes)
+        self.packets: List[Tuple[bytearray, int, int, int]] = []
+        name = source_name.encode('utf-8')[:63]
+        for idx, offset in enumerate(range(0, frame_size, self.channels_per_universe)):
+            universe = start_universe + idx
+            channels = min(self.channels_per_universe, frame_size - offset)
+            packet = bytearray(_E131_DATA_OFFSET + channels)
+
+            _pack_root_layer(packet, _VECTOR_ROOT_E131_DATA, self.cid)
+            struct.pack_into('!HI64sBHBBH', packet, 38, 0x7000 | (len(packet) - 38), _VECTOR_E131_DATA_PACKET, name,
+                             priority, sync_address, 0, 0, universe)
+            struct.pack_into('!HBBHHH', packet, 115, 0x7000 | (len(packet) - 115), _VECTOR_DMP_SET_PROPERTY, 0xA1,
+                             0x0000, 0x0001, channels + 1)
+            packet[125] = 0x00  # DMX start code
+
+            self.packets.append((packet, universe, offset, channels))
+
+        self.sync_packet = bytearray(_E131_SYNC_PACKET_SIZE)
+        _pack_root_layer(self.sync_packet, _VECTOR_ROOT_E131_EXTENDED, self.cid)
+        struct.pack_into('!HIBHH', self.sync_packet, 38, 0x7000 | (_E131_SYNC_PACKET_SIZE - 38),
+                         _VECTOR_E131_EXTENDED_SYNCHRONIZATION, 0, sync_address, 0)
+
+        self._sequence = 0
+        self._sync_sequence = 0
+
+    @property
+    def universes(self) -> List[int]:
+        return [universe for _, universe, _, _ in self.packets]
+
+    def frame(self, data: memoryview) -> List[Tuple[bytearray, int, int, int]]:
+        """Copies a frame into the universe packets.
+
+        Returns:
+            List[Tuple[bytearray, int, int, int]]: The packets, reused by the next call
+        """
+
+        # A single sequence counter for all universes, each universe still sees consecutive numbers
+        self._sequence = (self._sequence + 1) & 0xFF
+        for packet, _, offset, channels in self.packets:
+            packet[_E131_SEQUENCE_OFFSET] = self._sequence
+            packet[_E131_DATA_OFFSET:] = data[offset:offset + channels]
+
+        return self.packets
+
+    def next_sync_packet(self) -> bytearray:
+        """Returns the synchronization packet with its next sequence number."""
+
+        self._sync_sequence = (self._sync_sequence + 1) & 0xFF
+        self.sync_packet[44] = self._sync_sequence
+        return self.sync_packet
+
+
+def e131_multicast_address(universe: int) -> str:
+    """Returns the multicast group of a universe, 239.255.<high byte>.<low byte>."""
+
+    return f'239.255.{(universe >> 8) & 0xFF}.{universe & 0xFF}'
+
+
+def decode_e131(packet: bytes) -> Tuple[bool, int, int, int, memoryview]:
+    """Decodes an E1.31 data or synchronization packet.
+
+    Returns:
+        Tuple[bool, int, int, int, memoryview]: (is_sync, universe, sequence, sync_address, data). For
+            synchronization packets, universe is 0 and data is empty.
+
+    Raises:
+        ValueError: If packet is not an E1.31 data or synchronization packet
+    """
+
+    if len(packet) < _E131_SYNC_PACKET_SIZE or packet[4:16] != _ACN_PACKET_IDENTIFIER:
+        raise ValueError('Not an E1.31 packet')
+
+    root_vector, = struct.unpack_from('!I', packet, 18)
+    if root_vector == _VECTOR_ROOT_E131_EXTENDED:
+        vector, sequence, sync_address = struct.unpack_from('!IBH', packet, 40)
+        if vector != _VECTOR_E131_EXTENDED_SYNCHRONIZATION:
+            raise ValueError('Unsupported E1.31 extended packet')
+        return True, 0, sequence, sync_address, memoryview(b'')
+
+    if root_vector != _VECTOR_ROOT_E131_DATA or len(packet) < _E131_DATA_OFFSET:
+        raise ValueError('Unsupported E1.31 packet')
+
+    sync_address, sequence, _, universe = struct.unpack_from('!HBBH', packet, 109)
+    value_count, = struct.unpack_from('!H', packet, 123)
+    data = memoryview(packet)[_E131_DATA_OFFSET:_E131_DATA_OFFSET + value_count - 1]
+    return False, universe, sequence, sync_address, data
@@ -0,0 +1,172 @@
+"""A local stand-in for a network LED controller, used to measure throughput and packet loss of the drivers."""
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from core.lighting.network_led.protocols import E131_MAX_CHANNELS, decode_ddp, decode_e131
+
+_MAX_PACKET = 2048
+
+
+class LoopbackLedReceiver:
+    """Receives DDP or E1.31 packets over plain UDP, reassembles frames and checks sequence numbers for gaps.
+
+    A frame is complete on a DDP packet with the push flag, on an E1.31 synchronization packet, or for unsynchronized
+    E1.31 when the first universe of the next frame arrives. The most recent complete frame is kept in last_frame.
+    """
+
+    def __init__(
+        self,
+        protocol: str = 'ddp',
+        host: str = '127.0.0.1',
+        port: int = 0,
+        bytes_per_pixel: int = 3,
+        receive_buffer: int = 1 << 21
+    ):
+        """Constructor.
+
+        Args:
+            protocol (str): ddp or e131. Defaults to ddp.
+            host (str): Address to bind to. Defaults to 127.0.0.1.
+            port (int): Port to bind to, 0 picks a free port. Defaults to 0.
+            bytes_per_pixel (int): 3 for RGB or 4 for RGBW, sets the channels per E1.31 universe. Defaults to 3.
+            receive_buffer (int): Requested socket receive buffer in bytes, larger buffers drop fewer packets in
+                bursts. Defaults to 2 MiB.
+        """
+
+        if protocol not in ('ddp', 'e131'):
+            raise ValueError(f'Unknown protocol {protocol}, expected ddp or e131')
+        self.protocol = protocol
+        self._channels_per_universe = E131_MAX_CHANNELS - E131_MAX_CHANNELS % bytes_per_pixel
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.1)
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.packets_received = 0
+        self.packets_lost = 0
+        self.packets_invalid = 0
+        self.frames_received = 0
+        self.sync_packets_received = 0
+        self.last_frame: Optional[np.ndarray] = None
+
+        self._frame = bytearray()
+        self._last_sequences: Dict[int, int] = {}  # Per universe for E1.31, a single key for DDP
+        self._first_frame_time: Optional[float] = None
+        self._last_frame_time: Optional[float] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._socket.getsockname()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='LoopbackLedReceiver', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._socket.close()
+
+    def _run(self):
+        packet = bytearray(_MAX_PACKET)
+        while not self._stop_event.is_set():
+            try:
+                size = self._socket.recv_into(packet)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            try:
+                if self.protocol == 'ddp':
+                    self._on_ddp(memoryview(packet)[:size])
+                else:
+                    self._on_e131(memoryview(packet)[:size])
+            except ValueError:
+                self.packets_invalid += 1
+
+    def _store(self, offset: int, data: memoryview):
+        end = offset + len(data)
+        if len(self._frame) < end:
+            self._frame.extend(bytes(end - len(self._frame)))
+        self._frame[offset:end] = data
+
+    def _check_sequence(self, key: int, sequence: int, modulo: int, first: int):
+        last = self._last_sequences.get(key)
+        if last is not None:
+            # Sequences run first, ..., modulo - 1 and wrap around to first
+            self.packets_lost += (sequence - last - 1) % (modulo - first)
+        self._last_sequences[key] = sequence
+
+    def _on_ddp(self, packet: memoryview):
+        push, sequence, offset, data = decode_ddp(packet)
+        self.packets_received += 1
+        if len(data):
+            if sequence:
+                self._check_sequence(0, sequence, 16, 1)
+            self._store(offset, data)
+        elif push:
+            self.sync_packets_received += 1
+        if push:
+            self._complete_frame()
+
+    def _on_e131(self, packet: memoryview):
+        is_sync, universe, sequence, sync_address, data = decode_e131(packet)
+        self.packets_received += 1
+        if is_sync:
+            self.sync_packets_received += 1
+            self._complete_frame()
+            return
+
+        self._check_sequence(universe, sequence, 256, 0)
+        first_universe = min(self._last_sequences)
+        if not sync_address and universe == first_universe and self._frame:
+            # Unsynchronized universes carry no frame boundary, the first universe arriving again starts a new frame
+            self._complete_frame()
+        # Universes are stored back to back in the order of their numbers, as sent by E131Framer
+        self._store((universe - first_universe) * self._channels_per_universe, data)
+
+    def _complete_frame(self):
+        now = time.monotonic()
+        if self._first_frame_time is None:
+            self._first_frame_time = now
+        self._last_frame_time = now
+
+        self.frames_received += 1
+        self.last_frame = np.frombuffer(bytes(self._frame), dtype=np.uint8)
+
+    def stats(self) -> dict:
+        """Returns a JSON-style dict of throughput and loss statistics."""
+
+        elapsed = 0.0
+        if self._first_frame_time is not None and self._last_frame_time is not None:
+            elapsed = self._last_frame_time - self._first_frame_time
+        expected = self.packets_received + self.packets_lost
+
+        return {
+            'packets_received': self.packets_received,
+            'packets_lost': self.packets_lost,
+            'packets_invalid': self.packets_invalid,
+            'sync_packets_received': self.sync_packets_received,
+            'frames_received': self.frames_received,
+            'loss_ratio': self.packets_lost / expected if expected else 0.0,
+            'frames_per_second': (self.frames_received - 1) / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def __enter__(self) -> 'LoopbackLedReceiver':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,356 @@
+"""Fans rendered frames out to every light output at once.
+
+A rendered frame is an array of shape (N, 3) of sRGB colors in [0.0, 1.0], brightness included. Every output backend
+maps it onto its own lights, e.g. resampled across the pixels of a strip or converted into xy for Hue lights.
+
+Outputs differ in speed by orders of magnitude: a network LED frame is sent in microseconds while a Hue REST call takes
+tens of milliseconds. FrameRouter gives every backend a thread and a small bounded queue of its own. When a backend
+falls behind, the oldest queued frame is dropped for the newest, so a slow output only ever shows its most recent
+frame late and never holds up the render loop or the other outputs. Per-backend latency and drop counters show which
+output is the bottleneck.
+"""
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from functools import lru_cache
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.lighting.hue.color import DEFAULT_GAMUT_TRIANGLE, LightColorConverter, converter_for
+from core.lighting.hue.enums import StreamColorSpace
+from core.lighting.hue.objects.light import Light
+from core.metrics import REGISTRY
+from core.render_loop import RENDER_BUCKETS_MS
+from core.throttled_logging import RateLimitedLogger
+
+if TYPE_CHECKING:
+    from core.lighting.hue.client import HueClient
+    from core.lighting.hue.scheduler import CommandScheduler
+    from core.lighting.hue.streaming import EntertainmentStreamer
+    from core.lighting.strip.strip import LedStrip
+
+_logger = logging.getLogger(__name__)
+_rate_limited_logger = RateLimitedLogger(_logger)
+
+_FRAMES = REGISTRY.counter('output_frames_total', 'Frames of every output by outcome', ('output', 'outcome'))
+_WRITE_DURATION = REGISTRY.histogram(
+    'output_write_duration_ms', 'Time an output took to write a frame in milliseconds', ('output',),
+    buckets=RENDER_BUCKETS_MS
+)
+_LATENCY = REGISTRY.histogram(
+    'output_latency_ms', 'Time from submitting a frame until an output wrote it in milliseconds', ('output',),
+    buckets=RENDER_BUCKETS_MS
+)
+
+
+@lru_cache(maxsize=64)
+def _resample_index(source_count: int, target_count: int) -> np.ndarray:
+    """Returns the source index every target index takes its color from, nearest neighbour."""
+
+    return (np.arange(target_count) * source_count) // max(target_count, 1)
+
+
+def resample(frame: np.ndarray, count: int) -> np.ndarray:
+    """Stretches or shrinks a frame to count colors, e.g. 10 rendered colors across a strip of 300 pixels."""
+
+    if len(frame) == count:
+        return frame
+    return frame[_resample_index(len(frame), count)]
+
+
+class OutputBackend(ABC):
+    """Base class of the light outputs a FrameRouter drives. write() is only ever called from one thread."""
+
+    name: str
+
+    @abstractmethod
+    def write(self, frame: np.ndarray):
+        """Maps a frame onto the output and sends it. Must not modify frame, it is shared with other backends."""
+
+        pass
+
+    def close(self):
+        pass
+
+
+class HueLightsBackend(OutputBackend):
+    """Sets Hue lights over the REST API, one color of the frame per light.
+
+    Colors are converted into xy within every light's own gamut, and brightness follows the brightest component.
+    Lights whose rounded state did not change are not sent. Without a scheduler every light is put in turn on the
+    backend's thread, with a CommandScheduler the changed lights are handed over to it instead.
+    """
+
+    def __init__(
+        self,
+        client: 'HueClient',
+        lights: Sequence[Light],
+        scheduler: Optional['CommandScheduler'] = None,
+        name: str = 'hue'
+    ):
+        """Constructor.
+
+        Args:
+            client (HueClient): Client the lights are put through
+            lights (Sequence[Light]): Lights in the order the frame is spread across them
+            scheduler (Optional[CommandScheduler]): If set, lights are submitted to it rather than put directly.
+                Defaults to None.
+            name (str): Name in the router's stats. Defaults to hue.
+        """
+
+        self.client = client
+        self.lights = list(lights)
+        self.scheduler = scheduler
+        self.name = name
+        self._converter = LightColorConverter(self.lights)
+
+    def write(self, frame: np.ndarray):
+        rgb = resample(frame, len(self.lights))
+        xy = self._converter.convert(rgb)[:, :2].tolist()
+        brightness = (np.max(rgb, axis=1) * 100.0).tolist()
+
+        changed = []
+        for light, (x, y), level in zip(self.lights, xy, brightness):
+            if light.on is not None:
+                light.on.on = level >= 1.0
+            if light.color is not None:
+                light.color.xy.x = round(x, 4)
+                light.color.xy.y = round(y, 4)
+            if light.dimming is not None and level >= 1.0:
+                light.dimming.brightness = round(level, 1)
+            if light.to_put():
+                changed.append(light)
+
+        if self.scheduler is not None:
+            self.scheduler.submit_all(changed)
+        else:
+            for light in changed:
+                self.client.put_light(light)
+
+
+class EntertainmentBackend(OutputBackend):
+    """Hands frames to an EntertainmentStreamer, one color of the frame per channel.
+
+    The streamer sends on its own thread at its own rate, so write() only updates the colors it sends next.
+    """
+
+    def __init__(self, streamer: 'EntertainmentStreamer', name: str = 'entertainment'):
+        self.streamer = streamer
+        self.name = name
+        self._xy_brightness = streamer.frame.color_space == StreamColorSpace.XY_BRIGHTNESS
+
+    def write(self, frame: np.ndarray):
+        values = resample(frame, len(self.streamer.channel_ids))
+        if self._xy_brightness:
+            # Channels may group lights of different gamuts, the bridge clamps them into each light's own
+            rgb = values
+            values = converter_for(DEFAULT_GAMUT_TRIANGLE).convert(rgb)
+            values[:, 2] = np.max(rgb, axis=1)
+        self.streamer.set_colors(values.tolist())
+
+
+class StripBackend(OutputBackend):
+    """Shows frames on an LedStrip, stretched across its pixels. Works with any strip driver, network LEDs included."""
+
+    def __init__(self, strip: 'LedStrip', name: str = 'strip'):
+        self.strip = strip
+        self.name = name
+
+    def write(self, frame: np.ndarray):
+        self.strip.set_frame(resample(frame, self.strip.pixel_count))
+        self.strip.show()
+
+    def close(self):
+        self.strip.close()
+
+
+class _BackendWorker:
+    """The queue, thread and counters of a single backend."""
+
+    def __init__(self, backend: OutputBackend, queue_size: int):
+        self.backend = backend
+        self._queue: Deque[Tuple[float, np.ndarray]] = deque(maxlen=queue_size)
+        self._condition = threading.Condition()
+        self._stop = False
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.frames_submitted = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.errors = 0
+
+        self._written_metric = _FRAMES.labels(backend.name, 'written')
+        self._dropped_metric = _FRAMES.labels(backend.name, 'dropped')
+        self._failed_metric = _FRAMES.labels(backend.name, 'failed')
+        self._write_duration_metric = _WRITE_DURATION.labels(backend.name)
+        self._latency_metric = _LATENCY.labels(backend.name)
+
+    def submit(self, submitted: float, frame: np.ndarray):
+        with self._condition:
+            self.frames_submitted += 1
+            if len(self._queue) == self._queue.maxlen:
+                self.frames_dropped += 1  # The deque discards the oldest frame on append
+                self._dropped_metric.inc()
+            self._queue.append((submitted, frame))
+            self._condition.notify()
+
+    def start(self):
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name=f'FrameRouter-{self.backend.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float]):
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def flush(self, deadline: float) -> bool:
+        """Waits until the queue is empty and no write is in progress, or until deadline on the monotonic clock."""
+
+        with self._condition:
+            while self._queue or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stop:
+                    self._condition.wait()
+                if self._stop:
+                    return
+                submitted, frame = self._queue.popleft()
+                self._busy = True
+
+            start = time.monotonic()
+            try:
+                self.backend.write(frame)
+                self.frames_written += 1
+                self._written_metric.inc()
+            except Exception:
+                # A failing output must not stop the others, the next frame tries again
+                self.errors += 1
+                self._failed_metric.inc()
+                if self.errors == 1:
+                    _logger.exception(f'Output {self.backend.name} failed, further failures are only counted')
+                else:
+                    _rate_limited_logger.debug('Output %s failed', self.backend.name, exc_info=True)
+            finished = time.monotonic()
+            self._write_duration_metric.observe((finished - start) * 1000.0)
+            self._latency_metric.observe((finished - submitted) * 1000.0)
+
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        with self._condition:
+            depth = len(self._queue)
+        return {
+            'frames_submitted': self.frames_submitted,
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'errors': self.errors,
+            'queue_depth': depth,
+            'latency': self._latency_metric.summary(),
+            'write_time': self._write_duration_metric.summary(),
+        }
+
+
+class FrameRouter:
+    """Dispatches every frame to all backends in parallel, each with a bounded latest-frame-wins queue."""
+
+    def __init__(self, backends: Sequence[OutputBackend] = (), queue_size: int = 1):
+        """Constructor.
+
+        Args:
+            backends (Sequence[OutputBackend]): Initial backends, more can be added with add_backend. Defaults to none.
+            queue_size (int): Frames a backend may have waiting before the oldest is dropped. Defaults to 1, i.e. a
+                busy backend only ever writes the newest frame next.
+        """
+
+        if queue_size < 1:
+            raise ValueError(f'Queue size must be at least 1, got {queue_size}')
+
+        self.queue_size = queue_size
+        self._workers: Dict[str, _BackendWorker] = {}
+        self._running = False
+        for backend in backends:
+            self.add_backend(backend)
+
+    @property
+    def backends(self) -> List[OutputBackend]:
+        return [worker.backend for worker in self._workers.values()]
+
+    def add_backend(self, backend: OutputBackend) -> 'FrameRouter':
+        if backend.name in self._workers:
+            raise ValueError(f'Duplicate backend name {backend.name}')
+
+        worker = _BackendWorker(backend, self.queue_size)
+        self._workers[backend.name] = worker
+        if self._running:
+            worker.start()
+        return self
+
+    def submit(self, frame: np.ndarray) -> np.ndarray:
+        """Queues a frame for every backend and returns it, so the router can be used as a RenderLoop stage.
+
+        The frame is copied once and shared by all backends, callers may reuse their array right away.
+        """
+
+        shared = np.array(frame, dtype=np.float64)
+        shared.flags.writeable = False
+        submitted = time.monotonic()
+        for worker in self._workers.values():
+            worker.submit(submitted, shared)
+        return frame
+
+    def start(self):
+        self._running = True
+        for worker in self._workers.values():
+            worker.start()
+
+    def flush(self, timeout: float = 1.0) -> bool:
+        """Waits until every backend wrote its queued frames. Returns False if timeout elapsed first."""
+
+        deadline = time.monotonic() + timeout
+        return all([worker.flush(deadline) for worker in self._workers.values()])
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Stops all backend threads without writing queued frames, see flush, and closes the backends."""
+
+        self._running = False
+        for worker in self._workers.values():
+            worker.stop(timeout)
+        for worker in self._workers.values():
+            worker.backend.close()
+
+    def __enter__(self) -> 'FrameRouter':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stats(self) -> Dict[str, dict]:
+        """Returns a JSON-style dict of queue, drop and latency statistics per backend name."""
+
+        return {name: worker.stats() for name, worker in self._workers.items()}
+
+    def log_stats(self):
+        for name, stats in self.stats().items():
+            _logger.info(
+                f'Output {name}: wrote {stats["frames_written"]}/{stats["frames_submitted"]} frames, dropped '
+                f'{stats["frames_dropped"]}, {stats["errors"]} errors, latency p50 {stats["latency"]["p50"]:.2f} '
+                f'ms p99 {stats["latency"]["p99"]:.2f} ms, write p99 {stats["write_time"]["p99"]:.2f} ms'
+            )
@@ -0,0 +1,160 @@
+"""Drivers which put the frame buffer of an LedStrip on the wire.
+
+Every driver receives the strip's own bytearray in wire order and must not hold on to it past write(), since the strip
+renders the next frame into the same buffer.
+"""
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
+
+from core.exceptions import MissingDependencyException
+from core.metrics import LatencyHistogram
+from core.render_loop import RENDER_BUCKETS_MS
+
+_logger = logging.getLogger(__name__)
+
+# WS2812 style strips clock 24 bits per RGB pixel at 800 kHz, plus a latch of at least 50 us
+WS2812_BIT_SECONDS = 1.25e-6
+WS2812_LATCH_SECONDS = 50e-6
+
+
+class StripDriver(ABC):
+    """Base class of all LED strip drivers."""
+
+    @abstractmethod
+    def write(self, buffer: bytearray):
+        """Sends a frame in wire order. Must not keep a reference to buffer after returning."""
+
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> 'StripDriver':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SimulatedStripDriver(StripDriver):
+    """Records frames and their timing instead of driving hardware, so strips run on any machine.
+
+    The last max_frames frames are kept in a preallocated array, and write times and intervals between frames go into
+    fixed-bucket histograms.
+    """
+
+    def __init__(self, max_frames: int = 64, simulate_wire_time: bool = False):
+        """Constructor.
+
+        Args:
+            max_frames (int): Number of most recent frames kept. Defaults to 64.
+            simulate_wire_time (bool): If True, write() takes as long as clocking the frame out to a WS2812 strip
+                would. Defaults to False.
+        """
+
+        self.max_frames = max_frames
+        self.simulate_wire_time = simulate_wire_time
+
+        self.frames: Optional[np.ndarray] = None  # (max_frames, frame bytes), allocated on the first write
+        self.timestamps = np.zeros(max_frames)
+        self.frame_count = 0
+
+        self.write_times = LatencyHistogram(RENDER_BUCKETS_MS)
+        self.intervals = LatencyHistogram(RENDER_BUCKETS_MS)
+        self._last_write: Optional[float] = None
+
+    def write(self, buffer: bytearray):
+        start = time.perf_counter()
+
+        if self.frames is None or self.frames.shape[1] != len(buffer):
+            self.frames = np.zeros((self.max_frames, len(buffer)), dtype=np.uint8)
+        slot = self.frame_count % self.max_frames
+        self.frames[slot] = np.frombuffer(buffer, dtype=np.uint8)
+        self.timestamps[slot] = start
+        self.frame_count += 1
+
+        if self.simulate_wire_time:
+            wire_time = len(buffer) * 8 * WS2812_BIT_SECONDS + WS2812_LATCH_SECONDS
+            while time.perf_counter() - start < wire_time:
+                pass  # Busy wait, sleep is far too coarse for tens of microseconds
+
+        if self._last_write is not None:
+            self.intervals.record((start - self._last_write) * 1000.0)
+        self._last_write = start
+        self.write_times.record((time.perf_counter() - start) * 1000.0)
+
+    def last_frame(self) -> Optional[np.ndarray]:
+        """Returns a copy of the most recent frame in wire order, or None if nothing was written yet."""
+
+        if not self.frame_count or self.frames is None:
+            return None
+        return self.frames[(self.frame_count - 1) % self.max_frames].copy()
+
+    def stats(self) -> dict:
+        """Returns a JSON-style dict of frame counts and timings."""
+
+        return {
+            'frames': self.frame_count,
+            'write_time': self.write_times.summary(),
+            'interval': self.intervals.summary(),
+        }
+
+
+class SpiStripDriver(StripDriver):
+    """Drives WS2812 style strips from an SPI bus, using the optional spidev package.
+
+    At 2.4 MHz, every data bit becomes 3 SPI bits, 110 for a one and 100 for a zero, which matches the WS2812 timing.
+    The expansion is a table lookup from every data byte to its 3 SPI bytes, written into a preallocated buffer that
+    is handed to the bus as it is.
+    """
+
+    SPI_HZ = 2_400_000
+
+    def __init__(self, bus: int = 0, device: int = 0):
+        """Constructor.
+
+        Args:
+            bus (int): SPI bus, e.g. 0 for /dev/spidev0.0. Defaults to 0.
+            device (int): Chip select of the bus. Defaults to 0.
+        """
+
+        try:
+            import spidev
+        except ImportError:
+            raise MissingDependencyException('spidev', 'Driving LED strips over SPI')
+
+        self._spi = spidev.SpiDev()
+        self._spi.open(bus, device)
+        self._spi.max_speed_hz = self.SPI_HZ
+        self._spi.mode = 0
+
+        self._encoding = _spi_encoding_table()
+        self._spi_buffer: Optional[bytearray] = None
+        self._spi_view: Optional[np.ndarray] = None
+
+    def write(self, buffer: bytearray):
+        if self._spi_buffer is None or len(self._spi_buffer) != 3 * len(buffer):
+            self._spi_buffer = bytearray(3 * len(buffer))
+            self._spi_view = np.frombuffer(self._spi_buffer, dtype=np.uint8).reshape(len(buffer), 3)
+
+        np.take(self._encoding, np.frombuffer(buffer, dtype=np.uint8), axis=0, out=self._spi_view)
+        self._spi.writebytes2(self._spi_buffer)
+
+    def close(self):
+        self._spi.close()
+
+
+def _spi_encoding_table() -> np.ndarray:
+    """Returns the 3 SPI bytes of every data byte, of shape (256, 3)."""
+
+    table = np.zeros((256, 3), dtype=np.uint8)
+    for value in range(256):
+        bits = 0
+        for bit in range(7, -1, -1):
+            bits = (bits << 3) | (0b110 if value & (1 << bit) else 0b100)
+        table[value] = ((bits >> 16) & 0xFF, (bits >> 8) & 0xFF, bits & 0xFF)
+    return table
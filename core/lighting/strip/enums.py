@@ -0,0 +1,22 @@
+from enum import Enum
+
+
+class PixelOrder(Enum):
+    """Order in which a strip expects the color components of every pixel on the wire."""
+
+    RGB='RGB'
+    RBG='RBG'
+    GRB='GRB'
+    GBR='GBR'
+    BRG='BRG'
+    BGR='BGR'
+    RGBW='RGBW'
+    GRBW='GRBW'
+
+    @property
+    def has_white(self) -> bool:
+        return self.value.endswith('W')
+
+    @property
+    def bytes_per_pixel(self) -> int:
+        return len(self.value)
@@ -0,0 +1,152 @@
+"""Addressable LED strips, e.g. NeoPixels (WS2812) and their RGBW variants.
+
+A strip renders whole frames into a single preallocated bytearray in the strip's wire order, through a NumPy view of
+that bytearray. Brightness and gamma are folded into one 256 entry lookup table, so rendering a frame is a few
+vectorized copies and table lookups no matter how many pixels the strip has. The bytearray is then handed to the
+driver as it is.
+"""
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from core.lighting.strip.drivers import StripDriver
+from core.lighting.strip.enums import PixelOrder
+
+_CHANNELS = 'RGBW'
+
+
+def brightness_gamma_table(brightness: float, gamma: float) -> np.ndarray:
+    """Returns the output value of every 8-bit input value, after gamma correction and scaling by brightness.
+
+    Args:
+        brightness (float): Global brightness in [0.0, 1.0]
+        gamma (float): Gamma of the LEDs, around 2.8 for WS2812 which are far brighter at low values than perceived
+
+    Returns:
+        np.ndarray: uint8 table of shape (256,)
+    """
+
+    values = (np.arange(256) / 255.0) ** gamma * brightness * 255.0
+    return np.clip(np.round(values), 0, 255).astype(np.uint8)
+
+
+class LedStrip:
+    """An addressable LED strip, rendered a whole frame at a time."""
+
+    def __init__(
+        self,
+        pixel_count: int,
+        driver: StripDriver,
+        pixel_order: PixelOrder = PixelOrder.GRB,
+        brightness: float = 1.0,
+        gamma: float = 2.8
+    ):
+        """Constructor.
+
+        Args:
+            pixel_count (int): Number of pixels of the strip
+            driver (StripDriver): Driver the frame buffer is handed to on show()
+            pixel_order (PixelOrder): Wire order of the strip. Defaults to GRB, the order of WS2812 strips.
+            brightness (float): Global brightness in [0.0, 1.0]. Defaults to 1.
+            gamma (float): Gamma correction applied to every component. Defaults to 2.8.
+        """
+
+        self.pixel_count = pixel_count
+        self.driver = driver
+        self.pixel_order = pixel_order
+        self._gamma = gamma
+        self._brightness = brightness
+        self._table = brightness_gamma_table(brightness, gamma)
+
+        bytes_per_pixel = pixel_order.bytes_per_pixel
+        self.buffer = bytearray(pixel_count * bytes_per_pixel)
+        self.pixels = np.frombuffer(self.buffer, dtype=np.uint8).reshape(pixel_count, bytes_per_pixel)
+
+        # (wire column, input column) for every component, input columns are R, G, B and W
+        self._columns: Tuple[Tuple[int, int], ...] = tuple(
+            (wire, _CHANNELS.index(channel)) for wire, channel in enumerate(pixel_order.value)
+        )
+
+        # Preallocated scratch buffers, input components in R, G, B, W order
+        self._input = np.zeros((pixel_count, 4), dtype=np.uint8)
+        self._scaled = np.zeros((pixel_count, 3), dtype=np.float32)
+        self._corrected = np.zeros((pixel_count, 4), dtype=np.uint8)
+
+        self.frames_shown = 0
+
+    @property
+    def brightness(self) -> float:
+        return self._brightness
+
+    @brightness.setter
+    def brightness(self, brightness: float):
+        # Build the table first and swap it in, a frame being rendered keeps using the table it started with
+        self._table = brightness_gamma_table(brightness, self._gamma)
+        self._brightness = brightness
+
+    @property
+    def gamma(self) -> float:
+        return self._gamma
+
+    @gamma.setter
+    def gamma(self, gamma: float):
+        self._table = brightness_gamma_table(self._brightness, gamma)
+        self._gamma = gamma
+
+    def set_frame(self, rgb: np.ndarray):
+        """Renders a frame of colors into the frame buffer.
+
+        Args:
+            rgb (np.ndarray): Array of shape (pixel_count, 3), uint8 in [0, 255] or floats in [0.0, 1.0]. For RGBW
+                strips, the white shared by all three components is moved to the white LED.
+        """
+
+        colors = self._input[:, :3]
+        if rgb.dtype == np.uint8:
+            np.copyto(colors, rgb)
+        else:
+            np.multiply(rgb, 255.0, out=self._scaled)
+            np.clip(self._scaled, 0.0, 255.0, out=self._scaled)
+            np.copyto(colors, self._scaled, casting='unsafe')
+
+        self._render()
+
+    def _render(self):
+        """Moves shared white to the white LED, applies the table and writes _input into the buffer in wire order."""
+
+        colors = self._input[:, :3]
+        if self.pixel_order.has_white:
+            white = self._input[:, 3]
+            np.min(colors, axis=1, out=white)
+            np.subtract(colors, white[:, np.newaxis], out=colors)
+
+        table = self._table
+        np.take(table, self._input, out=self._corrected)
+        for wire, channel in self._columns:
+            self.pixels[:, wire] = self._corrected[:, channel]
+
+    def fill(self, color: Sequence[float]):
+        """Sets every pixel to the same color, (r, g, b) in [0.0, 1.0]."""
+
+        self._input[:, :3] = np.clip(np.round(np.asarray(color, dtype=np.float64) * 255.0), 0, 255)
+        self._render()
+
+    def clear(self):
+        """Turns every pixel off."""
+
+        self.pixels.fill(0)
+
+    def show(self):
+        """Hands the frame buffer to the driver."""
+
+        self.driver.write(self.buffer)
+        self.frames_shown += 1
+
+    def close(self):
+        self.driver.close()
+
+    def __enter__(self) -> 'LedStrip':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
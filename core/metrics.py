@@ -0,0 +1,406 @@
+"""In-process metrics: counters, gauges and fixed-bucket histograms, exported in the Prometheus text format.
+
+Metrics are created once, usually at module level or in a constructor, through a MetricsRegistry, REGISTRY unless a
+test needs its own. Labelled metrics hand out one child per combination of label values; resolving a child costs a
+dict lookup, so per-frame code resolves its children once up front and then only calls inc, set or observe, which
+take a lock and update a few numbers:
+
+    frames = REGISTRY.counter('render_frames_total', 'Frames rendered').labels()
+    frames.inc()
+
+MetricsServer serves a registry over HTTP, GET /metrics in the Prometheus text format and GET /metrics.json as the
+JSON-style dict of MetricsRegistry.collect, which `python manage.py stats` reads.
+
+LatencyHistogram is a standalone histogram for stats that belong to a single object and are not exported, e.g. the
+write times of one LED strip driver.
+"""
+import bisect
+import http.server
+import json
+import logging
+import math
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, TypeVar, cast
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_PORT = 9464
+
+# Upper bounds in milliseconds, from per-frame work up to slow bridge requests
+DEFAULT_BUCKETS_MS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0, 2000.0, 5000.0)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket catches everything above the last bound
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, percentile: float) -> float:
+        """Estimates a percentile as the upper bound of the bucket it falls into, inf above the last bound."""
+
+        threshold = self.count * percentile / 100.0
+        cumulative = 0
+        for idx, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= threshold and cumulative:
+                return self.buckets[idx] if idx < len(self.buckets) else math.inf
+        return 0.0
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                'count': self.count,
+                'sum': round(self.sum, 3),
+                'mean': round(self.sum / self.count, 3) if self.count else 0.0,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self.counts)),
+            }
+
+
+class LatencyHistogram:
+    """A fixed-bucket latency histogram of a single object, for stats that are not exported through a registry.
+    Cheap enough to update on every request."""
+
+    # Upper bounds of each bucket in milliseconds, the last bucket catches everything above
+    DEFAULT_BUCKETS_MS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0, 2000.0, 5000.0)
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = DEFAULT_BUCKETS_MS):
+        """Constructor.
+
+        Args:
+            buckets_ms (Tuple[float, ...]): Sorted upper bounds of each bucket in milliseconds.
+        """
+
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = float('inf')
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float):
+        """Adds a single observation to the histogram.
+
+        Args:
+            elapsed_ms (float): Observed latency in milliseconds
+        """
+
+        self.counts[bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms < self.min_ms:
+            self.min_ms = elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+    def percentile(self, percentile: float) -> float:
+        """Estimates a percentile from the bucket counts. Returns the upper bound of the bucket it falls into.
+
+        Args:
+            percentile (float): Percentile to estimate, [0.0, 100.0]
+
+        Returns:
+            float: Estimated latency in milliseconds
+        """
+
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * percentile / 100.0
+        cumulative = 0
+        for idx, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                return self.buckets_ms[idx] if idx < len(self.buckets_ms) else self.max_ms
+
+        return self.max_ms
+
+    def summary(self) -> dict:
+        """Returns a JSON-style dict summarizing the histogram."""
+
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean_ms, 3),
+            'min_ms': round(self.min_ms, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+        }
+
+
+class Metric:
+    """A named metric with a fixed set of label names, holding one child per combination of label values."""
+
+    TYPE = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], Any] = {}  # The child class depends on the metric type
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+    def labels(self, *values):
+        """Returns the child for a combination of label values, in the order of label_names. Keep it if it is used
+        per frame."""
+
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f'{self.name} has labels {self.label_names}, got {values}')
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def children(self) -> List[Tuple[Dict[str, str], Any]]:
+        with self._lock:
+            return [(dict(zip(self.label_names, key)), child) for key, child in self._children.items()]
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. requests sent or frames dropped."""
+
+    TYPE = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        """Increments the metric without labels."""
+
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. queued frames."""
+
+    TYPE = 'gauge'
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float):
+        """Sets the metric without labels."""
+
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    """Counts observations into fixed buckets, e.g. request latencies in milliseconds."""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        """Observes a value of the metric without labels."""
+
+        self.labels().observe(value)
+
+
+_MetricT = TypeVar('_MetricT', bound=Metric)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        '{0}="{1}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """Holds metrics by name. Asking for an existing metric returns it, so modules can share a metric."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class: Type[_MetricT], name: str, documentation: str, label_names: Sequence[str],
+                       **kwargs) -> _MetricT:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                created = metric_class(name, documentation, label_names, **kwargs)
+                self._metrics[name] = created
+                return created
+            if not isinstance(metric, metric_class) or metric.label_names != tuple(label_names):
+                raise ValueError(f'Metric {name} already exists as a {metric.TYPE} with labels {metric.label_names}')
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS_MS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def metrics(self) -> List[Metric]:
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    def collect(self) -> dict:
+        """Returns a JSON-style dict of every metric: name -> type, documentation and a sample per child."""
+
+        collected = {}
+        for metric in self.metrics():
+            samples = []
+            for labels, child in metric.children():
+                value = child.summary() if isinstance(child, _HistogramChild) else child.value
+                samples.append({'labels': labels, 'value': value})
+            collected[metric.name] = {'type': metric.TYPE, 'help': metric.documentation, 'samples': samples}
+        return collected
+
+    def render_prometheus(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+
+        lines = []
+        for metric in self.metrics():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.TYPE}')
+            for labels, child in metric.children():
+                if not isinstance(child, _HistogramChild):
+                    lines.append(f'{metric.name}{_format_labels(labels)} {_format_value(child.value)}')
+                    continue
+
+                with child._lock:
+                    counts, count, total = list(child.counts), child.count, child.sum
+                cumulative = 0
+                for bound, bucket_count in zip([*child.buckets, math.inf], counts):
+                    cumulative += bucket_count
+                    bucket_labels = dict(labels, le=_format_value(bound))
+                    lines.append(f'{metric.name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+                lines.append(f'{metric.name}_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{metric.name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves a registry on a local port: GET /metrics for Prometheus and GET /metrics.json for manage.py stats."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1', port: int = DEFAULT_METRICS_PORT):
+        """Constructor.
+
+        Args:
+            registry (MetricsRegistry): Registry to serve. Defaults to REGISTRY.
+            host (str): Address to bind to. Defaults to 127.0.0.1, i.e. only this machine can scrape.
+            port (int): Port to bind to, 0 picks a free port. Defaults to DEFAULT_METRICS_PORT.
+        """
+
+        self.registry = registry
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(registry.collect()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return cast(Tuple[str, int], self._server.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='MetricsServer', daemon=True)
+        self._thread.start()
+        _logger.info(f'Serving metrics on http://{self.address[0]}:{self.address[1]}/metrics')
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'MetricsServer':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
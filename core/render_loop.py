@@ -0,0 +1,240 @@
+"""Fixed-rate render loop which ties audio analysis to light output.
+
+The loop runs a chain of named stages, e.g. audio -> features -> color -> output, once per frame on a monotonic clock.
+Deadlines are computed from the frame index (start + index * period) rather than by adding up periods, so the loop
+never drifts no matter how long it runs. When a frame runs late, the frames whose deadlines already passed are skipped
+instead of rendered back to back, since stale light output is worse than none.
+
+Every stage is timed into fixed-size histograms of the metrics registry, along with frame times and wake-up jitter, so
+memory use stays constant over days of running. stats() summarizes those histograms, which are shared by every
+RenderLoop of the process.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.metrics import REGISTRY
+from core.throttled_logging import RateLimitedLogger
+
+_logger = logging.getLogger(__name__)
+_rate_limited_logger = RateLimitedLogger(_logger)
+
+# Takes the output of the previous stage (None for the first stage). Returning None ends the frame early, e.g. when no
+# new audio is available, and the remaining stages are not run.
+Stage = Callable[[Any], Any]
+
+# Sub-millisecond resolution, frames at 50 Hz only have 20 ms in total
+RENDER_BUCKETS_MS = (0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+
+_FRAMES = REGISTRY.counter('render_frames_total', 'Frames of the render loop by outcome', ('outcome',))
+_FRAME_DURATION = REGISTRY.histogram(
+    'render_frame_duration_ms', 'Time to render a frame in milliseconds', buckets=RENDER_BUCKETS_MS
+)
+_JITTER = REGISTRY.histogram(
+    'render_jitter_ms', 'Lateness of the render loop waking up for a frame in milliseconds', buckets=RENDER_BUCKETS_MS
+)
+_STAGE_DURATION = REGISTRY.histogram(
+    'render_stage_duration_ms', 'Time of a render stage in milliseconds', ('stage',), buckets=RENDER_BUCKETS_MS
+)
+_STAGE_ERRORS = REGISTRY.counter('render_stage_errors_total', 'Render stages that raised', ('stage',))
+
+
+class RenderLoop:
+    """Runs stages at a fixed frame rate, skipping frames rather than building a backlog."""
+
+    def __init__(
+        self,
+        frame_rate: float = 50.0,
+        stages: Optional[List[Tuple[str, Stage]]] = None,
+        stats_interval: Optional[float] = 60.0,
+        resync_threshold: float = 1.0
+    ):
+        """Constructor.
+
+        Args:
+            frame_rate (float): Frames per second. Defaults to 50.
+            stages (Optional[List[Tuple[str, Stage]]]): (name, stage) pairs in the order they run. Defaults to None.
+            stats_interval (Optional[float]): Seconds between logging stats, None to never log them. Defaults to 60.
+            resync_threshold (float): If the loop falls behind by more than this many seconds, e.g. after the host
+                was suspended, the clock is restarted from now instead of skipping every missed frame. Defaults to 1.
+        """
+
+        self.frame_rate = frame_rate
+        self.period = 1.0 / frame_rate
+        self.stats_interval = stats_interval
+        self.resync_threshold = resync_threshold
+        self.stages: List[Tuple[str, Stage]] = []
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+        self.stage_errors: Dict[str, int] = {}
+        self.reset_stats()
+
+        # Metric children resolved once, recording them per frame is then just a locked add
+        self._rendered_metric = _FRAMES.labels('rendered')
+        self._idle_metric = _FRAMES.labels('idle')
+        self._skipped_metric = _FRAMES.labels('skipped')
+        self._deadline_missed_metric = _FRAMES.labels('deadline_missed')
+        self._frame_duration_metric = _FRAME_DURATION.labels()
+        self._jitter_metric = _JITTER.labels()
+        self._stage_metrics: Dict[str, tuple] = {}
+
+        for name, stage in stages or []:
+            self.add_stage(name, stage)
+
+    def add_stage(self, name: str, stage: Stage) -> 'RenderLoop':
+        """Appends a stage to the chain. Returns self so stages can be chained."""
+
+        if any(existing == name for existing, _ in self.stages):
+            raise ValueError(f'A stage named {name} already exists')
+
+        self.stages.append((name, stage))
+        self.stage_errors[name] = 0
+        self._stage_metrics[name] = (_STAGE_DURATION.labels(name), _STAGE_ERRORS.labels(name))
+        return self
+
+    def reset_stats(self):
+        """Resets the frame and error counts. The histograms live in the metrics registry and are never reset."""
+
+        self.frames_rendered = 0
+        self.frames_idle = 0
+        self.frames_skipped = 0
+        self.deadline_misses = 0
+        self.resyncs = 0
+        for name in self.stage_errors:
+            self.stage_errors[name] = 0
+
+    def render_frame(self) -> bool:
+        """Runs every stage once, timing each of them.
+
+        Returns:
+            bool: True if the frame went through every stage, False if a stage ended it early by returning None
+        """
+
+        value = None
+        for name, stage in self.stages:
+            duration_metric, errors_metric = self._stage_metrics[name]
+            start = time.perf_counter()
+            try:
+                value = stage(value)
+            except Exception:
+                # A failing stage must not stop a loop that runs for days, the next frame tries again
+                self.stage_errors[name] += 1
+                errors_metric.inc()
+                if self.stage_errors[name] == 1:
+                    _logger.exception(f'Stage {name} failed, further failures are only counted')
+                else:
+                    _rate_limited_logger.debug('Stage %s failed', name, exc_info=True)
+                value = None
+            finally:
+                duration_metric.observe((time.perf_counter() - start) * 1000.0)
+
+            if value is None:
+                self.frames_idle += 1
+                self._idle_metric.inc()
+                return False
+        return True
+
+    def run(self, duration: Optional[float] = None):
+        """Runs the loop on the calling thread until stop() is called or duration elapsed.
+
+        Args:
+            duration (Optional[float]): Seconds to run for, None to run until stopped. Defaults to None.
+        """
+
+        start = time.monotonic()
+        end = start + duration if duration is not None else None
+        last_stats = start
+        frame_index = 0
+
+        while not self._stop_event.is_set():
+            deadline = start + frame_index * self.period
+            now = time.monotonic()
+            if end is not None and now >= end:
+                break
+            if now < deadline:
+                self._stop_event.wait(deadline - now)
+                continue
+
+            woke = time.monotonic()
+            self._jitter_metric.observe((woke - deadline) * 1000.0)
+            rendered = self.render_frame()
+            finished = time.monotonic()
+            if rendered:
+                self.frames_rendered += 1
+                self._rendered_metric.inc()
+            self._frame_duration_metric.observe((finished - woke) * 1000.0)
+
+            frame_index += 1
+            next_deadline = start + frame_index * self.period
+            if finished > next_deadline:
+                self.deadline_misses += 1
+                self._deadline_missed_metric.inc()
+
+                behind = finished - next_deadline
+                if behind > self.resync_threshold:
+                    # Far behind, e.g. after a suspend: start the clock over rather than skip thousands of frames
+                    self.resyncs += 1
+                    _logger.info(f'Render loop was {behind:.2f}s behind, resynchronizing the clock')
+                    start, frame_index = finished, 0
+                else:
+                    missed = int(behind / self.period) + 1
+                    self.frames_skipped += missed
+                    self._skipped_metric.inc(missed)
+                    frame_index += missed
+
+            if self.stats_interval is not None and finished - last_stats >= self.stats_interval:
+                last_stats = finished
+                self.log_stats()
+
+    def start(self):
+        """Runs the loop on a thread of its own."""
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name='RenderLoop', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'RenderLoop':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stats(self) -> dict:
+        """Returns a JSON-style dict of frame counts, deadline misses, jitter and per-stage timings. Timings are
+        histogram summaries in milliseconds, see MetricsRegistry.collect."""
+
+        return {
+            'frame_rate': self.frame_rate,
+            'frames_rendered': self.frames_rendered,
+            'frames_idle': self.frames_idle,
+            'frames_skipped': self.frames_skipped,
+            'deadline_misses': self.deadline_misses,
+            'resyncs': self.resyncs,
+            'frame_time': self._frame_duration_metric.summary(),
+            'jitter': self._jitter_metric.summary(),
+            'stages': {
+                name: dict(self._stage_metrics[name][0].summary(), errors=self.stage_errors[name])
+                for name, _ in self.stages
+            },
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        _logger.info(
+            f'Rendered {stats["frames_rendered"]} frames, {stats["frames_idle"]} idle, skipped '
+            f'{stats["frames_skipped"]}, missed {stats["deadline_misses"]} deadlines, jitter p50 '
+            f'{stats["jitter"]["p50"]} ms p99 {stats["jitter"]["p99"]} ms'
+        )
+        for name, summary in stats['stages'].items():
+            _logger.info(f'  {name:<12} count {summary["count"]}, mean {summary["mean"]} ms, p50 {summary["p50"]} ms, '
+                         f'p99 {summary["p99"]} ms, {summary["errors"]} errors')
@@ -25,18 +25,17 @@ LOG_DIRECTORY = os.path.join(GENERATED_ASSETS_DIRECTORY, "logs")
 CACHE_DIRECTORY = os.path.join(GENERATED_ASSETS_DIRECTORY, "cache")
 TEMP_DIRECTORY = os.path.join(GENERATED_ASSETS_DIRECTORY, "temp")
 
-# Create directories if they don't exist already  (TODO: Should this belong in a different file?)
-if not os.path.exists(LOG_DIRECTORY):
-    os.makedirs(LOG_DIRECTORY)
+# The debug log rotates once it reaches LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT older files
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
 
-if not os.path.exists(REPORT_DIRECTORY):
-    os.makedirs(REPORT_DIRECTORY)
 
-if not os.path.exists(CACHE_DIRECTORY):
-    os.makedirs(CACHE_DIRECTORY)
+def ensure_directories():
+    """Creates the directories of generated assets if they don't exist already. Called by entry points on startup,
+    so that importing the library has no side effects."""
 
-if not os.path.exists(TEMP_DIRECTORY):
-    os.makedirs(TEMP_DIRECTORY)
+    for directory in (LOG_DIRECTORY, REPORT_DIRECTORY, CACHE_DIRECTORY, TEMP_DIRECTORY):
+        os.makedirs(directory, exist_ok=True)
 
 
 # ====================
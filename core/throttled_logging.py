@@ -0,0 +1,114 @@
+"""Loggers for hot paths, e.g. code that runs for every frame or every light update.
+
+Both wrap a logging.Logger and drop records before they are created: RateLimitedLogger lets a burst of records
+through per interval and call site, SampledLogger one record in every n. Records that got through say how many were
+dropped before them, so a log still shows how often something happened.
+
+Pass arguments %-style rather than as f-strings, e.g. _hot_logger.debug('PUT %s', body), so dropped records cost no
+formatting at all.
+"""
+import logging
+import sys
+import threading
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class _ThrottledLogger:
+    """Logger methods that first ask _allow whether a call site may log, see RateLimitedLogger and SampledLogger."""
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def _allow(self, key: Hashable) -> Tuple[bool, int]:
+        """Returns whether the call site may log, and how many of its records were dropped since it last did."""
+
+        raise NotImplementedError()
+
+    def _log(self, level: int, msg: str, args: tuple, key: Optional[Hashable], exc_info: bool):
+        if not self.logger.isEnabledFor(level):
+            return
+
+        if key is None:
+            caller = sys._getframe(2)
+            key = (caller.f_code.co_filename, caller.f_lineno)
+
+        with self._lock:
+            allowed, dropped = self._allow(key)
+            if not allowed:
+                self.suppressed += 1
+                return
+
+        if dropped:
+            msg = f'{msg} (dropped {dropped} similar records)'
+        self.logger.log(level, msg, *args, exc_info=exc_info, stacklevel=3)
+
+    def debug(self, msg: str, *args, key: Optional[Hashable] = None, exc_info: bool = False):
+        self._log(logging.DEBUG, msg, args, key, exc_info)
+
+    def info(self, msg: str, *args, key: Optional[Hashable] = None, exc_info: bool = False):
+        self._log(logging.INFO, msg, args, key, exc_info)
+
+    def warning(self, msg: str, *args, key: Optional[Hashable] = None, exc_info: bool = False):
+        self._log(logging.WARNING, msg, args, key, exc_info)
+
+    def exception(self, msg: str, *args, key: Optional[Hashable] = None):
+        self._log(logging.ERROR, msg, args, key, True)
+
+
+class RateLimitedLogger(_ThrottledLogger):
+    """Lets at most burst records per interval through for every call site."""
+
+    def __init__(self, logger: logging.Logger, interval: float = 10.0, burst: int = 1):
+        """Constructor.
+
+        Args:
+            logger (logging.Logger): Logger to log through
+            interval (float): Seconds after which a call site may log again. Defaults to 10.
+            burst (int): Records a call site may log per interval. Defaults to 1.
+        """
+
+        super().__init__(logger)
+        self.interval = interval
+        self.burst = burst
+        self._windows: Dict[Hashable, list] = {}  # key -> [window start, records logged, records dropped]
+
+    def _allow(self, key: Hashable) -> Tuple[bool, int]:
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            dropped = window[2] if window is not None else 0
+            self._windows[key] = [now, 1, 0]
+            return True, dropped
+
+        if window[1] < self.burst:
+            window[1] += 1
+            return True, 0
+
+        window[2] += 1
+        return False, 0
+
+
+class SampledLogger(_ThrottledLogger):
+    """Lets one in every sample_every records through for every call site, starting with the first."""
+
+    def __init__(self, logger: logging.Logger, sample_every: int = 100):
+        """Constructor.
+
+        Args:
+            logger (logging.Logger): Logger to log through
+            sample_every (int): Records per call site of which one is logged. Defaults to 100.
+        """
+
+        super().__init__(logger)
+        self.sample_every = sample_every
+        self._counts: Dict[Hashable, int] = {}
+
+    def _allow(self, key: Hashable) -> Tuple[bool, int]:
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.sample_every == 0:
+            return True, self.sample_every - 1 if count else 0
+        return False, 0
@@ -1,38 +1,462 @@
 """Script which handles testing and calling the core libraries."""
 
 import argparse
-from dotenv import load_dotenv
+import importlib
 import logging
+import sys
 import time
+import uuid
+from typing import TYPE_CHECKING, Optional
+
+from dotenv import load_dotenv
 
 # Load environment variables before import settings file
 load_dotenv()
 
-# Import settings and configure logging
+# Only light modules are imported here, so that --help and argument errors are instant. Every subcommand imports what
+# it needs (requests, numpy, the Hue models) when it runs, see python manage.py benchmark imports.
+from core import configure_logging
 from core.settings import HUE_BRIDGE_ADDRESS, HUE_BRIDGE_CERTIFICATE_PATH
-from core.lighting.hue.client import HueClient
 from core.verbose_argument_parser import VerboseArgumentParser
 
+if TYPE_CHECKING:
+    from core.lighting.hue.client import HueClient
+    from core.lighting.hue.enums import StreamColorSpace
+    from core.lighting.hue.objects.entertainment_configuration import EntertainmentConfiguration
+
 _logger = logging.getLogger()
 
+# Benchmark name -> (module, description). A benchmark module is only imported when it is the one being run.
+BENCHMARKS = {
+    'color': ('core.benchmarks.color', 'Benchmarks RGB to xy conversion of whole frames'),
+    'decode': ('core.benchmarks.decode', 'Benchmarks decoding resource listings into dataclasses'),
+    'features': ('core.benchmarks.features', 'Benchmarks streaming audio feature extraction'),
+    'imports': ('core.benchmarks.imports', 'Benchmarks import time of the CLI and core modules'),
+    'logging': ('core.benchmarks.log', 'Benchmarks the per call cost of logging in the update path'),
+    'network-led': ('core.benchmarks.network_led', 'Benchmarks DDP and E1.31 streaming to a loopback receiver'),
+    'spatial': ('core.benchmarks.spatial', 'Benchmarks mapping features onto lights by position'),
+    'strip': ('core.benchmarks.strip', 'Benchmarks rendering frames on simulated LED strips'),
+}
+
+
+def _hue_client() -> 'HueClient':
+    """Connects to the bridge at HUE_BRIDGE_ADDRESS."""
+
+    from core.lighting.hue.client import HueClient
+
+    if HUE_BRIDGE_ADDRESS is None:
+        raise ValueError('HUE_BRIDGE_ADDRESS is not set, add it to the environment or to .env')
+    return HueClient(HUE_BRIDGE_ADDRESS, bridge_certificate_path=HUE_BRIDGE_CERTIFICATE_PATH)
+
 
 def test(args: argparse.Namespace):
     """ Tests all clients to ensure that connections are valid."""
 
     # Test Hue client
-    client = HueClient(HUE_BRIDGE_ADDRESS, bridge_certificate_path=HUE_BRIDGE_CERTIFICATE_PATH)
+    client = _hue_client()
     client.test()
 
 
+def _loopback_configuration(channel_count: int) -> 'EntertainmentConfiguration':
+    """Builds an EntertainmentConfiguration with the specified number of channels for loopback streaming."""
+
+    from core.lighting.hue.objects.entertainment_configuration import EntertainmentConfiguration
+
+    return EntertainmentConfiguration.from_dict({
+        'id': str(uuid.uuid4()),
+        'metadata': {'name': 'loopback'},
+        'configuration_type': 'music',
+        'status': 'inactive',
+        'stream_proxy': {'mode': 'auto', 'node': {'rid': str(uuid.uuid4()), 'rtype': 'entertainment'}},
+        'channels': [
+            {'channel_id': idx, 'position': {'x': 0.0, 'y': 0.0, 'z': 0.0}, 'members': []}
+            for idx in range(channel_count)
+        ],
+        'locations': {'service_locations': []}
+    })
+
+
+def _open_streamer(args: argparse.Namespace, color_space: Optional['StreamColorSpace'] = None):
+    """Returns (streamer, receiver) for --loopback or --configuration, receiver being None unless looping back."""
+
+    from core.lighting.hue.enums import StreamColorSpace
+    from core.lighting.hue.objects.entertainment_configuration import EntertainmentConfiguration
+    from core.lighting.hue.streaming import EntertainmentStreamer, LoopbackEntertainmentReceiver, UdpDatagramTransport
+
+    if color_space is None:
+        color_space = StreamColorSpace.RGB
+    if args.loopback:
+        receiver = LoopbackEntertainmentReceiver()
+        receiver.start()
+        streamer = EntertainmentStreamer(
+            _loopback_configuration(args.channels),
+            transport=UdpDatagramTransport(receiver.address),
+            frame_rate=args.rate,
+            color_space=color_space
+        )
+        return streamer, receiver
+
+    client = _hue_client()
+    configurations = client.list(EntertainmentConfiguration)
+    configuration = next((c for c in configurations if c.metadata.name == args.configuration), None)
+    if configuration is None:
+        raise ValueError(f'No entertainment configuration named {args.configuration}, '
+                         f'available: {[c.metadata.name for c in configurations]}')
+    return EntertainmentStreamer(configuration, client=client, frame_rate=args.rate, color_space=color_space), None
+
+
+def stream(args: argparse.Namespace):
+    """Streams a color cycle to every channel of an entertainment configuration.
+
+    With --loopback, streams to a local receiver instead of the bridge and reports throughput and frame loss.
+    """
+
+    import colorsys
+
+    streamer, receiver = _open_streamer(args)
+    channel_count = len(streamer.channel_ids)
+    with streamer:
+        start_time = time.monotonic()
+        while time.monotonic() - start_time < args.duration:
+            phase = time.monotonic() - start_time
+            streamer.set_colors([
+                colorsys.hsv_to_rgb((phase / 4.0 + idx / channel_count) % 1.0, 1.0, 1.0) for idx in range(channel_count)
+            ])
+            time.sleep(1.0 / args.rate)
+
+    if receiver is not None:
+        time.sleep(0.1)  # Let the receiver drain the socket
+        receiver.stop()
+        _logger.info(f'Loopback receiver: {receiver.stats()}')
+
+
+def render(args: argparse.Namespace):
+    """Plays audio through the render loop: audio -> features -> color -> entertainment stream.
+
+    Audio comes from a file, or with --listen from a network microphone (see send-audio). Every channel follows the
+    energy of one frequency band, low bands on the first channels, within the colors and brightness of --mood. With
+    --spatial, channels follow the audio by their position in the room instead, see SpatialMapper. With
+    --ddp or --e131, the same frames are also stretched across a network LED strip, each output on its own thread.
+    """
+
+    import numpy as np
+
+    from core.audio.features import FeatureExtractor
+    from core.audio.network import NetworkAudioSource
+    from core.audio.sources import AudioSource, FileAudioSource
+    from core.lighting.hue.enums import StreamColorSpace
+    from core.lighting.hue.spatial import SpatialMapper
+    from core.lighting.moods import MOODS, MoodEngine
+    from core.lighting.network_led.drivers import DdpDriver, E131Driver
+    from core.lighting.router import EntertainmentBackend, FrameRouter, StripBackend
+    from core.lighting.strip.enums import PixelOrder
+    from core.lighting.strip.strip import LedStrip
+    from core.metrics import MetricsServer
+    from core.render_loop import RenderLoop
+
+    if args.mood not in MOODS:
+        raise ValueError(f'Unknown mood {args.mood}, available: {sorted(MOODS)}')
+
+    source: AudioSource
+    if args.listen is not None:
+        source = NetworkAudioSource(port=args.listen)
+    elif args.audio is not None:
+        source = FileAudioSource(args.audio, realtime=True, loop=True)
+    else:
+        raise ValueError('Either an audio file or --listen is required')
+    extractor = FeatureExtractor(source.buffer.reader(), source.sample_rate)
+    streamer, receiver = _open_streamer(args, color_space=StreamColorSpace.XY_BRIGHTNESS)
+    moods = MoodEngine([None] * len(streamer.channel_ids), MOODS[args.mood])
+
+    def features(_):
+        frame = None
+        for frame in extractor.frames():
+            pass
+        return frame
+
+    router = FrameRouter([EntertainmentBackend(streamer)])
+    for name, host, driver_class in (('ddp', args.ddp, DdpDriver), ('e131', args.e131, E131Driver)):
+        if host is not None:
+            strip = LedStrip(args.pixels, driver_class(host), pixel_order=PixelOrder.RGB)
+            router.add_backend(StripBackend(strip, name))
+    rgb = np.zeros((len(streamer.channel_ids), 3))
+    spatial = None
+    if args.spatial:
+        spatial = SpatialMapper.from_configuration(streamer.configuration, len(extractor.band_edges) - 1)
+
+    def color(frame):
+        if spatial is not None:
+            return spatial.map(frame)
+        moods.map(frame)
+        np.multiply(moods.rgb, moods.brightness[:, np.newaxis] / 100.0, out=rgb)
+        return rgb
+
+    stages = [('features', features), ('color', color), ('output', router.submit)]
+    loop = RenderLoop(frame_rate=args.rate, stages=stages, stats_interval=args.stats_interval)
+    metrics_server = MetricsServer(port=args.metrics_port) if args.metrics_port is not None else None
+    if metrics_server is not None:
+        metrics_server.start()
+    try:
+        with source, streamer, router:
+            loop.run(duration=args.duration)
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+
+    loop.log_stats()
+    router.log_stats()
+    if isinstance(source, NetworkAudioSource):
+        _logger.info(f'Network audio: {source.stats()}')
+    if receiver is not None:
+        time.sleep(0.1)  # Let the receiver drain the socket
+        receiver.stop()
+        _logger.info(f'Loopback receiver: {receiver.stats()}')
+
+
+def stats(args: argparse.Namespace):
+    """Prints the metrics of a running render, see render --metrics-port."""
+
+    import json
+    import urllib.request
+
+    from core.metrics import DEFAULT_METRICS_PORT
+
+    url = args.url or f'http://127.0.0.1:{DEFAULT_METRICS_PORT}'
+    if args.prometheus:
+        with urllib.request.urlopen(f'{url}/metrics', timeout=5.0) as response:
+            print(response.read().decode('utf-8'), end='')
+        return
+
+    with urllib.request.urlopen(f'{url}/metrics.json', timeout=5.0) as response:
+        collected = json.load(response)
+
+    for name, metric in collected.items():
+        for sample in metric['samples']:
+            labels = ','.join(f'{key}={value}' for key, value in sample['labels'].items())
+            value = sample['value']
+            if metric['type'] == 'histogram':
+                value = f'count {value["count"]} mean {value["mean"]} p50 {value["p50"]} p99 {value["p99"]}'
+            print(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+
+
+def loadtest(args: argparse.Namespace):
+    """Sends light updates to a local BridgeSimulator and reports the updates per second and latency achieved.
+
+    Updates go straight through HueClient.put_light from --concurrency threads, or with --scheduler through a
+    CommandScheduler, which keeps them within the bridge's rate limits. The scheduler gets the rooms of the simulated
+    bridge, and all lights then step through the same brightness, so it can replace the commands of a room with a
+    single grouped_light command.
+    """
+
+    import threading
+
+    import numpy as np
+
+    from core.lighting.hue.client import HueApplicationCredential, HueClient
+    from core.lighting.hue.objects.light import Light
+    from core.lighting.hue.registry import ResourceRegistry
+    from core.lighting.hue.scheduler import CommandScheduler
+    from core.lighting.hue.simulator import BridgeSimulator
+    from core.lighting.hue.synthetic import synthetic_topology
+    from core.lighting.hue.transport import HueTransport
+
+    simulator = BridgeSimulator(
+        synthetic_topology(args.lights),
+        latency=args.latency / 1000.0,
+        jitter=args.jitter / 1000.0,
+        error_rate=args.error_rate,
+        light_rate=None if args.no_rate_limit else 10.0,
+        group_rate=None if args.no_rate_limit else 1.0,
+        seed=0
+    )
+    with simulator:
+        host, port = simulator.address
+        client = HueClient(
+            f'{host}:{port}',
+            transport=HueTransport(pool_size=args.concurrency, retries=0),
+            application_key=HueApplicationCredential('', ''),
+            scheme='http'
+        )
+        client.request_application_key(cache=False)
+        registry = client.load_registry(ResourceRegistry(), cache=False)
+        lights = [light for light in registry.lights() if light.dimming is not None]
+        _logger.info(f'Simulated bridge at {host}:{port} with {len(lights)} lights, '
+                     f'{args.concurrency} threads for {args.duration:.0f}s')
+
+        latencies_ms = []  # Raw samples, bucket bounds are too coarse for percentiles of a few tens of ms
+        lock = threading.Lock()
+        outcomes = {'updates': 0}
+        deadline = time.monotonic() + args.duration
+        scheduler = CommandScheduler(client, registry) if args.scheduler else None
+
+        def change(light: Light, idx: int):
+            if scheduler is not None:
+                # Twice a second every light gets the same new brightness, like a scene fading the whole home
+                idx = int((args.duration - (deadline - time.monotonic())) * 2.0)
+            assert light.dimming is not None, 'lights without dimming are left out above'
+            light.dimming.brightness = float(1 + idx % 100)
+
+        def send(worker: int):
+            # Every thread owns a slice of the lights, so no light is changed by two threads at once
+            own_lights = lights[worker::args.concurrency]
+            period = args.concurrency / args.rate if args.rate else 0.0
+            next_send = time.monotonic()
+            idx = 0
+            while own_lights and time.monotonic() < deadline:
+                if period:
+                    time.sleep(max(0.0, next_send - time.monotonic()))
+                    next_send += period
+                light = own_lights[idx % len(own_lights)]
+                change(light, idx)
+                idx += 1
+
+                if scheduler is not None:
+                    scheduler.submit(light)
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    outcome = 'updates' if client.put_light(light) is not None else 'unchanged'
+                except Exception as e:
+                    outcome = type(e).__name__
+                elapsed_ms = (time.perf_counter() - start) * 1000.0
+                with lock:
+                    if outcome != 'unchanged':  # No request was sent
+                        latencies_ms.append(elapsed_ms)
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        if scheduler is not None:
+            scheduler.start()
+        start_time = time.monotonic()
+        threads = [threading.Thread(target=send, args=(worker,), daemon=True) for worker in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if scheduler is not None:
+            scheduler.stop()
+            outcomes['updates'] = scheduler.light_commands + scheduler.group_commands
+        elapsed = time.monotonic() - start_time
+
+    _logger.info(f'{outcomes["updates"] / elapsed:.1f} updates/s, outcomes {outcomes}')
+    if scheduler is not None:
+        _logger.info(f'Scheduler: {scheduler.metrics()}')
+    elif latencies_ms:
+        samples = np.array(latencies_ms)
+        p50, p90, p99 = np.percentile(samples, (50, 90, 99))
+        _logger.info(f'Latency of {samples.size} requests: mean {samples.mean():.2f} ms, min {samples.min():.2f} ms, '
+                     f'p50 {p50:.2f} ms, p90 {p90:.2f} ms, p99 {p99:.2f} ms, max {samples.max():.2f} ms')
+    _logger.info(f'Simulator: {simulator.stats()}')
+
+
+def _run_benchmark(args: argparse.Namespace):
+    importlib.import_module(args.benchmark_module).run(args)
+
+
+def send_audio(args: argparse.Namespace):
+    """Sends an audio file as a network microphone would, optionally simulating packet loss and jitter."""
+
+    from core.audio.network import DEFAULT_PORT, NetworkAudioSender
+    from core.audio.sources import FileAudioSource
+
+    if args.port is None:
+        args.port = DEFAULT_PORT
+    source = FileAudioSource(args.audio, block_size=args.block_size, realtime=True, loop=True)
+    reader = source.buffer.reader()
+    sender = NetworkAudioSender(
+        (args.host, args.port), source.sample_rate, source.channels, args.block_size, loss=args.loss, jitter=args.jitter
+    )
+    _logger.info(f'Sending {args.audio} ({source.sample_rate} Hz, {source.channels} channels) '
+                 f'to {args.host}:{args.port}')
+
+    with source:
+        start_time = time.monotonic()
+        while args.duration is None or time.monotonic() - start_time < args.duration:
+            block = reader.read(args.block_size)
+            if block is None:
+                sender.flush()
+                time.sleep(0.001)
+                continue
+            sender.send(block)
+
+    sender.close()
+    _logger.info(f'Sent {sender.packets_sent} packets, dropped {sender.packets_lost} on purpose, '
+                 f'{sender.send_errors} errors')
+
+
 if __name__ == '__main__':
     start_time = time.time()
-    
+    configure_logging()
+
     parser = VerboseArgumentParser(description=__doc__)
     subparsers = parser.add_subparsers()
 
     test_parser = subparsers.add_parser('test')
     test_parser.set_defaults(cmd=test)
 
+    stream_parser = subparsers.add_parser('stream')
+    stream_parser.add_argument('--configuration', help='Name of the entertainment configuration to stream to')
+    stream_parser.add_argument('--loopback', action='store_true', help='Stream to a local receiver instead')
+    stream_parser.add_argument('--channels', type=int, default=10, help='Number of channels when using --loopback')
+    stream_parser.add_argument('--rate', type=float, default=50.0, help='Frames per second')
+    stream_parser.add_argument('--duration', type=float, default=5.0, help='Seconds to stream for')
+    stream_parser.set_defaults(cmd=stream)
+
+    render_parser = subparsers.add_parser('render')
+    render_parser.add_argument('audio', nargs='?', help='WAV file to play through the render loop, looped')
+    render_parser.add_argument('--listen', type=int, help='Receive audio from a network microphone on this UDP port')
+    render_parser.add_argument('--configuration', help='Name of the entertainment configuration to stream to')
+    render_parser.add_argument('--loopback', action='store_true', help='Stream to a local receiver instead')
+    render_parser.add_argument('--channels', type=int, default=10, help='Number of channels when using --loopback')
+    render_parser.add_argument('--rate', type=float, default=50.0, help='Frames per second')
+    render_parser.add_argument('--duration', type=float, default=None, help='Seconds to run for, forever if unset')
+    render_parser.add_argument('--mood', default='party', help='Colors and brightness to use, see MOODS')
+    render_parser.add_argument('--spatial', action='store_true', help='Map audio by channel positions instead of mood')
+    render_parser.add_argument('--ddp', help='Also drive a DDP controller at this address, e.g. WLED')
+    render_parser.add_argument('--e131', help='Also drive an E1.31 controller at this address')
+    render_parser.add_argument('--pixels', type=int, default=60, help='Pixels of the --ddp or --e131 strip')
+    render_parser.add_argument('--stats-interval', type=float, default=60.0, help='Seconds between stats logs')
+    render_parser.add_argument('--metrics-port', type=int, help='Serve metrics for Prometheus and stats on this port')
+    render_parser.set_defaults(cmd=render)
+
+    loadtest_parser = subparsers.add_parser('loadtest')
+    loadtest_parser.add_argument('--lights', type=int, default=200, help='Lights of the simulated bridge')
+    loadtest_parser.add_argument('--duration', type=float, default=10.0, help='Seconds to send updates for')
+    loadtest_parser.add_argument('--concurrency', type=int, default=4, help='Threads sending updates')
+    loadtest_parser.add_argument('--rate', type=float, help='Updates per second to offer, unlimited if unset')
+    loadtest_parser.add_argument('--scheduler', action='store_true', help='Send through a CommandScheduler')
+    loadtest_parser.add_argument('--latency', type=float, default=20.0, help='Latency of the bridge in ms')
+    loadtest_parser.add_argument('--jitter', type=float, default=10.0, help='Maximum random latency added in ms')
+    loadtest_parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests to fail')
+    loadtest_parser.add_argument('--no-rate-limit', action='store_true', help='Disable the command rate limits')
+    loadtest_parser.set_defaults(cmd=loadtest)
+
+    stats_parser = subparsers.add_parser('stats')
+    stats_parser.add_argument('--url', help='Base URL of the metrics endpoint, DEFAULT_METRICS_PORT here if unset')
+    stats_parser.add_argument('--prometheus', action='store_true', help='Print the raw Prometheus text format')
+    stats_parser.set_defaults(cmd=stats)
+
+    send_audio_parser = subparsers.add_parser('send-audio')
+    send_audio_parser.add_argument('audio', help='WAV file to send, looped')
+    send_audio_parser.add_argument('--host', default='127.0.0.1', help='Address of the receiver')
+    send_audio_parser.add_argument(
+        '--port', type=int, default=None, help='UDP port of the receiver, DEFAULT_PORT if unset'
+    )
+    send_audio_parser.add_argument('--block-size', type=int, default=256, help='Frames per packet')
+    send_audio_parser.add_argument('--loss', type=float, default=0.0, help='Fraction of packets to drop')
+    send_audio_parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random delay per packet in s')
+    send_audio_parser.add_argument('--duration', type=float, default=None, help='Seconds to send for, forever if unset')
+    send_audio_parser.set_defaults(cmd=send_audio)
+
+    benchmark_parser = subparsers.add_parser('benchmark')
+    benchmark_subparsers = benchmark_parser.add_subparsers()
+    for benchmark_name, (benchmark_module, benchmark_help) in BENCHMARKS.items():
+        benchmark_module_parser = benchmark_subparsers.add_parser(benchmark_name, help=benchmark_help)
+        benchmark_module_parser.set_defaults(cmd=_run_benchmark, benchmark_module=benchmark_module)
+        if benchmark_name in sys.argv[1:]:
+            # Only the benchmark being run is imported to register its arguments
+            importlib.import_module(benchmark_module).add_arguments(benchmark_module_parser)
+
     try:
         args = parser.parse_args()
         args.cmd(args)